@@ -0,0 +1,185 @@
+"""Compares the query plans and timings of the dashboard and admin queries,
+with and without the indexes of the `0012_dashboard_indexes` migration.
+
+Runs on a throwaway SQLite database filled with synthetic requests:
+
+    python benchmarks/dashboard_indexes.py --rows 2000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import django
+from django.conf import settings
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+settings.configure(
+    INSTALLED_APPS=[
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "django.contrib.sites",
+        "rest_framework",
+        "djapm.apm.apps.ApmConfig",
+    ],
+    DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": DB_PATH}},
+    USE_TZ=True,
+    APM_TRACK_QUERIES=False,
+)
+django.setup()
+
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Count
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from djapm.apm import models
+from djapm.apm.api.views import _day_start
+
+
+VIEWS = [f"polls.drf.View{i}" for i in range(40)]
+EXCEPTIONS = ["ValueError", "KeyError", "TypeError", "ZeroDivisionError"]
+BATCH_SIZE = 20_000
+
+
+def populate(rows: int, days: int) -> None:
+    now = timezone.now()
+    for offset in range(0, rows, BATCH_SIZE):
+        requests, responses, traces = [], [], []
+        for _ in range(min(BATCH_SIZE, rows - offset)):
+            at = now - timedelta(seconds=random.randrange(days * 86400))
+            req = models.ApiRequest(
+                id=uuid.uuid4(),
+                view_name=random.choice(VIEWS),
+                method="GET",
+                path="/api/polls/",
+                requested_at=at,
+            )
+            requests.append(req)
+            status = random.choices((200, 400, 500), (90, 8, 2))[0]
+            responses.append(
+                models.ApiResponse(
+                    request=req,
+                    status_code=status,
+                    ellapsed_us=random.randrange(1_000_000),
+                    created_at=at,
+                )
+            )
+            if status == 500:
+                traces.append(
+                    models.ErrorTrace(
+                        request=req,
+                        exception_class=random.choice(EXCEPTIONS),
+                        exception_args="",
+                    )
+                )
+        models.ApiRequest.objects.bulk_create(requests)
+        models.ApiResponse.objects.bulk_create(responses)
+        models.ErrorTrace.objects.bulk_create(traces)
+    # Error traces are always created "now", spread them like the requests
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "UPDATE apm_errortrace SET created_at = ("
+            "SELECT requested_at FROM apm_apirequest WHERE id = request_id)"
+        )
+        cursor.execute("ANALYZE")
+
+
+QUERIES = {
+    "requests per day (dashboard)": lambda: (
+        models.ApiRequest.objects.filter(requested_at__gte=_day_start(days_ago=7))
+        .annotate(date=TruncDate("requested_at"))
+        .values("date")
+        .annotate(count=Count("id"), errors=Count("error_trace"))
+        .order_by("date")
+    ),
+    "requests today by view (dashboard)": lambda: (
+        models.ApiRequest.objects.filter(requested_at__gte=_day_start())
+        .values("view_name")
+        .annotate(count=Count("id"))
+        .order_by()
+    ),
+    "errors by exception (dashboard)": lambda: (
+        models.ErrorTrace.objects.filter(
+            created_at__gte=timezone.now() - timedelta(days=7)
+        )
+        .values("exception_class")
+        .annotate(count=Count("request_id"))
+        .order_by()
+    ),
+    "requests of a view (admin)": lambda: (
+        models.ApiRequest.objects.filter(view_name=VIEWS[0]).order_by("-requested_at")[
+            :100
+        ]
+    ),
+    "server errors (admin)": lambda: (
+        models.ApiResponse.objects.filter(status_code=500).order_by("-created_at")[:100]
+    ),
+    "pending errors (admin)": lambda: (
+        models.ErrorTrace.objects.filter(dismissed_at__isnull=True).order_by(
+            "-created_at"
+        )[:100]
+    ),
+}
+
+
+def explain_and_time(repeat: int) -> dict:
+    results = {}
+    for name, build in QUERIES.items():
+        plan = build().explain()
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(build())
+            best = min(best, time.perf_counter() - start)
+        results[name] = (plan, best)
+    return results
+
+
+def index_models():
+    return [
+        m
+        for m in (models.ApiRequest, models.ApiResponse, models.ErrorTrace)
+        if m._meta.indexes
+    ]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    call_command("migrate", verbosity=0)
+    start = time.perf_counter()
+    populate(args.rows, args.days)
+    print(f"Inserted {args.rows} requests in {time.perf_counter() - start:.1f}s\n")
+
+    indexed = explain_and_time(args.repeat)
+    with connection.schema_editor() as editor:
+        for model in index_models():
+            for index in model._meta.indexes:
+                editor.remove_index(model, index)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    unindexed = explain_and_time(args.repeat)
+
+    for name in QUERIES:
+        (plan_without, without), (plan_with, with_) = unindexed[name], indexed[name]
+        print(f"== {name}: {without * 1000:.1f}ms -> {with_ * 1000:.1f}ms")
+        print(f"   without: {' | '.join(plan_without.splitlines())}")
+        print(f"   with:    {' | '.join(plan_with.splitlines())}")
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""Compares the cost of the ellapsed time aggregations of the dashboard, with the
+former `DecimalField(6, 3)` seconds and the integer microseconds of the
+`0015_apiresponse_ellapsed_us` migration.
+
+Runs on a throwaway SQLite database filled with synthetic responses, migrated
+back and forth between both columns:
+
+    python benchmarks/ellapsed_storage.py --rows 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import django
+from django.conf import settings
+
+DB_PATH = os.path.join(tempfile.mkdtemp(), "bench.sqlite3")
+settings.configure(
+    INSTALLED_APPS=[
+        "django.contrib.auth",
+        "django.contrib.contenttypes",
+        "django.contrib.sites",
+        "rest_framework",
+        "djapm.apm.apps.ApmConfig",
+    ],
+    DATABASES={"default": {"ENGINE": "django.db.backends.sqlite3", "NAME": DB_PATH}},
+    USE_TZ=True,
+    APM_TRACK_QUERIES=False,
+)
+django.setup()
+
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Avg, F, Max, Min, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from djapm.apm.api.views import _day_start
+
+
+DECIMAL = [("apm", "0014_rollup_sketch")]
+INTEGER = [("apm", "0015_apiresponse_ellapsed_us")]
+VIEWS = [f"polls.drf.View{i}" for i in range(40)]
+BATCH_SIZE = 20_000
+
+
+def migrate(target):
+    executor = MigrationExecutor(connection)
+    executor.migrate(target)
+    return executor.loader.project_state(target).apps
+
+
+def populate(apps, rows: int, days: int) -> None:
+    ApiRequest = apps.get_model("apm", "ApiRequest")
+    ApiResponse = apps.get_model("apm", "ApiResponse")
+    now = timezone.now()
+    for offset in range(0, rows, BATCH_SIZE):
+        requests, responses = [], []
+        for _ in range(min(BATCH_SIZE, rows - offset)):
+            at = now - timedelta(seconds=random.randrange(days * 86400))
+            req = ApiRequest(
+                id=uuid.uuid4(),
+                view_name=random.choice(VIEWS),
+                method="GET",
+                path="/api/polls/",
+                requested_at=at,
+            )
+            requests.append(req)
+            responses.append(
+                ApiResponse(
+                    request=req,
+                    status_code=200,
+                    ellapsed_us=round(random.lognormvariate(-3, 1.5) * 1_000_000),
+                    created_at=at,
+                )
+            )
+        ApiRequest.objects.bulk_create(requests)
+        ApiResponse.objects.bulk_create(responses)
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+
+
+def queries(apps, field: str, to_seconds):
+    """The aggregations of the dashboard on `field`, converted to float seconds
+    in Python, like the endpoints do before rendering them"""
+    ApiResponse = apps.get_model("apm", "ApiResponse")
+
+    def last_week():
+        return ApiResponse.objects.filter(
+            request__requested_at__gte=_day_start(days_ago=7)
+        )
+
+    def aggregate(key):
+        return [
+            {k: to_seconds(v) if k != "key" else v for k, v in r.items()}
+            for r in last_week()
+            .annotate(key=key)
+            .values("key")
+            .order_by("key")
+            .annotate(avg=Avg(field), max=Max(field), min=Min(field))
+        ]
+
+    return {
+        "avg/max/min by view": lambda: aggregate(F("request__view_name")),
+        "avg/max/min by date": lambda: aggregate(TruncDate("request__requested_at")),
+        "sum by view": lambda: [
+            to_seconds(r["total"])
+            for r in last_week()
+            .values("request__view_name")
+            .order_by()
+            .annotate(total=Sum(field))
+        ],
+        "read every value (sketches)": lambda: [
+            to_seconds(v)
+            for v in last_week()
+            .filter(**{f"{field}__isnull": False})
+            .values_list(field, flat=True)
+            .iterator()
+        ],
+    }
+
+
+def best_times(built, repeat: int) -> dict:
+    results = {}
+    for name, run in built.items():
+        best = float("inf")
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            best = min(best, time.perf_counter() - start)
+        results[name] = best
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--days", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    integer_apps = migrate(INTEGER)
+    start = time.perf_counter()
+    populate(integer_apps, args.rows, args.days)
+    print(f"Inserted {args.rows} responses in {time.perf_counter() - start:.1f}s")
+
+    integer = best_times(
+        queries(integer_apps, "ellapsed_us", lambda v: v / 1_000_000), args.repeat
+    )
+    start = time.perf_counter()
+    decimal_apps = migrate(DECIMAL)
+    print(f"Migrated back to decimals in {time.perf_counter() - start:.1f}s")
+    with connection.cursor() as cursor:
+        cursor.execute("ANALYZE")
+    decimal = best_times(queries(decimal_apps, "ellapsed", float), args.repeat)
+    start = time.perf_counter()
+    migrate(INTEGER)
+    print(f"Migrated to microseconds in {time.perf_counter() - start:.1f}s\n")
+
+    for name in integer:
+        print(
+            f"== {name}: {decimal[name] * 1000:.1f}ms (decimal) "
+            f"-> {integer[name] * 1000:.1f}ms (microseconds)"
+        )
+    os.remove(DB_PATH)
+
+
+if __name__ == "__main__":
+    main()
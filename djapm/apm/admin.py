@@ -1,12 +1,21 @@
-from typing import Any, Dict, Optional
+from datetime import datetime, time, timezone as dt_timezone
+import marshal
+from typing import Any, Dict, List, Optional
 
 from django import forms
+from django.conf import settings
 from django.contrib import admin
+from django.core.exceptions import PermissionDenied
+from django.http import HttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.urls import path, reverse
 from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.utils.html import escape
 from django.utils.safestring import mark_safe
 from django.utils.translation import gettext_lazy as _
 
-from djapm.apm import decorators, filters, models, types
+from djapm.apm import decorators, filters, models, profiling, shards, types
 
 __all__ = (
     "ApmModelAdmin",
@@ -15,6 +24,10 @@ __all__ = (
     "ApiResponseAdmin",
     "RequestLogInline",
     "ErrorTraceAdmin",
+    "StackProfileAdmin",
+    "DroppedRequestCountAdmin",
+    "QueryFingerprintAdmin",
+    "MetricRollupAdmin",
     "NotificationReceiverInline",
     "IntegrationAdmin",
 )
@@ -45,6 +58,46 @@ def display_json(value: Optional[Dict[str, Any]]):
     return mark_safe("<br>".join(output))
 
 
+def display_flamegraph(stacks: str, min_width: float = 0.3):
+    """Renders the collapsed `stacks` as a flamegraph (icicle, root at the top)"""
+    root: Dict[str, Any] = {"value": 0, "children": {}}
+    for line in stacks.splitlines():
+        stack, _, count = line.rpartition(" ")
+        node = root
+        node["value"] += int(count)
+        for name in stack.split(";"):
+            node = node["children"].setdefault(name, {"value": 0, "children": {}})
+            node["value"] += int(count)
+    total = root["value"]
+    if not total:
+        return "-"
+
+    height = 18
+    output = []
+    max_depth = 0
+    pending = [(root["children"], 0, 0)]
+    while pending:
+        children, depth, offset = pending.pop()
+        for name, node in children.items():
+            width = node["value"] / total * 100
+            if width >= min_width:
+                max_depth = max(max_depth, depth)
+                title = escape(f"{name} ({node['value']} samples, {width:.1f}%)")
+                output.append(
+                    f'<div title="{title}" style="position: absolute; overflow: hidden;'
+                    f" white-space: nowrap; font-size: 11px; box-sizing: border-box;"
+                    f" left: {offset:.3f}%; width: {width:.3f}%; top: {depth * height}px;"
+                    f' height: {height}px; background: #f8b26a; border: 1px solid #fff;">'
+                    f"{escape(name)}</div>"
+                )
+                pending.append((node["children"], depth + 1, offset))
+            offset += width
+    return mark_safe(
+        f'<div style="position: relative; width: 100%; min-width: 600px;'
+        f' height: {(max_depth + 1) * height}px;">{"".join(output)}</div>'
+    )
+
+
 class ApmModelAdmin(admin.ModelAdmin):
     """A model admin that keep tracks of POST requests."""
 
@@ -68,6 +121,8 @@ class ApiResponseInline(NoAddNoChangeMixin, admin.TabularInline):
         "request",
         "status_code",
         "ellapsed",
+        "db_query_count",
+        "db_time",
         "created_at",
     )
     extra = 0
@@ -88,6 +143,9 @@ class ApiRequestAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
         "url",
         "user",
         "view_name",
+        "display_waterfall",
+        "display_stack_profile",
+        "display_profile_stats",
     )
     list_filter = ("method", "view_name")
     search_fields = ("id", "user")
@@ -105,6 +163,14 @@ class ApiRequestAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
                 "classes": ("collapse",),
             },
         ),
+        (_("Spans"), {"fields": ("display_waterfall",)}),
+        (
+            _("Profile"),
+            {
+                "fields": ("display_stack_profile", "display_profile_stats"),
+                "classes": ("collapse",),
+            },
+        ),
     )
 
     @admin.display(description=_("URL"))
@@ -121,6 +187,140 @@ class ApiRequestAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
     def display_query_parameters(self, obj: models.ApiRequest):
         return display_json(obj.query_parameters)
 
+    @admin.display(description=_("Waterfall"))
+    def display_waterfall(self, obj: models.ApiRequest):
+        spans = list(obj.spans.all())
+        if not spans:
+            return "-"
+        response = getattr(obj, "response", None)
+        total = max(
+            [s.start + s.duration for s in spans]
+            + [response.ellapsed if response and response.ellapsed else 0]
+        )
+        depths: Dict[int, int] = {}
+        output = []
+        for s in spans:
+            depth = depths[s.index] = (
+                depths.get(s.parent, -1) + 1 if s.parent is not None else 0
+            )
+            left = s.start / total * 100 if total else 0
+            width = max(s.duration / total * 100 if total else 0, 0.2)
+            output.append(
+                '<div style="display: flex; align-items: center;">'
+                + span(
+                    escape(s.name),
+                    style=f"width: 30%; padding-left: {depth * 15}px;",
+                )
+                + '<div style="width: 55%; position: relative; height: 14px;">'
+                + span(
+                    "",
+                    style=f"position: absolute; left: {left:.2f}%; width: {width:.2f}%;"
+                    " height: 100%; background: #79aec8;",
+                )
+                + "</div>"
+                + span(f"{s.duration * 1000:.1f}ms", style="width: 15%; color: grey;")
+                + "</div>"
+            )
+        return mark_safe("".join(output))
+
+    @admin.display(description=_("Flamegraph"))
+    def display_stack_profile(self, obj: models.ApiRequest):
+        profile = getattr(obj, "stack_profile", None)
+        if profile is None:
+            return "-"
+        return display_flamegraph(profile.stacks)
+
+    @admin.display(description=_("cProfile"))
+    def display_profile_stats(self, obj: models.ApiRequest):
+        stats = getattr(obj, "profile_stats", None)
+        if stats is None:
+            return "-"
+        url = reverse("admin:apm_apirequest_profile", args=(obj.pk,))
+        rows = "".join(
+            f"<tr><td>{escape(f['function'])}</td><td>{f['calls']}</td>"
+            f"<td>{f['total_time']:.6f}</td><td>{f['cumulative_time']:.6f}</td></tr>"
+            for f in profiling.top(bytes(stats.data))
+        )
+        return mark_safe(
+            f'<a href="{url}">{_("Download pstats")}</a>'
+            f"<table><thead><tr><th>{_('Function')}</th><th>{_('Calls')}</th>"
+            f"<th>{_('Total time')}</th><th>{_('Cumulative time')}</th></tr></thead>"
+            f"<tbody>{rows}</tbody></table>"
+        )
+
+    def get_urls(self):
+        return [
+            path(
+                "shards/",
+                self.admin_site.admin_view(self.shards_view),
+                name="apm_apirequest_shards",
+            ),
+            path(
+                "<path:object_id>/profile/",
+                self.admin_site.admin_view(self.download_profile_view),
+                name="apm_apirequest_profile",
+            ),
+            *super().get_urls(),
+        ]
+
+    def changelist_view(self, request, extra_context=None):
+        if shards.enabled():
+            extra_context = {
+                "shards_url": reverse("admin:apm_apirequest_shards"),
+                **(extra_context or {}),
+            }
+        return super().changelist_view(request, extra_context)
+
+    def shards_view(self, request):
+        """Lists the newest requests of a day (UTC) on the shards, reading only the
+        shards that hold that day"""
+        day = parse_date(request.GET.get("day") or "") or timezone.now().date()
+        view_name = request.GET.get("view_name") or None
+        since, until = datetime.combine(day, time.min), datetime.combine(day, time.max)
+        if settings.USE_TZ:
+            since = since.replace(tzinfo=dt_timezone.utc)
+            until = until.replace(tzinfo=dt_timezone.utc)
+        requests: List[Any] = []
+        for shard in reversed(shards.overlapping(since, until)):
+            queryset = shard.request.objects.filter(
+                requested_at__gte=since, requested_at__lte=until
+            )
+            if view_name:
+                queryset = queryset.filter(view_name=view_name)
+            limit = self.list_per_page - len(requests)
+            page = list(queryset.order_by("-requested_at")[:limit])
+            # The shard registry has no app configs, so there are no reverse relations
+            responses = shard.response.objects.in_bulk([r.pk for r in page])
+            for req in page:
+                req.response = responses.get(req.pk)
+            requests.extend(page)
+            if len(requests) >= self.list_per_page:
+                break
+        return render(
+            request,
+            "admin/apm/apirequest/shards.html",
+            {
+                **self.admin_site.each_context(request),
+                "opts": self.model._meta,
+                "title": _("Sharded requests"),
+                "day": day,
+                "view_name": view_name or "",
+                "requests": requests,
+            },
+        )
+
+    def download_profile_view(self, request, object_id: str):
+        # Like the profile tokens, the profiles are only for the superusers
+        if not request.user.is_superuser:
+            raise PermissionDenied
+        stats = get_object_or_404(models.ProfileStats, request_id=object_id)
+        response = HttpResponse(
+            marshal.dumps(profiling.load(bytes(stats.data))),
+            content_type="application/octet-stream",
+        )
+        response["Content-Disposition"] = f'attachment; filename="{object_id}.prof"'
+        return response
+
     def get_queryset(self, request):
         return super().get_queryset(request).select_related("response")
 
@@ -134,6 +334,8 @@ class ApiResponseAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
         "requested_by",
         "status_code",
         "ellapsed",
+        "db_query_count",
+        "db_time",
         "created_at",
     )
     ordering = ("-created_at",)
@@ -141,16 +343,63 @@ class ApiResponseAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
         "request",
         "status_code",
         "ellapsed",
+        "db_query_count",
+        "db_time",
+        "display_db_aliases",
+        "display_db_repeated_queries",
+        "memory_peak",
+        "memory_net",
+        "display_memory_top",
         "display_body",
         "created_at",
     )
     search_fields = ("request",)
-    list_filter = ("status_code", filters.EllapsedTimeFilter, "request__view_name")
+    list_filter = (
+        "status_code",
+        filters.EllapsedTimeFilter,
+        filters.RepeatedQueriesFilter,
+        "request__view_name",
+    )
+
+    @admin.display(description=_("Ellapsed"), ordering="ellapsed_us")
+    def ellapsed(self, obj: models.ApiResponse):
+        return obj.ellapsed
+
+    @admin.display(description=_("Database time"), ordering="db_time_us")
+    def db_time(self, obj: models.ApiResponse):
+        return obj.db_time
 
     @admin.display(description=_("Body"))
     def display_body(self, obj: models.ApiResponse):
         return display_json(obj.body)
 
+    @admin.display(description=_("Queries per database"))
+    def display_db_aliases(self, obj: models.ApiResponse):
+        return display_json(obj.db_aliases)
+
+    @admin.display(description=_("Repeated queries"))
+    def display_db_repeated_queries(self, obj: models.ApiResponse):
+        if not obj.db_repeated_queries:
+            return "-"
+        return mark_safe(
+            "<br>".join(
+                span(f"{q['count']}x ", style="color: red;") + escape(q["sql"])
+                for q in obj.db_repeated_queries
+            )
+        )
+
+    @admin.display(description=_("Top allocations"))
+    def display_memory_top(self, obj: models.ApiResponse):
+        if not obj.memory_top:
+            return "-"
+        return mark_safe(
+            "<br>".join(
+                span(f"{a['size'] / 1024:.1f} KiB ", style="color: grey;")
+                + escape(f"{a['site']} ({a['count']} blocks)")
+                for a in obj.memory_top
+            )
+        )
+
     def get_queryset(self, request):
         return super().get_queryset(request).select_related("request", "request__user")
 
@@ -231,6 +480,8 @@ class ErrorTraceAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
 
     @admin.display(description=_("Traceback"))
     def display_traceback(self, obj: models.ErrorTrace):
+        if not obj.traceback:
+            return "-"
         lines = iter(obj.traceback.splitlines())
         offset = 20
         display = []
@@ -255,6 +506,106 @@ class ErrorTraceAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
         self.message_user(request, _("%s Errors dismissed") % updated, "INFO")
 
 
+@admin.register(models.StackProfile)
+class StackProfileAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
+    list_display = ("request_id", "request_view", "samples", "interval", "overhead")
+    readonly_fields = (
+        "request",
+        "samples",
+        "interval",
+        "overhead",
+        "display_flamegraph",
+        "stacks",
+    )
+    search_fields = ("request__id",)
+    list_filter = ("request__view_name",)
+
+    @admin.display(description=_("View Name"))
+    def request_view(self, obj: models.StackProfile):
+        return obj.request.view_name
+
+    @admin.display(description=_("Flamegraph"))
+    def display_flamegraph(self, obj: models.StackProfile):
+        return display_flamegraph(obj.stacks)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related("request")
+
+
+@admin.register(models.DroppedRequestCount)
+class DroppedRequestCountAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
+    list_display = ("bucket", "view_name", "count")
+    ordering = ("-bucket",)
+    list_filter = ("view_name",)
+
+
+@admin.register(models.QueryFingerprint)
+class QueryFingerprintAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
+    list_display = (
+        "view_name",
+        "short_sql",
+        "count",
+        "total_time",
+        "avg_time",
+        "requests",
+        "max_per_request",
+        "last_seen_at",
+    )
+    readonly_fields = (
+        "view_name",
+        "fingerprint",
+        "sql",
+        "count",
+        "total_time",
+        "requests",
+        "max_per_request",
+        "last_seen_at",
+    )
+    ordering = ("-total_time",)
+    list_filter = ("view_name",)
+    search_fields = ("sql",)
+
+    @admin.display(description=_("SQL"))
+    def short_sql(self, obj: models.QueryFingerprint):
+        return obj.sql if len(obj.sql) <= 120 else obj.sql[:117] + "..."
+
+    @admin.display(description=_("Avg time"))
+    def avg_time(self, obj: models.QueryFingerprint):
+        return round(obj.total_time / obj.count, 6) if obj.count else None
+
+
+@admin.register(models.HourRollup)
+@admin.register(models.MinuteRollup)
+class MetricRollupAdmin(NoAddNoChangeMixin, admin.ModelAdmin):
+    list_display = (
+        "bucket",
+        "view_name",
+        "method",
+        "status_class",
+        "count",
+        "errors",
+        "avg_ellapsed",
+        "ellapsed_min",
+        "ellapsed_max",
+    )
+    ordering = ("-bucket",)
+    list_filter = ("view_name", "method", "status_class")
+
+    @admin.display(description=_("Avg ellapsed"))
+    def avg_ellapsed(self, obj: models.MetricRollup):
+        return (
+            round(obj.ellapsed_sum_us / obj.count / 1_000_000, 6) if obj.count else None
+        )
+
+    @admin.display(description=_("Ellapsed min"), ordering="ellapsed_min_us")
+    def ellapsed_min(self, obj: models.MetricRollup):
+        return obj.ellapsed_min_us / 1_000_000
+
+    @admin.display(description=_("Ellapsed max"), ordering="ellapsed_max_us")
+    def ellapsed_max(self, obj: models.MetricRollup):
+        return obj.ellapsed_max_us / 1_000_000
+
+
 class NotificationReceiverInline(admin.TabularInline):
     model = models.NotificationReceiver
     fields = ("integration", "receiver_type", "receiver")
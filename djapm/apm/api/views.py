@@ -1,13 +1,33 @@
-from datetime import timedelta
-from django.db.models import Count, F, Avg, Max, Min
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import (
+    Aggregate,
+    Count,
+    Expression,
+    F,
+    Avg,
+    Max,
+    Min,
+    QuerySet,
+    Sum,
+)
 from django.db.models.functions import Extract, TruncDate
 from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
 from rest_framework.decorators import api_view, permission_classes
+from rest_framework.exceptions import ValidationError
 from rest_framework.permissions import BasePermission
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from djapm.apm import models
+from djapm.apm import dflt_conf, live, models, profiling, rollups, shards
+from djapm.apm.sketch import QUANTILES, LatencySketch
+
+
+# The most queries that `top_queries` lists at once
+TOP_QUERIES_MAX_LIMIT = 100
 
 
 class IsSuperUser(BasePermission):
@@ -15,63 +35,264 @@ class IsSuperUser(BasePermission):
         return bool(request.user and request.user.is_superuser)
 
 
+def _day_start(days_ago: int = 0) -> datetime:
+    """The start of the day, `days_ago` days before today (on the current timezone).
+    Filtering by a range on the column, instead of its `__date`, allows the indexes to be used."""
+    today = timezone.localtime().replace(hour=0, minute=0, second=0, microsecond=0)
+    return today - timedelta(days=days_ago)
+
+
+def _rollup_stats(since: datetime, key: Expression) -> Iterable[Dict[str, Any]]:
+    """Aggregates the hour rollups of the buckets since `since`, grouped by `key`.
+    The rollups include the requests dropped by the sampling."""
+    result = (
+        models.HourRollup.objects.filter(bucket__gte=since)
+        .annotate(key=key)
+        .values("key")
+        .annotate(
+            count=Sum("count"),
+            errors=Sum("errors"),
+            ellapsed_sum=Sum("ellapsed_sum_us"),
+            min_ellapsed=Min("ellapsed_min_us"),
+            max_ellapsed=Max("ellapsed_max_us"),
+        )
+        .order_by("key")
+    )
+    for r in result:
+        for name in ("ellapsed_sum", "min_ellapsed", "max_ellapsed"):
+            r[name] = _seconds(r[name])
+        r["avg_ellapsed"] = r["ellapsed_sum"] / r["count"]
+        yield r
+
+
+def _latency_sketches(key: Expression) -> Dict[str, LatencySketch]:
+    """The merged latency sketches of the hour rollups of the last week, grouped by the key.
+    Without `APM_ROLLUPS` there are no sketches, they're not built from the responses."""
+    sketches: Dict[str, LatencySketch] = {}
+    if not rollups.enabled():
+        return sketches
+    result = (
+        models.HourRollup.objects.filter(
+            bucket__gte=_day_start(days_ago=7), sketch__isnull=False
+        )
+        .annotate(key=key)
+        .values_list("key", "sketch")
+    )
+    for key, data in result:
+        sketch = sketches.setdefault(str(key), LatencySketch())
+        sketch.merge(LatencySketch.from_dict(data))
+    return sketches
+
+
+def _percentiles(sketches: Dict[str, LatencySketch]) -> Dict[str, Dict[str, Any]]:
+    datasets: Dict[str, Dict[str, Any]] = {}
+    for key, sketch in sorted(sketches.items()):
+        for percentile, value in sketch.quantiles(QUANTILES).items():
+            datasets.setdefault(percentile, {})[key] = value
+    return datasets
+
+
+def _responses_since(since: datetime) -> List[QuerySet]:
+    """The responses of the requests made since `since`, on the app table and,
+    with `APM_SHARD_DAYS`, on each of the shards that overlap"""
+    tables = [models.ApiResponse]
+    if shards.enabled():
+        tables.extend(shard.response for shard in shards.overlapping(since))
+    return [model.objects.filter(request__requested_at__gte=since) for model in tables]
+
+
+def _totals_by_view(
+    querysets: Iterable[QuerySet], **aggregates: Aggregate
+) -> Dict[str, Dict[str, Any]]:
+    """Runs the `aggregates` on the responses of each view, merging the results of the
+    `querysets`. Only sums and maxes can be merged, the averages are taken afterwards."""
+    totals: Dict[str, Dict[str, Any]] = {}
+    for queryset in querysets:
+        result = (
+            queryset.annotate(view_name=F("request__view_name"))
+            .values("view_name")
+            .order_by("view_name")
+            .annotate(count=Count("pk"), **aggregates)
+        )
+        for r in result:
+            total = totals.setdefault(r.pop("view_name"), {})
+            for name, value in r.items():
+                current = total.get(name)
+                if current is None:
+                    total[name] = value
+                elif value is not None and isinstance(aggregates.get(name), Max):
+                    total[name] = max(current, value)
+                elif value is not None:
+                    total[name] = current + value
+    return dict(sorted(totals.items()))
+
+
+def _avg(total: Dict[str, Any], name: str) -> Any:
+    return total[name] / total["count"] if total[name] is not None else None
+
+
+def _seconds(microseconds: Optional[float]) -> Optional[float]:
+    """Converts the aggregates of `ApiResponse.ellapsed_us` to seconds"""
+    return microseconds / 1_000_000 if microseconds is not None else None
+
+
+def _int_param(request: Request, name: str, default: int, maximum: int) -> int:
+    """Reads the integer query parameter `name`, clamped between 1 and `maximum`.
+    Raises `ValidationError` (a 400 response) when it's not an integer."""
+    value = request.query_params.get(name)
+    if value is None:
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ValidationError({name: _("A valid integer is required.")})
+    return max(1, min(number, maximum))
+
+
+def _add_dropped(counts: Dict[Any, int], dropped: Iterable[Tuple[Any, int]]):
+    """Adds the requests dropped by the sampling to the `counts`"""
+    for key, count in dropped:
+        counts[key] = counts.get(key, 0) + count
+
+
 @api_view(["GET"])
 @permission_classes([IsSuperUser])
 def req_count_by_date(request: Request):
+    if rollups.enabled():
+        result = list(_rollup_stats(_day_start(days_ago=7), TruncDate("bucket")))
+        return Response(
+            {
+                "requests": {str(r["key"]): r["count"] for r in result},
+                "errors": {str(r["key"]): r["errors"] for r in result},
+            }
+        )
     result = (
         models.ApiRequest.objects.select_related("error_trace")
-        .filter(requested_at__date__gte=timezone.now() - timedelta(days=7))
+        .filter(requested_at__gte=_day_start(days_ago=7))
         .annotate(date=TruncDate("requested_at"))
         .values("date")
         .annotate(count=Count("id"), errors=Count("error_trace"))
         .order_by("date")
         .values("date", "count", "errors")
     )
+    dropped = (
+        models.DroppedRequestCount.objects.filter(bucket__gte=_day_start(days_ago=7))
+        .annotate(date=TruncDate("bucket"))
+        .values("date")
+        .annotate(count=Sum("count"))
+        .values_list("date", "count")
+    )
     datasets = {
         "requests": {str(r["date"]): r["count"] for r in result},
         "errors": {str(r["date"]): r["errors"] for r in result},
     }
+    _add_dropped(datasets["requests"], ((str(d), c) for d, c in dropped))
+    datasets["requests"] = dict(sorted(datasets["requests"].items()))
     return Response(datasets)
 
 
 @api_view(["GET"])
 @permission_classes([IsSuperUser])
 def req_view_name_count_by_date(request: Request):
+    if rollups.enabled():
+        result = list(_rollup_stats(_day_start(), F("view_name")))
+        return Response(
+            {
+                "requests": {r["key"]: r["count"] for r in result},
+                "errors": {r["key"]: r["errors"] for r in result},
+            }
+        )
     result = (
         models.ApiRequest.objects.select_related("error_trace")
-        .filter(requested_at__date__gte=timezone.now())
+        .filter(requested_at__gte=_day_start())
         .values("view_name")
         .annotate(count=Count("id"), errors=Count("error_trace"))
         .order_by("view_name")
         .values("view_name", "count", "errors")
     )
+    dropped = (
+        models.DroppedRequestCount.objects.filter(bucket__gte=_day_start())
+        .values("view_name")
+        .annotate(count=Sum("count"))
+        .values_list("view_name", "count")
+    )
     datasets = {
         "requests": {r["view_name"]: r["count"] for r in result},
         "errors": {r["view_name"]: r["errors"] for r in result},
     }
+    _add_dropped(datasets["requests"], dropped)
     return Response(datasets)
 
 
 @api_view(["GET"])
 @permission_classes([IsSuperUser])
 def response_view_name_ellapsed_time(request: Request):
+    if rollups.enabled():
+        result = list(_rollup_stats(_day_start(days_ago=7), F("view_name")))
+        return Response(
+            {
+                "avg": {r["key"]: r["avg_ellapsed"] for r in result},
+                "max": {r["key"]: r["max_ellapsed"] for r in result},
+                "min": {r["key"]: r["min_ellapsed"] for r in result},
+            }
+        )
     result = (
         models.ApiResponse.objects.select_related("request")
-        .filter(request__requested_at__date__gte=timezone.now() - timedelta(days=7))
+        .filter(request__requested_at__gte=_day_start(days_ago=7))
         .annotate(view_name=F("request__view_name"))
         .values("view_name")
         .order_by("view_name")
         .annotate(
-            avg_ellapsed=Avg("ellapsed"),
-            max_ellapsed=Max("ellapsed"),
-            min_ellapsed=Min("ellapsed"),
+            avg_ellapsed=Avg("ellapsed_us"),
+            max_ellapsed=Max("ellapsed_us"),
+            min_ellapsed=Min("ellapsed_us"),
         )
         .values("view_name", "avg_ellapsed", "max_ellapsed", "min_ellapsed")
     )
     datasets = {
-        "avg": {r["view_name"]: r["avg_ellapsed"] for r in result},
-        "max": {r["view_name"]: r["max_ellapsed"] for r in result},
-        "min": {r["view_name"]: r["min_ellapsed"] for r in result},
+        "avg": {r["view_name"]: _seconds(r["avg_ellapsed"]) for r in result},
+        "max": {r["view_name"]: _seconds(r["max_ellapsed"]) for r in result},
+        "min": {r["view_name"]: _seconds(r["min_ellapsed"]) for r in result},
+    }
+    return Response(datasets)
+
+
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def response_view_name_db_time(request: Request):
+    totals = _totals_by_view(
+        (
+            queryset.filter(db_time_us__isnull=False)
+            for queryset in _responses_since(_day_start(days_ago=7))
+        ),
+        ellapsed_us=Sum("ellapsed_us"),
+        db_time_us=Sum("db_time_us"),
+        db_query_count=Sum("db_query_count"),
+    )
+    datasets = {
+        "total": {v: _seconds(_avg(t, "ellapsed_us")) for v, t in totals.items()},
+        "db": {v: _seconds(_avg(t, "db_time_us")) for v, t in totals.items()},
+        "queries": {v: _avg(t, "db_query_count") for v, t in totals.items()},
+    }
+    return Response(datasets)
+
+
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def response_view_name_memory(request: Request):
+    totals = _totals_by_view(
+        (
+            queryset.filter(memory_peak__isnull=False)
+            for queryset in _responses_since(_day_start(days_ago=7))
+        ),
+        memory_peak=Sum("memory_peak"),
+        max_peak=Max("memory_peak"),
+        memory_net=Sum("memory_net"),
+    )
+    datasets = {
+        "avg_peak": {v: _avg(t, "memory_peak") for v, t in totals.items()},
+        "max_peak": {v: t["max_peak"] for v, t in totals.items()},
+        "avg_net": {v: _avg(t, "memory_net") for v, t in totals.items()},
     }
     return Response(datasets)
 
@@ -79,43 +300,84 @@ def response_view_name_ellapsed_time(request: Request):
 @api_view(["GET"])
 @permission_classes([IsSuperUser])
 def response_ellapsed_time_by_date(request: Request):
+    if rollups.enabled():
+        result = list(_rollup_stats(_day_start(days_ago=7), TruncDate("bucket")))
+        return Response(
+            {
+                "avg": {str(r["key"]): r["avg_ellapsed"] for r in result},
+                "max": {str(r["key"]): r["max_ellapsed"] for r in result},
+                "min": {str(r["key"]): r["min_ellapsed"] for r in result},
+            }
+        )
     result = (
         models.ApiResponse.objects.select_related("request")
-        .filter(request__requested_at__date__gte=timezone.now() - timedelta(days=7))
+        .filter(request__requested_at__gte=_day_start(days_ago=7))
         .annotate(date=TruncDate("request__requested_at"))
         .values("date")
         .order_by("date")
         .annotate(
-            avg_ellapsed=Avg("ellapsed"),
-            max_ellapsed=Max("ellapsed"),
-            min_ellapsed=Min("ellapsed"),
+            avg_ellapsed=Avg("ellapsed_us"),
+            max_ellapsed=Max("ellapsed_us"),
+            min_ellapsed=Min("ellapsed_us"),
         )
         .values("date", "avg_ellapsed", "max_ellapsed", "min_ellapsed")
     )
     datasets = {
-        "avg": {str(r["date"]): r["avg_ellapsed"] for r in result},
-        "max": {str(r["date"]): r["max_ellapsed"] for r in result},
-        "min": {str(r["date"]): r["min_ellapsed"] for r in result},
+        "avg": {str(r["date"]): _seconds(r["avg_ellapsed"]) for r in result},
+        "max": {str(r["date"]): _seconds(r["max_ellapsed"]) for r in result},
+        "min": {str(r["date"]): _seconds(r["min_ellapsed"]) for r in result},
     }
     return Response(datasets)
 
 
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def response_view_name_percentiles(request: Request):
+    sketches = _latency_sketches(F("view_name"))
+    return Response(_percentiles(sketches))
+
+
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def response_percentiles_by_date(request: Request):
+    sketches = _latency_sketches(TruncDate("bucket"))
+    return Response(_percentiles(sketches))
+
+
 @api_view(["GET"])
 @permission_classes([IsSuperUser])
 def requests_count_by_hour(request: Request):
     now = timezone.now()
     yesterday = now - timedelta(hours=23)
-    result = (
-        models.ApiRequest.objects.filter(requested_at__gte=yesterday)
-        .annotate(hour=Extract("requested_at", "hour"))
-        .values("hour")
-        .annotate(count=Count("id"))
-        .values_list("hour", "count")
-    )
+    if rollups.enabled():
+        result = {
+            r["key"]: r["count"]
+            for r in _rollup_stats(
+                yesterday.replace(minute=0, second=0, microsecond=0),
+                Extract("bucket", "hour"),
+            )
+        }
+    else:
+        result = dict(
+            models.ApiRequest.objects.filter(requested_at__gte=yesterday)
+            .annotate(hour=Extract("requested_at", "hour"))
+            .values("hour")
+            .annotate(count=Count("id"))
+            .values_list("hour", "count")
+        )
+        dropped = (
+            models.DroppedRequestCount.objects.filter(
+                bucket__gte=yesterday.replace(minute=0, second=0, microsecond=0)
+            )
+            .annotate(hour=Extract("bucket", "hour"))
+            .values("hour")
+            .annotate(count=Sum("count"))
+            .values_list("hour", "count")
+        )
+        _add_dropped(result, dropped)
     # Format the date as string so chartjs does not sort
     hourfmt = lambda n: f"{str(n).zfill(2)}:00"
     output = {}  # create a new map so results keep the order that was inserted
-    result = dict(result)
     for hour in range(yesterday.hour, 24):
         output[hourfmt(hour)] = result.get(hour, 0)
     for hour in range(0, now.hour + 1):
@@ -136,3 +398,67 @@ def errors_per_exception_class(request: Request):
         .values_list("exception_class", "count")
     )
     return Response(dict(result))
+
+
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def live_view_stats(request: Request):
+    """Reads the live counters shared by all workers, without querying the database"""
+    counters = live.get_counters()
+    minutes = _int_param(
+        request,
+        "minutes",
+        default=5,
+        maximum=getattr(
+            settings, "APM_LIVE_COUNTERS_MINUTES", dflt_conf.APM_LIVE_COUNTERS_MINUTES
+        ),
+    )
+    result = counters.snapshot(minutes) if counters is not None else {}
+    datasets = {
+        "requests": {v: r["count"] for v, r in result.items()},
+        "errors": {v: r["errors"] for v, r in result.items()},
+        "avg": {v: r["avg"] for v, r in result.items()},
+    }
+    return Response(datasets)
+
+
+@api_view(["GET"])
+@permission_classes([IsSuperUser])
+def top_queries(request: Request):
+    """The queries that took the most total time (or ran the most, `?order=count`),
+    optionally of a single view (`?view_name=`)"""
+    order = "-count" if request.query_params.get("order") == "count" else "-total_time"
+    queryset = models.QueryFingerprint.objects.order_by(order)
+    view_name = request.query_params.get("view_name")
+    if view_name:
+        queryset = queryset.filter(view_name=view_name)
+    limit = _int_param(request, "limit", default=10, maximum=TOP_QUERIES_MAX_LIMIT)
+    result = queryset.values(
+        "view_name",
+        "fingerprint",
+        "sql",
+        "count",
+        "total_time",
+        "requests",
+        "max_per_request",
+    )[:limit]
+    return Response(list(result))
+
+
+@api_view(["POST"])
+@permission_classes([IsSuperUser])
+def profile_token(request: Request):
+    """Issues a single use token that marks a request to be profiled with `cProfile`,
+    when sent on the `X-Apm-Profile` header or the `apm_profile` query parameter"""
+    return Response(
+        {
+            "token": profiling.make_token(request.user),
+            "header": profiling.HEADER,
+            "query_parameter": profiling.QUERY_PARAMETER,
+            "expires_in": getattr(
+                settings,
+                "APM_PROFILE_TOKEN_MAX_AGE",
+                dflt_conf.APM_PROFILE_TOKEN_MAX_AGE,
+            ),
+        }
+    )
@@ -1,4 +1,8 @@
+import logging
+
 from django.apps import AppConfig
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
 
 
 class ApmConfig(AppConfig):
@@ -7,10 +11,33 @@ class ApmConfig(AppConfig):
 
     def ready(self) -> None:
         """Injects the Notifier's into the services when ready.
-        Also import the tasks module."""
-        from djapm.apm import tasks
+        Also import the tasks module, install the log handler on the default logger,
+        compile the auto instrumentation rules, and check the shards settings."""
+        from djapm.apm import dflt_conf, instrument, log, rollups, shards, tasks
         from djapm.apm.integrations import base, slack, discord
         from djapm.apm.models import Integration
 
         base.services[Integration.SLACK_PLATFORM] = slack.SlackNotifier
         base.services[Integration.DISCORD_PLATFORM] = discord.DiscordNotifier
+
+        if shards.enabled() and not rollups.enabled():
+            # The dashboard counts the requests on the rollups, not on each shard
+            raise ImproperlyConfigured("APM_SHARD_DAYS requires APM_ROLLUPS = True")
+
+        if instrument.enabled():
+            # Compiles the rules once, failing on startup when they're invalid
+            instrument.get_rules()
+
+        if getattr(settings, "APM_LOG_QUEUE_OUTPUT", dflt_conf.APM_LOG_QUEUE_OUTPUT):
+            log.handler.enable_queue_output(
+                getattr(settings, "APM_LOG_FILE", dflt_conf.APM_LOG_FILE)
+            )
+        log.install_handler(
+            logging.getLogger(
+                getattr(
+                    settings,
+                    "APM_DEFAULT_LOGGER_NAME",
+                    dflt_conf.APM_DEFAULT_LOGGER_NAME,
+                )
+            )
+        )
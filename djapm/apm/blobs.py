@@ -0,0 +1,51 @@
+import hashlib
+import json
+import lzma
+import zlib
+from typing import Any, Callable, Dict, Tuple
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+from djapm.apm import dflt_conf
+
+
+__all__ = ("CODECS", "get_codec", "pack", "unpack")
+
+
+CODECS: Dict[str, Tuple[Callable[[bytes], bytes], Callable[[bytes], bytes]]] = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def get_codec() -> str:
+    codec = getattr(settings, "APM_BLOB_CODEC", dflt_conf.APM_BLOB_CODEC)
+    if codec not in CODECS:
+        raise ValueError(f"Unknown APM_BLOB_CODEC {codec!r}, use one of {set(CODECS)}")
+    return codec
+
+
+def encode(value: Any) -> bytes:
+    """The canonical JSON of `value`, so equal values (e.g. the same headers, in any
+    order) have the same bytes"""
+    return json.dumps(
+        value, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":")
+    ).encode()
+
+
+def pack(value: Any, codec: str) -> Dict[str, Any]:
+    """The fields of the `Blob` of `value`, addressed by the SHA-256 of its JSON"""
+    content = encode(value)
+    compress, _ = CODECS[codec]
+    return {
+        "digest": hashlib.sha256(content).hexdigest(),
+        "codec": codec,
+        "data": compress(content),
+        "size": len(content),
+    }
+
+
+def unpack(codec: str, data: bytes) -> Any:
+    _, decompress = CODECS[codec]
+    return json.loads(decompress(bytes(data)))
@@ -0,0 +1,187 @@
+import json
+import logging
+import os
+import socket
+import threading
+from time import monotonic
+from typing import List, Optional, Tuple, Union
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from djapm.apm import dflt_conf, persistence, registry, spool, tasks
+from djapm.apm.spool import Record
+
+
+__all__ = ("Collector", "enabled", "send")
+
+
+logger = logging.getLogger(__name__)
+
+Address = Union[str, Tuple[str, int]]
+
+# The biggest datagram the collector reads. Bigger records are not sent, so the
+# workers save them some other way instead of losing them truncated
+MAX_MESSAGE_SIZE = 65536
+
+
+def parse_address(address: str) -> Tuple[int, Address]:
+    """Returns the socket family and address of `address`, that's either
+    a unix socket path, or a `host:port` for UDP."""
+    if not address.startswith("/") and ":" in address:
+        host, port = address.rsplit(":", 1)
+        return socket.AF_INET, (host, int(port))
+    return socket.AF_UNIX, address
+
+
+class _Client(threading.local):
+    sock: Optional[socket.socket] = None
+    pid: Optional[int] = None
+
+
+_client = _Client()
+
+
+def enabled() -> bool:
+    return bool(registry.get_settings().collector_address)
+
+
+def send(record: Record, notify: bool = False) -> bool:
+    """Sends the `record` to the collector on `APM_COLLECTOR_ADDRESS`, without blocking.
+    When `notify` is `True`, the collector sends the error trace notifications after saving it.
+    Returns `False` when the collector is not configured, the record is bigger than
+    `MAX_MESSAGE_SIZE`, or the datagram could not be sent."""
+    address = registry.get_settings().collector_address
+    if not address:
+        return False
+
+    family, target = parse_address(address)
+    if _client.sock is None or _client.pid != os.getpid():
+        _client.sock = socket.socket(family, socket.SOCK_DGRAM)
+        _client.sock.setblocking(False)
+        _client.pid = os.getpid()
+
+    message = json.dumps(
+        {"notify": notify, "rows": spool.to_json(record)},
+        cls=spool.ApmJSONEncoder,
+        separators=(",", ":"),
+    ).encode()
+    if len(message) > MAX_MESSAGE_SIZE:
+        logger.warning(
+            "The APM record has %s bytes, more than the collector reads", len(message)
+        )
+        return False
+    try:
+        _client.sock.sendto(message, target)
+    except OSError as e:
+        # Collector down, buffer full or the message is too large
+        logger.warning("Failed to send the APM record to the collector: %s", e)
+        return False
+    return True
+
+
+class Collector:
+    """Receives the records sent by the workers on `address`,
+    and saves them on batches of `batch_size` records, or each `flush_interval` seconds.
+    A single collector may be shared by all the workers on a host."""
+
+    max_message_size = MAX_MESSAGE_SIZE
+
+    def __init__(self, address: str, batch_size: int, flush_interval: float):
+        self.address = address
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending: List[Record] = []
+        self.pending_notifications: List[str] = []
+        self.sock: Optional[socket.socket] = None
+
+    def bind(self) -> None:
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(target):  # type: ignore
+            os.unlink(target)  # type: ignore
+        self.sock = socket.socket(family, socket.SOCK_DGRAM)
+        self.sock.bind(target)
+
+    def close(self) -> None:
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+        family, target = parse_address(self.address)
+        if family == socket.AF_UNIX and os.path.exists(target):  # type: ignore
+            os.unlink(target)  # type: ignore
+
+    def receive(self, timeout: float) -> bool:
+        """Waits up to `timeout` seconds for a message. Returns `True` if one was received."""
+        assert self.sock is not None, "Call bind first"
+        self.sock.settimeout(timeout)
+        try:
+            # One more byte, to tell the truncated messages apart
+            message = self.sock.recv(self.max_message_size + 1)
+        except socket.timeout:
+            return False
+        if len(message) > self.max_message_size:
+            logger.error(
+                "Ignoring an APM message bigger than %s bytes", self.max_message_size
+            )
+            return True
+        try:
+            data = json.loads(message)
+            record = spool.from_json(data["rows"])
+        except Exception:
+            logger.exception("Ignoring an invalid APM message")
+            return True
+        self.pending.append(record)
+        if data.get("notify"):
+            self.pending_notifications.extend(
+                str(fields["request_id"])
+                for model, fields in record
+                if model._meta.object_name == "ErrorTrace"
+            )
+        return True
+
+    def flush(self) -> int:
+        """Saves the pending records, and sends the pending notifications.
+        Returns how many records were saved."""
+        records, self.pending = self.pending, []
+        notifications, self.pending_notifications = self.pending_notifications, []
+        if not records:
+            return 0
+
+        close_old_connections()
+        database_alias = getattr(
+            settings, "APM_USE_DATABASE", dflt_conf.APM_USE_DATABASE
+        )
+        try:
+            with transaction.atomic(using=database_alias):
+                persistence.bulk_save(records)
+        except Exception:
+            file_spool = persistence.get_spool()
+            if file_spool is None:
+                logger.exception("Failed to save %s APM records", len(records))
+                return 0
+            logger.exception(
+                "Failed to save %s APM records, writing them to the spool", len(records)
+            )
+            for record in records:
+                file_spool.write(record)
+            return 0
+
+        for trace_id in notifications:
+            try:
+                tasks.notify_error_trace(trace_id)
+            except Exception:
+                logger.exception("Failed to notify the error trace %s", trace_id)
+        return len(records)
+
+    def serve_forever(self, stop: Optional[threading.Event] = None) -> None:
+        """Receives and saves the records until `stop` is set.
+        The pending records are saved before returning."""
+        deadline = monotonic() + self.flush_interval
+        try:
+            while stop is None or not stop.is_set():
+                self.receive(timeout=max(deadline - monotonic(), 0.01))
+                if len(self.pending) >= self.batch_size or monotonic() >= deadline:
+                    self.flush()
+                    deadline = monotonic() + self.flush_interval
+        finally:
+            self.flush()
@@ -1,8 +1,7 @@
-import uuid
-from typing import Any, Optional, Tuple
+from typing import Any, Optional
 
 from rest_framework.request import Request
-from djapm.apm import types, log
+from djapm.apm import types, ids, log, profiling, registry, sampling, spans
 
 
 __all__ = ("_contribute_to_request",)
@@ -20,21 +19,27 @@ def _contribute_to_request(
     if rest_request is not None:
         data = rest_request.data
         prefix = "drf"
+    elif hasattr(view, "cls"):
+        # A rest_framework view, instrumented by the middleware
+        prefix = "drf"
 
-    app, view_name = _app_view_name_from_view(view)
+    config = registry.get_config(view, prefix, logger_name)
 
-    log._configure_logging(request=request, logger_name=logger_name)
+    log._configure_logging(request=request, config=config)
 
-    request.id = str(uuid.uuid4())
     request._json = data  # type: ignore
-    request.view_name = ".".join((app, prefix, view_name))
-
-
-def _app_view_name_from_view(view: Any) -> Tuple[str, str]:
-    app, *mod = view.__module__.split(".")
-
-    view_name = getattr(view, "__name__", getattr(view.__class__, "__name__", "View"))
-    if hasattr(view, "view_class"):
-        view_name = view.view_class.__name__
-
-    return app, view_name
+    request.view_name = config.view_name
+    request._apm_config = config
+    if hasattr(request, "id"):
+        # Already instrumented by the middleware, the view only refines it
+        if getattr(request, "_apm_cprofile", None) is None:
+            request.apm_sampled = sampling.sample(config.sampling_rate)
+        return
+    request.id = ids.new_request_id()
+    request.apm_sampled = sampling.sample(config.sampling_rate)
+    request.apm = spans.create_context(getattr(request, "started_at", None))
+    profiling.start(request)
+    start_instruments = getattr(request, "_apm_start_instruments", None)
+    if start_instruments is not None:
+        # Set by the `ApmMetricsMiddleware`, that only instruments the tracked requests
+        start_instruments(request)
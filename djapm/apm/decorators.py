@@ -1,3 +1,4 @@
+import asyncio
 from functools import wraps
 from typing import List, Optional
 
@@ -45,7 +46,7 @@ def apm_api_view(allowed_methods: List[str], logger_name: Optional[str] = None):
 
 
 def apm_view(logger_name: Optional[str] = None):
-    """Decorates a `django function-based view`.
+    """Decorates a `django function-based view`, either sync or async (`async def`).
     Upgrades the regular `request` (django.http.HttpRequest) parameter
     with a `PatchedHttpRequest` that contains more attributes (`id`, `logger`).
     Applying this decorator allows the Apm middlewares to register/handle this request.
@@ -57,6 +58,19 @@ def apm_view(logger_name: Optional[str] = None):
     """
 
     def decorator(view: types.ApmView):
+        if asyncio.iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_inner(request: types.PatchedHttpRequest, *args, **kwargs):
+                contrib._contribute_to_request(
+                    request,
+                    view=view,
+                    logger_name=logger_name,
+                )
+                return await view(request, *args, **kwargs)
+
+            return async_inner
+
         @wraps(view)
         def inner(request: types.PatchedHttpRequest, *args, **kwargs):
             contrib._contribute_to_request(
@@ -7,3 +7,69 @@ APM_REQUEST_SAVE_QUERY_STRING = True
 
 APM_NOTIFY_USING_CELERY = False
 APM_NOTIFY_ON_DEBUG_TRUE = False
+
+APM_WRITE_BEHIND = False
+APM_WRITE_BEHIND_QUEUE_SIZE = 10000
+APM_WRITE_BEHIND_BATCH_SIZE = 500
+APM_WRITE_BEHIND_FLUSH_INTERVAL = 1.0
+
+APM_SAMPLING_DEFAULT_RATE = 1.0
+APM_SAMPLING_RATES = {}
+APM_SAMPLING_KEEP_SLOWER_THAN = 1.0
+APM_SAMPLING_COUNTERS_FLUSH_INTERVAL = 60.0
+
+APM_LOG_CAPTURE_LEVEL = "DEBUG"
+APM_LOG_CAPTURE_MAX_RECORDS = 100
+APM_LOG_QUEUE_OUTPUT = False
+APM_LOG_FILE = None
+
+APM_SPOOL_DIR = None
+APM_SPOOL_LATENCY_BUDGET = None
+APM_SPOOL_COOLDOWN = 30.0
+
+APM_COLLECTOR_ADDRESS = None
+APM_COLLECTOR_BATCH_SIZE = 500
+APM_COLLECTOR_FLUSH_INTERVAL = 1.0
+
+APM_LIVE_COUNTERS = False
+APM_LIVE_COUNTERS_NAME = "djapm_live_counters"
+APM_LIVE_COUNTERS_MAX_WORKERS = 16
+APM_LIVE_COUNTERS_MAX_VIEWS = 128
+APM_LIVE_COUNTERS_MINUTES = 15
+
+APM_TRACK_QUERIES = True
+APM_N_PLUS_ONE_THRESHOLD = 5
+APM_QUERY_FINGERPRINTS_FLUSH_INTERVAL = 60.0
+
+APM_MAX_SPANS_PER_REQUEST = 100
+
+APM_PROFILER_THRESHOLD = None
+APM_PROFILER_INTERVAL = 0.005
+APM_PROFILE_TOKEN_MAX_AGE = 3600
+
+APM_MEMORY_SAMPLING_RATE = 0.0
+APM_MEMORY_TOP_ALLOCATIONS = 10
+
+APM_SERVER_TIMING = False
+
+APM_AUTO_INSTRUMENT = False
+APM_AUTO_INSTRUMENT_INCLUDE = []
+APM_AUTO_INSTRUMENT_EXCLUDE = ["namespace:admin"]
+
+APM_REQUEST_ID_VERSION = 4
+
+APM_ROLLUPS = False
+APM_ROLLUPS_FLUSH_INTERVAL = 60.0
+
+APM_RETENTION_DAYS = {
+    "ApiRequest": 30,
+    "ErrorTrace": 90,
+    "RequestLog": 90,
+    "MinuteRollup": 2,
+    "HourRollup": None,
+    "DroppedRequestCount": None,
+}
+
+APM_SHARD_DAYS = None
+
+APM_BLOB_CODEC = "zlib"
@@ -6,6 +6,7 @@ from django.utils.translation import gettext_lazy as _
 class EllapsedTimeFilter(admin.SimpleListFilter):
     title = _("Ellapsed Time")
     parameter_name = "ellapsed"
+    field_name = "ellapsed_us"
 
     def lookups(self, request, model_admin):
         self.available_lookups = (
@@ -28,10 +29,31 @@ class EllapsedTimeFilter(admin.SimpleListFilter):
         ]:
             return queryset
 
+        # The lookups are in seconds, the field in microseconds
         lookup_parts = value.split(":")
         for part in lookup_parts:
             lookup, filter_value = part.split(",")
             queryset = queryset.filter(
-                **{f"{self.parameter_name}__{operators[lookup]}": float(filter_value)}
+                **{
+                    f"{self.field_name}__{operators[lookup]}": round(
+                        float(filter_value) * 1_000_000
+                    )
+                }
             )
         return queryset
+
+
+class RepeatedQueriesFilter(admin.SimpleListFilter):
+    title = _("N+1 queries")
+    parameter_name = "repeated_queries"
+
+    def lookups(self, request, model_admin):
+        return (("yes", _("Yes")), ("no", _("No")))
+
+    def queryset(self, request, queryset: QuerySet):
+        value = self.value()
+        if value == "yes":
+            return queryset.filter(db_repeated_queries__isnull=False)
+        if value == "no":
+            return queryset.filter(db_repeated_queries__isnull=True)
+        return queryset
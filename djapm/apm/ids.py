@@ -0,0 +1,45 @@
+import os
+import threading
+import time
+import uuid
+
+from djapm.apm import registry
+
+
+__all__ = ("new_request_id", "uuid7")
+
+
+_lock = threading.Lock()
+_last_ms = 0
+_counter = 0
+
+
+def uuid7() -> uuid.UUID:
+    """A time-ordered UUID (version 7, RFC 9562): 48 bits of unix time in milliseconds,
+    followed by a 12 bits counter (so ids of the same millisecond are ordered too),
+    and 62 random bits."""
+    global _last_ms, _counter
+    ms = time.time_ns() // 1_000_000
+    with _lock:
+        if ms > _last_ms:
+            _last_ms = ms
+            # Starts at a random point of the lower half, leaving room to increment
+            _counter = int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            # Same millisecond, or the clock went back
+            _counter += 1
+            if _counter > 0xFFF:
+                _last_ms += 1
+                _counter = 0
+            ms = _last_ms
+        counter = _counter
+    random_bits = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    return uuid.UUID(
+        int=(ms << 80) | (0x7 << 76) | (counter << 64) | (0b10 << 62) | random_bits
+    )
+
+
+def new_request_id() -> str:
+    """A new `ApiRequest.id`, a UUID4 or a time-ordered UUID7 (`APM_REQUEST_ID_VERSION`)"""
+    version = registry.get_settings().request_id_version
+    return str(uuid7() if version == 7 else uuid.uuid4())
@@ -0,0 +1,95 @@
+import re
+from typing import Any, Callable, List, Optional, Tuple
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from djapm.apm import dflt_conf, registry, types
+
+
+__all__ = ("compile_rules", "should_instrument")
+
+
+Matcher = Callable[[types.PatchedHttpRequest], bool]
+KINDS = ("name", "namespace", "path")
+
+
+def compile_rules(rules: List[str]) -> List[Matcher]:
+    """Compiles the `kind:value` rules, where kind is one of:
+    - `name`: the url name, e.g. `name:polls-list`;
+    - `namespace`: any of the url namespaces, e.g. `namespace:admin`;
+    - `path`: a regex searched on the request path, e.g. `path:^/api/`."""
+    matchers: List[Matcher] = []
+    for rule in rules:
+        kind, sep, value = rule.partition(":")
+        if not sep or kind not in KINDS:
+            raise ImproperlyConfigured(
+                f"Invalid APM auto instrumentation rule {rule!r}, "
+                f"it must be prefixed by one of {', '.join(f'{k}:' for k in KINDS)}"
+            )
+        if kind == "name":
+            matchers.append(lambda r, v=value: r.resolver_match.url_name == v)
+        elif kind == "namespace":
+            matchers.append(lambda r, v=value: v in r.resolver_match.namespaces)
+        else:
+            try:
+                pattern = re.compile(value)
+            except re.error as e:
+                raise ImproperlyConfigured(
+                    f"Invalid APM auto instrumentation regex {value!r}: {e}"
+                )
+            matchers.append(lambda r, p=pattern: p.search(r.path) is not None)
+    return matchers
+
+
+_rules: Optional[Tuple[List[Matcher], List[Matcher]]] = None
+
+
+def get_rules() -> Tuple[List[Matcher], List[Matcher]]:
+    """The compiled include and exclude rules, compiled once"""
+    global _rules
+    if _rules is None:
+        _rules = (
+            compile_rules(
+                getattr(
+                    settings,
+                    "APM_AUTO_INSTRUMENT_INCLUDE",
+                    dflt_conf.APM_AUTO_INSTRUMENT_INCLUDE,
+                )
+            ),
+            compile_rules(
+                getattr(
+                    settings,
+                    "APM_AUTO_INSTRUMENT_EXCLUDE",
+                    dflt_conf.APM_AUTO_INSTRUMENT_EXCLUDE,
+                )
+            ),
+        )
+    return _rules
+
+
+def enabled() -> bool:
+    return registry.get_settings().auto_instrument
+
+
+def should_instrument(request: types.PatchedHttpRequest, view: Any) -> bool:
+    """Whether the `view` handling the `request` is tracked without a decorator:
+    it matches an include rule (or there are none), and none of the exclude rules.
+    The APM own views are never tracked."""
+    if getattr(view, "__module__", "").startswith("djapm."):
+        return False
+    if request.resolver_match is None:
+        return False
+    include, exclude = get_rules()
+    if include and not any(match(request) for match in include):
+        return False
+    return not any(match(request) for match in exclude)
+
+
+@receiver(setting_changed)
+def _reset_rules(*, setting: str, **kwargs):
+    global _rules
+    if setting.startswith("APM_AUTO_INSTRUMENT_"):
+        _rules = None
@@ -0,0 +1,293 @@
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+import zlib
+from bisect import bisect_left
+from multiprocessing import resource_tracker, shared_memory
+from time import time
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+
+from djapm.apm import dflt_conf, registry
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+
+__all__ = ("LATENCY_BUCKETS", "LiveCounters", "get_counters")
+
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (in seconds) of the latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+
+MAGIC = 0x61706D31  # "apm1"
+HEADER_FIELDS = 6
+NAME_SIZE = 128
+# minute, count, errors, latency sum (microseconds), histogram...
+MINUTE, COUNT, ERRORS, LATENCY_SUM, HISTOGRAM = range(5)
+FIELDS = HISTOGRAM + len(LATENCY_BUCKETS) + 1
+INT_SIZE = 8
+
+
+class LiveCounters:
+    """Per view request counters of the last `minutes` minutes, on a shared memory segment
+    that all the worker processes of a host update.
+
+    Each worker claims its own slot on the segment, and it's the only writer of that slot,
+    so the updates only take a lock local to the process, shared by its threads.
+    Readers sum the slots of all workers.
+    A file lock is only taken to claim a worker slot or a new view, once per process/view.
+    The segment outlives the workers, so the counters survive restarts.
+
+    Layout (64 bits integers): a header, the pids of the workers, the view names,
+    then `workers * views * minutes` buckets of `FIELDS` integers each.
+    """
+
+    def __init__(self, name: str, workers: int, views: int, minutes: int):
+        self.name = name
+        self.workers = workers
+        self.views = views
+        self.minutes = minutes
+        self._names_offset = (HEADER_FIELDS + workers) * INT_SIZE
+        self._data_offset = self._names_offset + views * NAME_SIZE
+        size = self._data_offset + workers * views * minutes * FIELDS * INT_SIZE
+        self._lock_path = os.path.join(tempfile.gettempdir(), f"{name}.lock")
+        self._local_lock = threading.Lock()
+        # The increments are read-modify-writes, that the threads of a worker can't overlap
+        self._slot_lock = threading.Lock()
+        self._view_slots: Dict[str, int] = {}
+        self._worker: Optional[int] = None
+        self._pid: Optional[int] = None
+
+        with self._file_lock():
+            try:
+                self.shm = _open_shared_memory(name, create=True, size=size)
+                self.ints = self.shm.buf.cast("q")
+                for i, value in enumerate(_header(workers, views, minutes)):
+                    self.ints[i] = value
+            except FileExistsError:
+                self.shm = _open_shared_memory(name)
+                self.ints = self.shm.buf.cast("q")
+        if self.ints[:HEADER_FIELDS].tolist() != _header(workers, views, minutes):
+            self.close()
+            raise ValueError(
+                f"The shared memory segment {name!r} has a different layout, "
+                "unlink it or use another APM_LIVE_COUNTERS_NAME"
+            )
+
+    def record(self, view_name: str, ellapsed: float, error: bool) -> None:
+        """Counts a request on `view_name` that took `ellapsed` seconds"""
+        view = self._view_slot(view_name)
+        if view is None:
+            return
+        minute = int(time() // 60)
+        base = self._bucket(self._worker_slot(), view, minute % self.minutes)
+        ints = self.ints
+        with self._slot_lock:
+            if ints[base + MINUTE] != minute:
+                # The bucket holds an older minute, reuse it
+                ints[base : base + FIELDS] = _zeros
+                ints[base + MINUTE] = minute
+            ints[base + COUNT] += 1
+            ints[base + ERRORS] += int(error)
+            ints[base + LATENCY_SUM] += int(ellapsed * 1_000_000)
+            ints[base + HISTOGRAM + bisect_left(LATENCY_BUCKETS, ellapsed)] += 1
+
+    def snapshot(self, last_minutes: int) -> Dict[str, Dict[str, Any]]:
+        """Returns the counters of each view on the `last_minutes` minutes (current included):
+        `count`, `errors`, `avg` (seconds) and `histogram` (counts per `LATENCY_BUCKETS`)."""
+        last_minutes = min(last_minutes, self.minutes)
+        oldest = int(time() // 60) - last_minutes + 1
+        output = {}
+        for view in range(self.views):
+            view_name = self._read_name(view)
+            if not view_name:
+                continue
+            count = errors = latency = 0
+            histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+            for worker in range(self.workers):
+                for slot in range(self.minutes):
+                    base = self._bucket(worker, view, slot)
+                    bucket = self.ints[base : base + FIELDS]
+                    if bucket[MINUTE] < oldest:
+                        continue
+                    count += bucket[COUNT]
+                    errors += bucket[ERRORS]
+                    latency += bucket[LATENCY_SUM]
+                    for i, value in enumerate(bucket[HISTOGRAM:]):
+                        histogram[i] += value
+            if count:
+                output[view_name] = {
+                    "count": count,
+                    "errors": errors,
+                    "avg": latency / count / 1_000_000,
+                    "histogram": histogram,
+                }
+        return output
+
+    def close(self) -> None:
+        self.ints.release()
+        self.shm.close()
+
+    def unlink(self) -> None:
+        """Removes the shared memory segment, the counters are lost"""
+        # `unlink` unregisters it from the resource tracker, undone on `_open_shared_memory`
+        resource_tracker.register(self.shm._name, "shared_memory")  # type: ignore
+        self.shm.unlink()
+
+    def _bucket(self, worker: int, view: int, slot: int) -> int:
+        """The index of the first integer of a bucket"""
+        index = ((worker * self.views + view) * self.minutes + slot) * FIELDS
+        return self._data_offset // INT_SIZE + index
+
+    def _worker_slot(self) -> int:
+        if self._pid == os.getpid():
+            return self._worker  # type: ignore
+        with self._local_lock, self._file_lock():
+            pid = os.getpid()
+            pids = self.ints[HEADER_FIELDS : HEADER_FIELDS + self.workers].tolist()
+            if pid in pids:
+                worker = pids.index(pid)
+            else:
+                # Takes over the slot of a stopped worker, keeping it's counters
+                worker = next(
+                    (i for i, p in enumerate(pids) if not _is_running(p)),
+                    # All slots are taken, share one (updates may be lost)
+                    pid % self.workers,
+                )
+                self.ints[HEADER_FIELDS + worker] = pid
+            self._worker, self._pid = worker, pid
+        return worker
+
+    def _view_slot(self, view_name: str) -> Optional[int]:
+        slot = self._view_slots.get(view_name)
+        if slot is not None:
+            return slot
+        stored = _stored_name(view_name)
+        encoded = stored.encode()
+        start = zlib.crc32(encoded) % self.views
+        with self._local_lock, self._file_lock():
+            for probe in range(self.views):
+                slot = (start + probe) % self.views
+                name = self._read_name(slot)
+                if not name:
+                    offset = self._names_offset + slot * NAME_SIZE
+                    self.shm.buf[offset : offset + len(encoded)] = encoded
+                    name = stored
+                if name == stored:
+                    self._view_slots[view_name] = slot
+                    return slot
+        logger.warning("No live counters slot left for the view %s", view_name)
+        return None
+
+    def _read_name(self, slot: int) -> str:
+        offset = self._names_offset + slot * NAME_SIZE
+        raw = bytes(self.shm.buf[offset : offset + NAME_SIZE])
+        return raw.rstrip(b"\0").decode(errors="ignore")
+
+    def _file_lock(self):
+        return _FileLock(self._lock_path)
+
+
+_zeros = memoryview(bytes(FIELDS * INT_SIZE)).cast("q")
+
+
+class _FileLock:
+    def __init__(self, path: str):
+        self.path = path
+        self.fd: Optional[int] = None
+
+    def __enter__(self):
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(self.fd, fcntl.LOCK_EX)
+
+    def __exit__(self, *args):
+        os.close(self.fd)  # type: ignore
+
+
+def _stored_name(view_name: str) -> str:
+    """The name of the view on the segment, that fits in `NAME_SIZE` bytes.
+    Longer names are cut on a character boundary and end with a hash of the full name,
+    so views that share the beginning of their names keep their own slots."""
+    if len(view_name.encode()) <= NAME_SIZE:
+        return view_name
+    suffix = "~" + hashlib.blake2b(view_name.encode(), digest_size=8).hexdigest()
+    prefix = view_name.encode()[: NAME_SIZE - len(suffix)]
+    return prefix.decode(errors="ignore") + suffix
+
+
+def _header(workers: int, views: int, minutes: int):
+    return [MAGIC, workers, views, minutes, FIELDS, NAME_SIZE]
+
+
+def _is_running(pid: int) -> bool:
+    if pid <= 0:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _open_shared_memory(name: str, create: bool = False, size: int = 0):
+    shm = shared_memory.SharedMemory(name=name, create=create, size=size)
+    # The segment must outlive this process, don't let the resource tracker unlink it
+    resource_tracker.unregister(shm._name, "shared_memory")  # type: ignore
+    return shm
+
+
+_counters: Optional[LiveCounters] = None
+_counters_lock = threading.Lock()
+_failed = False
+
+
+def get_counters() -> Optional[LiveCounters]:
+    """Returns the process-wide `LiveCounters`, or `None` if `APM_LIVE_COUNTERS` is disabled."""
+    global _counters, _failed
+    if _counters is not None or _failed:
+        return _counters
+    if not registry.get_settings().live_counters:
+        return None
+    with _counters_lock:
+        if _counters is None and not _failed:
+            if fcntl is None:
+                logger.error("The APM live counters are not supported on this platform")
+                _failed = True
+                return None
+            try:
+                _counters = LiveCounters(
+                    name=getattr(
+                        settings,
+                        "APM_LIVE_COUNTERS_NAME",
+                        dflt_conf.APM_LIVE_COUNTERS_NAME,
+                    ),
+                    workers=getattr(
+                        settings,
+                        "APM_LIVE_COUNTERS_MAX_WORKERS",
+                        dflt_conf.APM_LIVE_COUNTERS_MAX_WORKERS,
+                    ),
+                    views=getattr(
+                        settings,
+                        "APM_LIVE_COUNTERS_MAX_VIEWS",
+                        dflt_conf.APM_LIVE_COUNTERS_MAX_VIEWS,
+                    ),
+                    minutes=getattr(
+                        settings,
+                        "APM_LIVE_COUNTERS_MINUTES",
+                        dflt_conf.APM_LIVE_COUNTERS_MINUTES,
+                    ),
+                )
+            except (ValueError, OSError):
+                logger.exception("Failed to open the APM live counters")
+                _failed = True
+    return _counters
@@ -1,35 +1,156 @@
+import atexit
+import contextvars
 import logging
-from typing import List, Optional, TYPE_CHECKING
+import os
+import queue
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener
+from typing import Deque, List, Optional, Set, Union, TYPE_CHECKING
 
 from django.conf import settings
 
 from djapm.apm import dflt_conf
 
 
-__all__ = ("ApmStreamHandler", "_configure_logging")
+__all__ = (
+    "ApmStreamHandler",
+    "LogCapture",
+    "QueueOutput",
+    "handler",
+    "install_handler",
+    "_configure_logging",
+    "_release_capture",
+)
 
 
 if TYPE_CHECKING:
+    from djapm.apm.registry import ViewConfig
     from djapm.apm.types import PatchedHttpRequest
 
 
+class LogCapture:
+    """The records logged while handling a single request.
+    Keeps at most `max_records` records, discarding the oldest ones."""
+
+    __slots__ = ("records", "level")
+
+    def __init__(self, max_records: int, level: int):
+        self.records: Deque[logging.LogRecord] = deque(maxlen=max_records)
+        self.level = level
+
+
+_capture: "contextvars.ContextVar[Optional[LogCapture]]" = contextvars.ContextVar(
+    "djapm_log_capture", default=None
+)
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """A `QueueHandler` that enqueues the records as they are,
+    so the formatting (and `LogRecord.getMessage`) happens on the listener thread."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+
+class QueueOutput:
+    """Writes the records to the stream (and to `file_path`, if any) from a
+    `QueueListener` thread, so the request thread never blocks on the I/O.
+    The listener is (re)started lazily on each process, so it survives forks."""
+
+    def __init__(self, stream_handler: logging.StreamHandler, file_path: Optional[str]):
+        self.stream_handler = stream_handler
+        self.file_path = file_path
+        self.listener: Optional[QueueListener] = None
+        self._queue_handler: Optional[QueueHandler] = None
+        self._pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        if self._pid != os.getpid():
+            self.start()
+        self._queue_handler.emit(record)  # type: ignore
+
+    def start(self) -> None:
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            log_queue: "queue.SimpleQueue[logging.LogRecord]" = queue.SimpleQueue()
+            handlers: List[logging.Handler] = [
+                logging.StreamHandler(self.stream_handler.stream)
+            ]
+            if self.file_path:
+                handlers.append(logging.FileHandler(self.file_path))
+            for output in handlers:
+                output.setFormatter(self.stream_handler.formatter)
+            self._queue_handler = _DeferredQueueHandler(log_queue)
+            self.listener = QueueListener(log_queue, *handlers)
+            self.listener.start()
+            self._pid = os.getpid()
+
+    def stop(self) -> None:
+        """Stops the listener, writing all the queued records."""
+        with self._lock:
+            if self.listener is not None and self._pid == os.getpid():
+                self.listener.stop()
+            self.listener = None
+            self._pid = None
+
+
 class ApmStreamHandler(logging.StreamHandler):
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-        self.records: List[logging.LogRecord] = []
+    """Writes the records to the stream, and captures them on the `LogCapture`
+    of the request being handled on the current context, if any.
+    A single instance (`handler`) is installed once on each logger used by the APM views.
+    When a `queue_output` is set, the records are written by it instead of the request thread."""
+
+    queue_output: Optional[QueueOutput] = None
 
     def emit(self, record: logging.LogRecord) -> None:
-        self.records.append(record)
-        super().emit(record)
+        capture = _capture.get()
+        if capture is not None and record.levelno >= capture.level:
+            capture.records.append(record)
+        if self.queue_output is not None:
+            self.queue_output.emit(record)
+        else:
+            super().emit(record)
+
+    def enable_queue_output(self, file_path: Optional[str] = None) -> None:
+        """Moves the writing of the records to a `QueueListener` thread"""
+        if self.queue_output is None:
+            self.queue_output = QueueOutput(self, file_path)
+            atexit.register(self.queue_output.stop)
+
+
+handler = ApmStreamHandler()
+_installed: Set[str] = set()
+_install_lock = threading.Lock()
 
 
-def _configure_logging(request: "PatchedHttpRequest", logger_name: Optional[str]):
-    default_logger = getattr(
-        settings, "APM_DEFAULT_LOGGER_NAME", dflt_conf.APM_DEFAULT_LOGGER_NAME
+def install_handler(logger: logging.Logger) -> None:
+    """Installs the `handler` on the `logger`, if not yet installed."""
+    if logger.name in _installed:
+        return
+    with _install_lock:
+        if logger.name in _installed:
+            return
+        logger.addHandler(handler)
+        _installed.add(logger.name)
+
+
+def _get_level(level: Union[int, str]) -> int:
+    if isinstance(level, int):
+        return level
+    return logging.getLevelName(level.upper())
+
+
+def _configure_logging(request: "PatchedHttpRequest", config: "ViewConfig"):
+    request.logger = config.logger
+    request._log_capture = LogCapture(
+        max_records=config.capture_max_records, level=config.capture_level
     )
-    request.logger = logging.getLogger(logger_name or default_logger)
-    request._log_handler = ApmStreamHandler()
-    for handler in request.logger.handlers.copy():
-        if isinstance(handler, ApmStreamHandler):
-            request.logger.removeHandler(handler)
-    request.logger.addHandler(request._log_handler)
+    _capture.set(request._log_capture)
+
+
+def _release_capture() -> None:
+    """Stops capturing records on the current context"""
+    _capture.set(None)
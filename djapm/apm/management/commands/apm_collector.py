@@ -0,0 +1,64 @@
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from djapm.apm import dflt_conf
+from djapm.apm.collector import Collector
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the APM collector: receives the records sent by the middlewares "
+        "on APM_COLLECTOR_ADDRESS and saves them in batches."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--address",
+            help=(
+                "A unix socket path, or host:port for UDP. "
+                "Defaults to the APM_COLLECTOR_ADDRESS setting."
+            ),
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=getattr(
+                settings,
+                "APM_COLLECTOR_BATCH_SIZE",
+                dflt_conf.APM_COLLECTOR_BATCH_SIZE,
+            ),
+            help="How many records are saved on each batch.",
+        )
+        parser.add_argument(
+            "--flush-interval",
+            type=float,
+            default=getattr(
+                settings,
+                "APM_COLLECTOR_FLUSH_INTERVAL",
+                dflt_conf.APM_COLLECTOR_FLUSH_INTERVAL,
+            ),
+            help="How many seconds to wait for a batch to be filled before saving it.",
+        )
+
+    def handle(self, *args, address=None, batch_size, flush_interval, **options):
+        address = address or getattr(
+            settings, "APM_COLLECTOR_ADDRESS", dflt_conf.APM_COLLECTOR_ADDRESS
+        )
+        if not address:
+            raise CommandError("Set the APM_COLLECTOR_ADDRESS setting or use --address")
+
+        collector = Collector(address, batch_size, flush_interval)
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *args: stop.set())
+        signal.signal(signal.SIGINT, lambda *args: stop.set())
+
+        collector.bind()
+        self.stdout.write(f"APM collector listening on {address}")
+        try:
+            collector.serve_forever(stop)
+        finally:
+            collector.close()
+        self.stdout.write("APM collector stopped")
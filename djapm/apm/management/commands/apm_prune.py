@@ -0,0 +1,241 @@
+from collections import Counter
+from datetime import datetime, timedelta
+import time
+from typing import Callable, Dict, List, Tuple, Type
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, models as db_models, transaction
+from django.db.models import Exists, Min, OuterRef
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, models, persistence, rollups, shards
+
+
+# The rows deleted along with each request, and the lookup to it
+CASCADES: List[Tuple[Type[db_models.Model], str]] = [
+    (models.ApiResponse, "request"),
+    (models.ErrorTrace, "request"),
+    (models.RequestLog, "trace__request"),
+    (models.Span, "request"),
+    (models.StackProfile, "request"),
+    (models.ProfileStats, "request"),
+]
+
+# The expired rows of each retention window, the requests are deleted with their cascades.
+# The requests with an error trace follow the `ErrorTrace` window.
+WINDOWS: Dict[str, Tuple[Callable[[datetime], db_models.QuerySet], str]] = {
+    "ApiRequest": (
+        lambda cutoff: models.ApiRequest.objects.filter(
+            requested_at__lt=cutoff, error_trace__isnull=True
+        ),
+        "requested_at",
+    ),
+    "ErrorTrace": (
+        lambda cutoff: models.ApiRequest.objects.filter(
+            error_trace__created_at__lt=cutoff
+        ),
+        "requested_at",
+    ),
+    "RequestLog": (
+        lambda cutoff: models.RequestLog.objects.filter(timestamp__lt=cutoff),
+        "pk",
+    ),
+    "MinuteRollup": (
+        lambda cutoff: models.MinuteRollup.objects.filter(bucket__lt=cutoff),
+        "pk",
+    ),
+    "HourRollup": (
+        lambda cutoff: models.HourRollup.objects.filter(bucket__lt=cutoff),
+        "pk",
+    ),
+    "DroppedRequestCount": (
+        lambda cutoff: models.DroppedRequestCount.objects.filter(bucket__lt=cutoff),
+        "pk",
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes the APM rows older than their APM_RETENTION_DAYS window, in small "
+        "chunks so the tables are never locked for long. The expired requests are "
+        "folded into the hour rollups before being deleted."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only reports how many rows would be deleted, and their estimated size.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="How many rows are deleted on each transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0.1,
+            help="How many seconds to wait between the chunks.",
+        )
+
+    def handle(self, *args, dry_run=False, chunk_size=1000, sleep=0.1, **options):
+        retention = getattr(
+            settings, "APM_RETENTION_DAYS", dflt_conf.APM_RETENTION_DAYS
+        )
+        unknown = set(retention) - set(WINDOWS)
+        if unknown:
+            raise CommandError(
+                f"Unknown APM_RETENTION_DAYS models: {', '.join(sorted(unknown))}"
+            )
+        if chunk_size < 1:
+            raise CommandError("--chunk-size must be at least 1")
+
+        now = timezone.now()
+        # Whole hours, so the folded rollups hold every request of their hour
+        cutoffs = {
+            name: rollups.truncate(now - timedelta(days=days), models.HourRollup)
+            for name, days in retention.items()
+            if days is not None
+        }
+        if not dry_run:
+            self._fold(cutoffs)
+        total = 0
+        for name, (expired, order_by) in WINDOWS.items():
+            if name not in cutoffs:
+                continue
+            queryset = expired(cutoffs[name])
+            if dry_run:
+                total += self._report(name, queryset)
+                continue
+            deleted = _delete_in_chunks(queryset, order_by, chunk_size, sleep)
+            for label, count in sorted(deleted.items()):
+                self.stdout.write(f"{name}: deleted {count} {label} rows")
+            total += sum(deleted.values())
+
+        # Recent blobs may belong to rows that are still being written
+        orphans = _orphan_blobs().filter(created_at__lt=now - timedelta(hours=1))
+        if dry_run:
+            total += self._report("Blob", orphans)
+        else:
+            deleted = _delete_in_chunks(orphans, "pk", chunk_size, sleep)
+            for label, count in sorted(deleted.items()):
+                self.stdout.write(f"Blob: deleted {count} unreferenced {label} rows")
+            total += sum(deleted.values())
+
+        verb = "Would delete" if dry_run else "Deleted"
+        self.stdout.write(self.style.SUCCESS(f"{verb} {total} rows"))
+
+    def _fold(self, cutoffs: Dict[str, datetime]) -> None:
+        """Folds the requests of all the windows at once, before any is deleted: from the
+        hour of the oldest expired request until the latest cutoff, so every hour that loses
+        a request is folded while all its requests are still stored"""
+        windows = [
+            (queryset, cutoff)
+            for queryset, cutoff in (
+                (WINDOWS[name][0](cutoff), cutoff) for name, cutoff in cutoffs.items()
+            )
+            if queryset.model is models.ApiRequest
+        ]
+        oldest = [
+            at
+            for at in (
+                queryset.aggregate(oldest=Min("requested_at"))["oldest"]
+                for queryset, _ in windows
+            )
+            if at is not None
+        ]
+        if not oldest:
+            return
+        folded = rollups.fold(max(cutoff for _, cutoff in windows), since=min(oldest))
+        self.stdout.write(f"Folded the requests into {folded} hour rollups")
+
+    def _report(self, name: str, queryset: db_models.QuerySet) -> int:
+        counts = {queryset.model: queryset.count()}
+        if queryset.model is models.ApiRequest:
+            for model, lookup in CASCADES:
+                counts[model] = model.objects.filter(
+                    **{f"{lookup}__in": queryset.values("pk")}
+                ).count()
+        for model, count in counts.items():
+            size = count * _row_bytes(model) / 1024**2
+            self.stdout.write(f"{name}: {count} {model.__name__} rows, ~{size:.1f} MiB")
+        return sum(counts.values())
+
+
+def _orphan_blobs() -> db_models.QuerySet:
+    """The blobs that no row references, on the app tables nor on the shards"""
+    references = [
+        (model, attname)
+        for model, names in persistence.BLOB_FIELDS.items()
+        for attname in names.values()
+    ]
+    if shards.enabled():
+        for shard in shards.existing(refresh=True):
+            references.extend(
+                (sharded, attname)
+                for model, sharded in zip(
+                    (models.ApiRequest, models.ApiResponse), shard.tables
+                )
+                for attname in persistence.BLOB_FIELDS[model].values()
+            )
+    queryset = models.Blob.objects.all()
+    for model, attname in references:
+        queryset = queryset.filter(
+            ~Exists(model.objects.filter(**{attname: OuterRef("pk")}))
+        )
+    return queryset
+
+
+def _delete_in_chunks(
+    queryset: db_models.QuerySet, order_by: str, chunk_size: int, pause: float
+) -> "Counter[str]":
+    """Deletes the rows of `queryset`, oldest first, `chunk_size` at a time.
+    Returns how many rows of each model were deleted, including the cascades."""
+    deleted: "Counter[str]" = Counter()
+    while True:
+        pks = list(
+            queryset.order_by(order_by).values_list("pk", flat=True)[:chunk_size]
+        )
+        if not pks:
+            return deleted
+        with transaction.atomic(using=queryset.db):
+            # Filtered again, the rows may no longer match (e.g. a reused blob)
+            _, per_model = queryset.filter(pk__in=pks).delete()
+        deleted.update({label.split(".")[-1]: n for label, n in per_model.items()})
+        if len(pks) < chunk_size:
+            return deleted
+        time.sleep(pause)
+
+
+def _row_bytes(model: Type[db_models.Model]) -> float:
+    """The average size of a row of `model`, from the table statistics on PostgreSQL and
+    MySQL (including its indexes), otherwise estimated from a sample of the rows."""
+    connection = connections[model.objects.db]
+    table = model._meta.db_table
+    row = None
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            cursor.execute(
+                "SELECT pg_total_relation_size(oid), reltuples FROM pg_class "
+                "WHERE oid = %s::regclass",
+                [table],
+            )
+            row = cursor.fetchone()
+        elif connection.vendor == "mysql":
+            cursor.execute(
+                "SELECT data_length + index_length, table_rows "
+                "FROM information_schema.tables "
+                "WHERE table_schema = DATABASE() AND table_name = %s",
+                [table],
+            )
+            row = cursor.fetchone()
+    if row and row[1] and row[1] > 0:
+        return row[0] / row[1]
+    sample = list(model.objects.values_list()[:100])
+    if not sample:
+        return 0.0
+    return sum(len(str(value).encode()) for r in sample for value in r) / len(sample)
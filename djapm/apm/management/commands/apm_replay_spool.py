@@ -0,0 +1,103 @@
+import os
+from pathlib import Path
+from typing import Iterable, List, Set
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from djapm.apm import dflt_conf, models, persistence, spool
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+
+REPLAYING_SUFFIX = ".replaying"
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads the APM records written to the spool files into the database, "
+        "deleting the files afterwards. Records that were already loaded are ignored."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--directory",
+            help="The spool directory. Defaults to the APM_SPOOL_DIR setting.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="How many records are loaded on each transaction.",
+        )
+
+    def handle(self, *args, directory=None, batch_size=500, **options):
+        directory = directory or getattr(
+            settings, "APM_SPOOL_DIR", dflt_conf.APM_SPOOL_DIR
+        )
+        if not directory:
+            raise CommandError("Set the APM_SPOOL_DIR setting or use --directory")
+
+        root = Path(directory)
+        # Files left by an interrupted replay are loaded again, it's idempotent
+        paths = sorted(root.glob(f"*{spool.SUFFIX}{REPLAYING_SUFFIX}"))
+        for path in sorted(root.glob(f"*{spool.SUFFIX}")):
+            taken = path.with_name(path.name + REPLAYING_SUFFIX)
+            os.rename(path, taken)
+            paths.append(taken)
+
+        total = 0
+        for path in paths:
+            count = self._replay_file(path, batch_size)
+            total += count
+            self.stdout.write(f"Loaded {count} records from {path.name}")
+        self.stdout.write(self.style.SUCCESS(f"Loaded {total} records"))
+
+    def _replay_file(self, path: Path, batch_size: int) -> int:
+        with open(path, "rb") as file:
+            if fcntl is not None:
+                # Waits for a worker that may be still writing to it
+                fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            records = list(spool.read(path))
+            for start in range(0, len(records), batch_size):
+                _replay(records[start : start + batch_size])
+            path.unlink()
+        return len(records)
+
+
+def _replay(records: List[spool.Record]) -> None:
+    """Saves the `records`. The logs of error traces that already exist are skipped,
+    since `RequestLog` rows have no natural key to detect the duplicates."""
+    trace_ids = {
+        fields["request_id"]
+        for record in records
+        for model, fields in record
+        if model is models.ErrorTrace
+    }
+    skip: Set[str] = set(
+        models.ErrorTrace.objects.filter(pk__in=trace_ids).values_list("pk", flat=True)
+    )
+    deduplicated: List[spool.Record] = []
+    for record in records:
+        deduplicated.append(
+            [
+                (model, fields)
+                for model, fields in record
+                if not (model is models.RequestLog and fields["trace_id"] in skip)
+            ]
+        )
+        skip.update(_trace_ids(record))
+
+    database_alias = getattr(settings, "APM_USE_DATABASE", dflt_conf.APM_USE_DATABASE)
+    with transaction.atomic(using=database_alias):
+        persistence.bulk_save(deduplicated)
+
+
+def _trace_ids(record: spool.Record) -> Iterable[str]:
+    return (
+        fields["request_id"] for model, fields in record if model is models.ErrorTrace
+    )
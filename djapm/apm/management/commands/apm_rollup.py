@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djapm.apm import rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Recomputes the minute and hour rollups of the last days from the stored "
+        "requests, e.g. to fill them in after enabling APM_ROLLUPS. The current hour "
+        "is left to the workers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=7,
+            help="How many days are recomputed, the dashboard shows the last 7.",
+        )
+
+    def handle(self, *args, days=7, **options):
+        if days < 1:
+            raise CommandError("--days must be at least 1")
+        total = rollups.rebuild(since=timezone.now() - timedelta(days=days))
+        self.stdout.write(self.style.SUCCESS(f"Aggregated {total} requests"))
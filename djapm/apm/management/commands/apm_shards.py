@@ -0,0 +1,71 @@
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, rollups, shards
+
+
+class Command(BaseCommand):
+    help = (
+        "Creates the APM_SHARD_DAYS request shards of the next days, and drops the ones "
+        "past the ApiRequest APM_RETENTION_DAYS window, after folding their requests "
+        "into the hour rollups. Run it daily."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--ahead",
+            type=int,
+            default=7,
+            help="For how many days ahead the shards are created.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only reports the shards that would be created and dropped.",
+        )
+
+    def handle(self, *args, ahead=7, dry_run=False, **options):
+        if not shards.enabled():
+            raise CommandError("Set the APM_SHARD_DAYS setting to use the shards")
+
+        existing = {shard.start: shard for shard in shards.existing(refresh=True)}
+        today = timezone.now().astimezone(dt_timezone.utc).date()
+        created = 0
+        for days in range(ahead + 1):
+            shard = shards.get_shard(today + timedelta(days=days))
+            if shard.start in existing:
+                continue
+            existing[shard.start] = shard
+            created += 1
+            if not dry_run:
+                shard.create()
+            verb = "Would create" if dry_run else "Created"
+            self.stdout.write(f"{verb} the shard {shard.suffix}")
+
+        retention = getattr(
+            settings, "APM_RETENTION_DAYS", dflt_conf.APM_RETENTION_DAYS
+        ).get("ApiRequest")
+        expired = []
+        if retention is not None:
+            cutoff = today - timedelta(days=retention)
+            expired = [s for s in existing.values() if s.end <= cutoff]
+        if expired and not dry_run:
+            last = max(s.end for s in expired)
+            until = datetime.combine(last, time.min)
+            if settings.USE_TZ:
+                until = until.replace(tzinfo=dt_timezone.utc)
+            folded = rollups.fold(until)
+            self.stdout.write(f"Folded the requests into {folded} hour rollups")
+        for shard in sorted(expired, key=lambda s: s.start):
+            count = shard.request.objects.count()
+            if not dry_run:
+                shard.drop()
+            verb = "Would drop" if dry_run else "Dropped"
+            self.stdout.write(f"{verb} the shard {shard.suffix}, with {count} requests")
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{created} shards created, {len(expired)} dropped")
+        )
@@ -0,0 +1,77 @@
+import random
+import threading
+import tracemalloc
+from typing import Any, Dict, List, Optional
+
+from djapm.apm import registry
+
+
+__all__ = ("MemoryTrace", "start")
+
+
+# tracemalloc is process-wide, so a single request is traced at a time
+_lock = threading.Lock()
+_filters = (
+    tracemalloc.Filter(False, tracemalloc.__file__),
+    tracemalloc.Filter(False, __file__),
+)
+
+
+class MemoryTrace:
+    """The memory allocated between `start` and `stop`, using `tracemalloc`.
+    The tracing is process-wide: on threaded workers, the allocations of the other
+    threads in the meantime are included, so the figures are approximate."""
+
+    __slots__ = ("started_tracing", "snapshot", "current", "fields")
+
+    def __init__(self):
+        self.started_tracing = not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.snapshot = tracemalloc.take_snapshot().filter_traces(_filters)
+        self.current, _ = tracemalloc.get_traced_memory()
+        self.fields: Dict[str, Any] = {}
+
+    def stop(self) -> None:
+        try:
+            current, peak = tracemalloc.get_traced_memory()
+            snapshot = tracemalloc.take_snapshot().filter_traces(_filters)
+            limit = registry.get_settings().memory_top_allocations
+            self.fields = {
+                "memory_peak": max(peak - self.current, 0),
+                "memory_net": current - self.current,
+                "memory_top": _top(snapshot.compare_to(self.snapshot, "lineno"), limit),
+            }
+        finally:
+            self.snapshot = None
+            if self.started_tracing:
+                tracemalloc.stop()
+            _lock.release()
+
+
+def _top(differences: List[tracemalloc.StatisticDiff], limit: int):
+    return [
+        {
+            "site": f"{d.traceback[0].filename}:{d.traceback[0].lineno}",
+            "size": d.size_diff,
+            "count": d.count_diff,
+        }
+        for d in differences[:limit]
+        if d.size_diff > 0
+    ]
+
+
+def start() -> Optional[MemoryTrace]:
+    """Traces the memory of the current request, for a `APM_MEMORY_SAMPLING_RATE` fraction
+    of the requests, unless another one is being traced."""
+    rate = registry.get_settings().memory_sampling_rate
+    if not rate or random.random() >= rate:
+        return None
+    if not _lock.acquire(blocking=False):
+        return None
+    try:
+        return MemoryTrace()
+    except Exception:
+        _lock.release()
+        raise
@@ -1,43 +1,66 @@
 from datetime import datetime
 import logging
+import re
 from time import perf_counter
 import traceback
+from typing import Any, Dict, Optional
 import warnings
 
-from django.conf import settings
+from asgiref.sync import sync_to_async
 from django.http import HttpRequest
 from django.utils import timezone
 from rest_framework.response import Response
 
-from djapm.apm import types, models, dflt_conf, tasks
+from djapm.apm import (
+    collector,
+    contrib,
+    instrument,
+    types,
+    live,
+    log,
+    memory,
+    models,
+    persistence,
+    profiler,
+    profiling,
+    queries,
+    registry,
+    rollups,
+    sampling,
+    tasks,
+    writer,
+)
+from djapm.apm.spool import Record, Row
+
+try:
+    from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+except ImportError:  # asgiref<3.6
+    import asyncio
+
+    iscoroutinefunction = asyncio.iscoroutinefunction
+
+    def markcoroutinefunction(func):
+        func._is_coroutine = asyncio.coroutines._is_coroutine  # type: ignore
+        return func
 
 
 __all__ = (
+    "ApmMiddleware",
     "ApmMetricsMiddleware",
     "ErrorTraceMiddleware",
 )
 
 
 def api_request_defaults(req: types.PatchedHttpRequest):
-    save_headers = getattr(
-        settings,
-        "APM_REQUEST_SAVE_HEADERS",
-        dflt_conf.APM_REQUEST_SAVE_HEADERS,
-    )
-    save_qp = getattr(
-        settings,
-        "APM_REQUEST_SAVE_QUERY_PARAMETERS",
-        dflt_conf.APM_REQUEST_SAVE_QUERY_PARAMETERS,
-    )
-    save_qs = getattr(
-        settings,
-        "APM_REQUEST_SAVE_QUERY_STRING",
-        dflt_conf.APM_REQUEST_SAVE_QUERY_STRING,
-    )
+    config = req._apm_config
     return {
-        "headers": dict(req.headers) if save_headers else None,
-        "query_parameters": req.GET if save_qp else None,
-        "query_string": req.META.get("QUERY_STRING") if save_qs else None,
+        "headers": dict(req.headers) if config.save_headers else None,
+        "query_parameters": profiling.query_parameters(req)
+        if config.save_query_parameters
+        else None,
+        "query_string": profiling.query_string(req)
+        if config.save_query_string
+        else None,
         "view_name": req.view_name,
         "method": req.method,
         "path": req.path,
@@ -45,121 +68,327 @@ def api_request_defaults(req: types.PatchedHttpRequest):
     }
 
 
+def api_request_row(req: types.PatchedHttpRequest) -> Row:
+    return (
+        models.ApiRequest,
+        {"id": req.id, "requested_at": timezone.now(), **api_request_defaults(req)},
+    )
+
+
 def api_response_defaults(res: Response, ellapsed: float):
     return {
         "status_code": res.status_code,
-        "ellapsed": ellapsed,
+        "ellapsed_us": round(ellapsed * 1_000_000),
         "body": getattr(res, "data", None) if res.status_code >= 400 else None,
     }
 
 
-class ApmMetricsMiddleware:
-    """A middleware that will register a Request/Response associated data"""
+def _query_fields(req: types.PatchedHttpRequest) -> Dict[str, Any]:
+    stats = getattr(req, "_apm_queries", None)
+    return stats.as_fields() if stats is not None else {}
+
+
+def _memory_fields(req: types.PatchedHttpRequest) -> Dict[str, Any]:
+    trace = getattr(req, "_apm_memory", None)
+    return trace.fields if trace is not None else {}
+
+
+def server_timing(req: types.PatchedHttpRequest, ellapsed: float) -> str:
+    """The `Server-Timing` header value: the total and database times, and the spans"""
+    metrics = [f"total;dur={ellapsed * 1000:.2f}"]
+    stats = getattr(req, "_apm_queries", None)
+    if stats is not None:
+        metrics.append(f"db;dur={stats.time * 1000:.2f}")
+    context = getattr(req, "apm", None)
+    if context is not None:
+        for index, (name, _, start, end) in enumerate(context.spans):
+            desc = _SERVER_TIMING_DESC.sub("_", name)
+            metrics.append(f'span{index};desc="{desc}";dur={(end - start) * 1000:.2f}')
+    return ", ".join(metrics)
+
+
+_SERVER_TIMING_DESC = re.compile(r'["\\\x00-\x1f\x7f-\uffff]')
+
+
+def _wants_server_timing(req: types.PatchedHttpRequest) -> bool:
+    option = registry.get_settings().server_timing
+    if option == "staff":
+        return bool(getattr(req.user, "is_staff", False))
+    return bool(option)
+
+
+def _write_behind() -> bool:
+    return registry.get_settings().write_behind
+
+
+def _persist(record: Record) -> None:
+    """Sends the `record` to the collector, or the write-behind writer, if enabled.
+    Otherwise, saves it right away."""
+    if collector.send(record):
+        return
+    if _write_behind():
+        writer.get_writer().put(record)
+    else:
+        persistence.save(record)
+
+
+class ApmMiddleware:
+    """Base class for the APM middlewares, that can be used both in sync and async mode.
+    When the next middleware in the chain is a coroutine function, the middleware
+    switches to async mode, dispatching the calls to `__acall__`."""
+
+    sync_capable = True
+    async_capable = True
 
     def __init__(self, get_response: types.GetResponse):
         self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
 
     def __call__(self, request: types.PatchedHttpRequest):
-        request.started_at = perf_counter()
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
         response = self.get_response(request)
-        ellapsed = perf_counter() - request.started_at
+        log._release_capture()
+        profiling.finish(request)
+        return response
+
+    async def __acall__(self, request: types.PatchedHttpRequest):
+        response = await self.get_response(request)  # type: ignore
+        log._release_capture()
+        await profiling.afinish(request)
+        return response
+
+
+class ApmMetricsMiddleware(ApmMiddleware):
+    """A middleware that will register a Request/Response associated data"""
+
+    def __call__(self, request: types.PatchedHttpRequest):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        request._apm_start_instruments = self._start_instruments
+        if hasattr(request, "id"):
+            self._start_instruments(request)
+        request.started_at = perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            ellapsed = perf_counter() - request.started_at
+            trace = getattr(request, "_apm_memory", None)
+            if trace is not None:
+                trace.stop()
+            samples = getattr(request, "_apm_profile", None)
+            if samples is not None:
+                profiler.get_sampler().stop(samples)
+            stats = getattr(request, "_apm_queries", None)
+            if stats is not None:
+                stats.stop()
+        log._release_capture()
+        profiling.finish(request)
         if not hasattr(request, "id"):
-            # This request was not processed by the decorator `apm_api_view`
+            # This request was not processed by the decorator `apm_api_view`,
+            # nor by the auto instrumentation
             return response
-        self._register_metric(request, response, ellapsed)
+        if _wants_server_timing(request):
+            response["Server-Timing"] = server_timing(request, ellapsed)
+        self._track(request, response, ellapsed)
         return response
 
+    async def __acall__(self, request: types.PatchedHttpRequest):
+        # Not known to be tracked yet: the views set the `id` on the event loop,
+        # while the wrappers must be installed on the sync thread
+        stats = self._start_queries(request)
+        if stats is not None:
+            # The connections are per thread: the wrappers are installed on the thread
+            # that runs the sync code (and the ORM calls) of this request
+            await sync_to_async(stats.start)()
+        request.started_at = perf_counter()
+        try:
+            response = await self.get_response(request)  # type: ignore
+        finally:
+            ellapsed = perf_counter() - request.started_at
+            if stats is not None:
+                await sync_to_async(stats.stop)()
+        log._release_capture()
+        await profiling.afinish(request)
+        if not hasattr(request, "id"):
+            # This request was not processed by the decorator `apm_api_view`,
+            # nor by the auto instrumentation
+            return response
+        if _wants_server_timing(request):
+            response["Server-Timing"] = server_timing(request, ellapsed)
+        # Offloaded, so the event loop never blocks on the APM writes
+        await sync_to_async(self._track)(request, response, ellapsed)
+        return response
+
+    def process_view(
+        self, request: types.PatchedHttpRequest, view_func, view_args, view_kwargs
+    ):
+        """Instruments the views without the APM decorators/classes,
+        when `APM_AUTO_INSTRUMENT` is enabled and the view matches its rules"""
+        if hasattr(request, "id") or not instrument.enabled():
+            return None
+        if instrument.should_instrument(request, view_func):
+            contrib._contribute_to_request(request, view=view_func, logger_name=None)
+        return None
+
+    def _start_queries(
+        self, request: types.PatchedHttpRequest
+    ) -> Optional[queries.QueryStats]:
+        """Counts the queries of this request, if `APM_TRACK_QUERIES` is enabled.
+        In async mode, the caller must start it on the sync thread."""
+        if not queries.enabled():
+            return None
+        request._apm_queries = stats = queries.QueryStats()
+        if not iscoroutinefunction(self):
+            stats.start()
+        return stats
+
+    def _start_instruments(self, request: types.PatchedHttpRequest) -> None:
+        """Starts the instruments of a tracked request, once it gets its `id`.
+        Only on sync mode: on async mode, the event loop thread serves many requests."""
+        self._start_queries(request)
+        self._start_profiler(request)
+        request._apm_memory = memory.start()
+
+    def _start_profiler(self, request: types.PatchedHttpRequest) -> None:
+        """Samples the stacks of this request thread, if `APM_PROFILER_THRESHOLD` is set"""
+        if profiler.enabled():
+            request._apm_profile = profiler.get_sampler().start()
+
+    def _track(
+        self, request: types.PatchedHttpRequest, response: Response, ellapsed: float
+    ):
+        """Registers the metric, unless the sampling drops this request,
+        in that case it's only counted."""
+        counters = live.get_counters()
+        if counters is not None:
+            counters.record(request.view_name, ellapsed, response.status_code >= 500)
+        stats = getattr(request, "_apm_queries", None)
+        if stats is not None:
+            queries.counter.add(request.view_name, stats)
+        if rollups.enabled():
+            rollups.counter.add(
+                request.view_name,
+                request.method,
+                response.status_code,
+                ellapsed,
+                getattr(request, "_apm_exception", False),
+            )
+        if not sampling.should_keep(request, response.status_code, ellapsed):
+            sampling.counter.add(request.view_name)
+            return
+        self._register_metric(request, response, ellapsed)
+
     def process_exception(
         self, request: types.PatchedHttpRequest, exception: Exception
     ):
         if not hasattr(request, "id"):
             # This request was not processed by the decorator `apm_api_view`
             return
+        request._apm_exception = True
+        if _write_behind() or collector.enabled():
+            # The response converted from the exception is registered on `__call__`
+            return
         # Due to the exception got raised, the ApiResponse was not created
         end = perf_counter()
         ellapsed = end - request.started_at
-        models.ApiResponse.objects.create(
-            request_id=request.id,
-            status_code=500,
-            ellapsed=ellapsed,
-        )
+        with queries.paused():
+            persistence.save(
+                [
+                    (
+                        models.ApiResponse,
+                        {
+                            "request_id": request.id,
+                            "status_code": 500,
+                            "ellapsed_us": round(ellapsed * 1_000_000),
+                            **_query_fields(request),
+                        },
+                    )
+                ]
+            )
 
     @staticmethod
     def _register_metric(
         request: types.PatchedHttpRequest, response: Response, ellapsed: float
     ):
-        api_req, _ = models.ApiRequest.objects.get_or_create(
-            defaults=api_request_defaults(request),
-            id=request.id,
-        )
-        models.ApiResponse.objects.get_or_create(
-            defaults=api_response_defaults(response, ellapsed),
-            request=api_req,
-        )
+        record: Record = [
+            api_request_row(request),
+            (
+                models.ApiResponse,
+                {
+                    "request_id": request.id,
+                    "created_at": timezone.now(),
+                    **api_response_defaults(response, ellapsed),
+                    **_query_fields(request),
+                    **_memory_fields(request),
+                },
+            ),
+        ]
+        context = getattr(request, "apm", None)
+        if context is not None:
+            record.extend(context.rows(request.id))
+        samples = getattr(request, "_apm_profile", None)
+        threshold = registry.get_settings().profiler_threshold
+        if samples is not None and samples.stacks and ellapsed >= threshold:
+            record.append(samples.row(request.id, profiler.get_sampler().interval))
+        profile = profiling.row(request)
+        if profile is not None:
+            record.append(profile)
+        _persist(record)
 
 
-class ErrorTraceMiddleware:
+class ErrorTraceMiddleware(ApmMiddleware):
     """A middleware that registers, and notifies Exceptions on views."""
 
-    def __init__(self, get_response: types.GetResponse):
-        self.get_response = get_response
-
-    def __call__(self, request):
-        return self.get_response(request)
-
     def process_exception(
         self, request: types.PatchedHttpRequest, exception: Exception
     ):
         if not hasattr(request, "id"):
             # This request was not processed by the decorator `apm_api_view`
             return
-        trace = self._register_error_trace(request, exception)
-        notify_on_debug_true = getattr(
-            settings, "APM_NOTIFY_ON_DEBUG_TRUE", dflt_conf.APM_NOTIFY_ON_DEBUG_TRUE
-        )
-        if settings.DEBUG and not notify_on_debug_true:
-            warnings.warn(
-                "Errors Notifications aren't sent when DEBUG=True and APM_NOTIFY_ON_DEBUG_TRUE=False"
-            )
+        record = self._error_trace_record(request, exception)
+        if collector.send(record, notify=True):
+            # The collector notifies once the error trace is saved
             return
+        with queries.paused():
+            if not persistence.save(record):
+                warnings.warn(
+                    "Errors Notifications aren't sent when the error trace is written to the spool"
+                )
+                return
+            tasks.notify_error_trace(request.id)
 
-        use_celery = getattr(
-            settings, "APM_NOTIFY_USING_CELERY", dflt_conf.APM_NOTIFY_USING_CELERY
-        )
-        if use_celery:
-            tasks.send_notifications.apply_async(
-                kwargs={"trace_id": trace.pk},
-                countdown=3,
-            )  # type: ignore
-        else:
-            tasks.send_notifications(trace_id=trace.pk)
-
-    def _register_error_trace(
+    def _error_trace_record(
         self, request: types.PatchedHttpRequest, exception: Exception
-    ) -> models.ErrorTrace:
-        """Register a error trace for the current request/exception context"""
-        models.ApiRequest.objects.get_or_create(
-            defaults=api_request_defaults(request),
-            id=request.id,
-        )
-        trace: models.ErrorTrace = models.ErrorTrace.objects.create(
-            request_id=request.id,
-            payload=request._json,
-            exception_class=exception.__class__.__name__,
-            exception_args=" ".join(exception.args),
-            traceback=traceback.format_exc(),
-        )
-        models.RequestLog.objects.bulk_create(
-            [
-                models.RequestLog(
-                    trace_id=trace.pk,
-                    level=r.levelname,
-                    file_path=r.pathname,
-                    func_name=r.funcName,
-                    timestamp=timezone.make_aware(datetime.fromtimestamp(r.created)),
-                    message=r.getMessage(),
-                )
-                for r in request._log_handler.records
-            ]
+    ) -> Record:
+        """Builds the error trace rows for the current request/exception context"""
+        record: Record = [
+            api_request_row(request),
+            (
+                models.ErrorTrace,
+                {
+                    "request_id": request.id,
+                    "payload": request._json,
+                    "exception_class": exception.__class__.__name__,
+                    "exception_args": " ".join(exception.args),
+                    "traceback": traceback.format_exc(),
+                    "created_at": timezone.now(),
+                },
+            ),
+        ]
+        record.extend(
+            (
+                models.RequestLog,
+                {
+                    "trace_id": request.id,
+                    "level": r.levelname,
+                    "file_path": r.pathname,
+                    "func_name": r.funcName,
+                    "timestamp": timezone.make_aware(datetime.fromtimestamp(r.created)),
+                    "message": r.getMessage(),
+                },
+            )
+            for r in request._log_capture.records
         )
-        return trace
+        return record
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:19
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0002_apirequest_view_name"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="apirequest",
+            name="requested_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="Requested at",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="apiresponse",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                null=True,
+                verbose_name="Created at",
+            ),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0003_alter_apirequest_requested_at_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DroppedRequestCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.DateTimeField(
+                        editable=False,
+                        help_text="The hour that the requests were made",
+                        verbose_name="Bucket",
+                    ),
+                ),
+                (
+                    "view_name",
+                    models.CharField(
+                        editable=False,
+                        help_text="The name of the function/class that handled the requests",
+                        max_length=255,
+                        verbose_name="View name",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="How many requests were not stored due to sampling",
+                        verbose_name="Count",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Dropped Request Count",
+                "verbose_name_plural": "Dropped Request Counts",
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="droppedrequestcount",
+            constraint=models.UniqueConstraint(
+                fields=("bucket", "view_name"), name="apm_dropped_count_bucket_view"
+            ),
+        ),
+    ]
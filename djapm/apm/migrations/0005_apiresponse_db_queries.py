@@ -0,0 +1,45 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0004_droppedrequestcount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiresponse",
+            name="db_aliases",
+            field=models.JSONField(
+                editable=False,
+                help_text="The count and time of the queries on each database alias",
+                null=True,
+                verbose_name="Queries per database",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiresponse",
+            name="db_query_count",
+            field=models.PositiveIntegerField(
+                editable=False,
+                help_text="How many queries were executed to respond",
+                null=True,
+                verbose_name="Database queries",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiresponse",
+            name="db_time",
+            field=models.DecimalField(
+                decimal_places=3,
+                editable=False,
+                help_text="How much time the queries took",
+                max_digits=6,
+                null=True,
+                verbose_name="Database time",
+            ),
+        ),
+    ]
@@ -0,0 +1,120 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:32
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0005_apiresponse_db_queries"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="QueryFingerprint",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "view_name",
+                    models.CharField(
+                        editable=False,
+                        help_text="The name of the function/class that ran the query",
+                        max_length=255,
+                        verbose_name="View name",
+                    ),
+                ),
+                (
+                    "fingerprint",
+                    models.CharField(
+                        editable=False,
+                        help_text="The SHA-1 of the normalized query",
+                        max_length=40,
+                        verbose_name="Fingerprint",
+                    ),
+                ),
+                (
+                    "sql",
+                    models.TextField(
+                        editable=False,
+                        help_text="The query, without its literals",
+                        verbose_name="SQL",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveBigIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="How many times the query ran",
+                        verbose_name="Count",
+                    ),
+                ),
+                (
+                    "total_time",
+                    models.DecimalField(
+                        decimal_places=6,
+                        default=0,
+                        editable=False,
+                        help_text="How much time the query took, summed",
+                        max_digits=16,
+                        verbose_name="Total time",
+                    ),
+                ),
+                (
+                    "requests",
+                    models.PositiveBigIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="On how many requests the query ran",
+                        verbose_name="Requests",
+                    ),
+                ),
+                (
+                    "max_per_request",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="The most times the query ran on a single request",
+                        verbose_name="Max per request",
+                    ),
+                ),
+                (
+                    "last_seen_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="Last seen at",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Query Fingerprint",
+                "verbose_name_plural": "Query Fingerprints",
+            },
+        ),
+        migrations.AddField(
+            model_name="apiresponse",
+            name="db_repeated_queries",
+            field=models.JSONField(
+                editable=False,
+                help_text="The queries that ran more times than the N+1 threshold on this request",
+                null=True,
+                verbose_name="Repeated queries",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="queryfingerprint",
+            constraint=models.UniqueConstraint(
+                fields=("view_name", "fingerprint"), name="apm_query_view_fingerprint"
+            ),
+        ),
+    ]
@@ -0,0 +1,92 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:33
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0006_queryfingerprint"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Span",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "index",
+                    models.PositiveSmallIntegerField(
+                        editable=False,
+                        help_text="The order that the span started on the request",
+                        verbose_name="Index",
+                    ),
+                ),
+                (
+                    "parent",
+                    models.PositiveSmallIntegerField(
+                        editable=False,
+                        help_text="The index of the span that contains this one",
+                        null=True,
+                        verbose_name="Parent",
+                    ),
+                ),
+                (
+                    "name",
+                    models.CharField(
+                        editable=False, max_length=255, verbose_name="Name"
+                    ),
+                ),
+                (
+                    "start",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        help_text="When the span started, in seconds since the request started",
+                        max_digits=9,
+                        verbose_name="Start",
+                    ),
+                ),
+                (
+                    "duration",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        help_text="How much time the span took",
+                        max_digits=9,
+                        verbose_name="Duration",
+                    ),
+                ),
+                (
+                    "request",
+                    models.ForeignKey(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="spans",
+                        to="apm.apirequest",
+                        verbose_name="Request",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Span",
+                "verbose_name_plural": "Spans",
+                "ordering": ("request", "index"),
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="span",
+            constraint=models.UniqueConstraint(
+                fields=("request", "index"), name="apm_span_request_index"
+            ),
+        ),
+    ]
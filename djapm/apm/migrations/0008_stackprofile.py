@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0007_span"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="StackProfile",
+            fields=[
+                (
+                    "request",
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stack_profile",
+                        serialize=False,
+                        to="apm.apirequest",
+                        verbose_name="Request",
+                    ),
+                ),
+                (
+                    "stacks",
+                    models.TextField(
+                        editable=False,
+                        help_text="The sampled stacks, in the collapsed (flamegraph) format",
+                        verbose_name="Stacks",
+                    ),
+                ),
+                (
+                    "samples",
+                    models.PositiveIntegerField(
+                        editable=False,
+                        help_text="How many times the stack was sampled",
+                        verbose_name="Samples",
+                    ),
+                ),
+                (
+                    "interval",
+                    models.DecimalField(
+                        decimal_places=4,
+                        editable=False,
+                        help_text="The seconds between each sample",
+                        max_digits=6,
+                        verbose_name="Interval",
+                    ),
+                ),
+                (
+                    "overhead",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        help_text="How much time the profiler spent sampling this request",
+                        max_digits=9,
+                        verbose_name="Overhead",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Stack Profile",
+                "verbose_name_plural": "Stack Profiles",
+            },
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0008_stackprofile"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileStats",
+            fields=[
+                (
+                    "request",
+                    models.OneToOneField(
+                        editable=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="profile_stats",
+                        serialize=False,
+                        to="apm.apirequest",
+                        verbose_name="Request",
+                    ),
+                ),
+                (
+                    "data",
+                    models.BinaryField(
+                        help_text="The zlib compressed pstats of the request",
+                        verbose_name="Data",
+                    ),
+                ),
+                (
+                    "total_time",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        help_text="The time spent on all the profiled functions",
+                        max_digits=9,
+                        verbose_name="Total time",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="Created at",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Profile Stats",
+                "verbose_name_plural": "Profile Stats",
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0009_profilestats"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiresponse",
+            name="memory_net",
+            field=models.BigIntegerField(
+                editable=False,
+                help_text="The bytes still allocated after responding",
+                null=True,
+                verbose_name="Memory net",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiresponse",
+            name="memory_peak",
+            field=models.PositiveBigIntegerField(
+                editable=False,
+                help_text="The most bytes allocated at once while responding",
+                null=True,
+                verbose_name="Memory peak",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiresponse",
+            name="memory_top",
+            field=models.JSONField(
+                editable=False,
+                help_text="The lines that allocated the most bytes while responding",
+                null=True,
+                verbose_name="Top allocations",
+            ),
+        ),
+    ]
@@ -0,0 +1,91 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:41
+
+from django.db import migrations, models
+from django.db.models import Value
+from django.db.models.functions import Concat, Length, Substr
+
+
+# The columns that hold a request id: the ApiRequest primary key, and the foreign keys to it
+REQUEST_ID_COLUMNS = (
+    ("apirequest", "id"),
+    ("apiresponse", "request_id"),
+    ("errortrace", "request_id"),
+    ("requestlog", "trace_id"),
+    ("span", "request_id"),
+    ("stackprofile", "request_id"),
+    ("profilestats", "request_id"),
+)
+
+
+def strip_hyphens(apps, schema_editor):
+    """Databases without a native UUID type store the UUIDField as a 32 chars hex string,
+    so the existing `str(uuid4())` ids lose their hyphens before the column is changed.
+    The native UUID types (PostgreSQL) cast the hyphenated strings on their own."""
+    connection = schema_editor.connection
+    if connection.features.has_native_uuid_field:
+        return
+    quote = schema_editor.quote_name
+    with connection.cursor() as cursor:
+        if connection.vendor == "mysql":
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+        for model_name, column in REQUEST_ID_COLUMNS:
+            table = apps.get_model("apm", model_name)._meta.db_table
+            cursor.execute(
+                f"UPDATE {quote(table)} SET {quote(column)} = REPLACE({quote(column)}, '-', '')"
+            )
+        if connection.vendor == "mysql":
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+def add_hyphens(apps, schema_editor):
+    """Restores the canonical `str(uuid4())` form of the ids stripped by `strip_hyphens`,
+    once the columns are strings of 36 chars again"""
+    connection = schema_editor.connection
+    if connection.features.has_native_uuid_field:
+        return
+    if connection.vendor == "mysql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 0")
+    for model_name, column in REQUEST_ID_COLUMNS:
+        model = apps.get_model("apm", model_name)
+        model.objects.alias(length=Length(column)).filter(length=32).update(
+            **{
+                column: Concat(
+                    Substr(column, 1, 8),
+                    Value("-"),
+                    Substr(column, 9, 4),
+                    Value("-"),
+                    Substr(column, 13, 4),
+                    Value("-"),
+                    Substr(column, 17, 4),
+                    Value("-"),
+                    Substr(column, 21, 12),
+                    output_field=models.CharField(),
+                )
+            }
+        )
+    if connection.vendor == "mysql":
+        with connection.cursor() as cursor:
+            cursor.execute("SET FOREIGN_KEY_CHECKS = 1")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0010_apiresponse_memory"),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_hyphens, add_hyphens),
+        migrations.AlterField(
+            model_name="apirequest",
+            name="id",
+            field=models.UUIDField(
+                editable=False,
+                help_text="Unique identifier of this request",
+                primary_key=True,
+                serialize=False,
+                verbose_name="Request ID",
+            ),
+        ),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0011_apirequest_uuid_id"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="apirequest",
+            index=models.Index(
+                fields=["requested_at", "view_name"], name="apm_request_at_view_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="apirequest",
+            index=models.Index(
+                fields=["view_name", "-requested_at"], name="apm_request_view_at_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="apiresponse",
+            index=models.Index(fields=["-created_at"], name="apm_response_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="apiresponse",
+            index=models.Index(
+                fields=["status_code", "-created_at"], name="apm_response_status_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="errortrace",
+            index=models.Index(
+                fields=["created_at", "exception_class"], name="apm_trace_created_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="errortrace",
+            index=models.Index(
+                fields=["dismissed_at", "-created_at"], name="apm_trace_dismissed_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,239 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0012_dashboard_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="HourRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.DateTimeField(
+                        editable=False,
+                        help_text="The start of the period that the requests were made",
+                        verbose_name="Bucket",
+                    ),
+                ),
+                (
+                    "view_name",
+                    models.CharField(
+                        editable=False,
+                        help_text="The name of the function/class that handled the requests",
+                        max_length=255,
+                        verbose_name="View name",
+                    ),
+                ),
+                (
+                    "method",
+                    models.CharField(
+                        editable=False, max_length=7, verbose_name="HTTP Method"
+                    ),
+                ),
+                (
+                    "status_class",
+                    models.PositiveSmallIntegerField(
+                        editable=False,
+                        help_text="The hundreds of the status codes, e.g. 5 for 5xx",
+                        verbose_name="Status class",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="How many requests were made",
+                        verbose_name="Count",
+                    ),
+                ),
+                (
+                    "errors",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="How many requests raised an exception",
+                        verbose_name="Errors",
+                    ),
+                ),
+                (
+                    "ellapsed_sum",
+                    models.DecimalField(
+                        decimal_places=6,
+                        default=0,
+                        editable=False,
+                        help_text="How much time the server took to respond, summed",
+                        max_digits=16,
+                        verbose_name="Ellapsed sum",
+                    ),
+                ),
+                (
+                    "ellapsed_min",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        max_digits=9,
+                        verbose_name="Ellapsed min",
+                    ),
+                ),
+                (
+                    "ellapsed_max",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        max_digits=9,
+                        verbose_name="Ellapsed max",
+                    ),
+                ),
+                (
+                    "histogram",
+                    models.JSONField(
+                        default=list,
+                        editable=False,
+                        help_text="How many requests took up to each of `rollups.LATENCY_BOUNDS` seconds, the last one counts the slower requests",
+                        verbose_name="Histogram",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Hour Rollup",
+                "verbose_name_plural": "Hour Rollups",
+                "abstract": False,
+            },
+        ),
+        migrations.CreateModel(
+            name="MinuteRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "bucket",
+                    models.DateTimeField(
+                        editable=False,
+                        help_text="The start of the period that the requests were made",
+                        verbose_name="Bucket",
+                    ),
+                ),
+                (
+                    "view_name",
+                    models.CharField(
+                        editable=False,
+                        help_text="The name of the function/class that handled the requests",
+                        max_length=255,
+                        verbose_name="View name",
+                    ),
+                ),
+                (
+                    "method",
+                    models.CharField(
+                        editable=False, max_length=7, verbose_name="HTTP Method"
+                    ),
+                ),
+                (
+                    "status_class",
+                    models.PositiveSmallIntegerField(
+                        editable=False,
+                        help_text="The hundreds of the status codes, e.g. 5 for 5xx",
+                        verbose_name="Status class",
+                    ),
+                ),
+                (
+                    "count",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="How many requests were made",
+                        verbose_name="Count",
+                    ),
+                ),
+                (
+                    "errors",
+                    models.PositiveIntegerField(
+                        default=0,
+                        editable=False,
+                        help_text="How many requests raised an exception",
+                        verbose_name="Errors",
+                    ),
+                ),
+                (
+                    "ellapsed_sum",
+                    models.DecimalField(
+                        decimal_places=6,
+                        default=0,
+                        editable=False,
+                        help_text="How much time the server took to respond, summed",
+                        max_digits=16,
+                        verbose_name="Ellapsed sum",
+                    ),
+                ),
+                (
+                    "ellapsed_min",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        max_digits=9,
+                        verbose_name="Ellapsed min",
+                    ),
+                ),
+                (
+                    "ellapsed_max",
+                    models.DecimalField(
+                        decimal_places=6,
+                        editable=False,
+                        max_digits=9,
+                        verbose_name="Ellapsed max",
+                    ),
+                ),
+                (
+                    "histogram",
+                    models.JSONField(
+                        default=list,
+                        editable=False,
+                        help_text="How many requests took up to each of `rollups.LATENCY_BOUNDS` seconds, the last one counts the slower requests",
+                        verbose_name="Histogram",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Minute Rollup",
+                "verbose_name_plural": "Minute Rollups",
+                "abstract": False,
+            },
+        ),
+        migrations.AddConstraint(
+            model_name="minuterollup",
+            constraint=models.UniqueConstraint(
+                fields=("bucket", "view_name", "method", "status_class"),
+                name="apm_minuterollup_key",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="hourrollup",
+            constraint=models.UniqueConstraint(
+                fields=("bucket", "view_name", "method", "status_class"),
+                name="apm_hourrollup_key",
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.30 on 2026-10-18 12:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0013_rollups"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="hourrollup",
+            name="sketch",
+            field=models.JSONField(
+                editable=False,
+                help_text="The bins of the ellapsed times, to estimate their percentiles",
+                null=True,
+                verbose_name="Latency sketch",
+            ),
+        ),
+        migrations.AddField(
+            model_name="minuterollup",
+            name="sketch",
+            field=models.JSONField(
+                editable=False,
+                help_text="The bins of the ellapsed times, to estimate their percentiles",
+                null=True,
+                verbose_name="Latency sketch",
+            ),
+        ),
+    ]
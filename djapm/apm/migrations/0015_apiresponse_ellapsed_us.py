@@ -0,0 +1,105 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:00
+
+import re
+
+from django.apps.registry import Apps
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Least, Round
+
+
+# The biggest value of the former DecimalField(max_digits=6, decimal_places=3)
+MAX_ELLAPSED = 999.999
+
+
+def shard_responses(apps, schema_editor):
+    """The models of the `APM_SHARD_DAYS` response tables, with the fields that
+    `ApiResponse` has on this state, since the migrations don't know about them"""
+    ApiResponse = apps.get_model("apm", "ApiResponse")
+    table = re.compile(rf"^{ApiResponse._meta.db_table}_(\d{{8}})$")
+    registry = Apps(installed_apps=())
+    for name in schema_editor.connection.introspection.table_names():
+        match = table.match(name)
+        if not match:
+            continue
+        fields = {}
+        for field in ApiResponse._meta.local_fields:
+            if field.primary_key:
+                fields[field.attname] = models.UUIDField(primary_key=True)
+            else:
+                fields[field.name] = field.clone()
+        meta = type(
+            "Meta",
+            (),
+            {
+                "apps": registry,
+                "app_label": "apm",
+                "db_table": name,
+                "managed": False,
+                "indexes": [
+                    models.Index(fields=index.fields, name=f"{index.name}_{match[1]}")
+                    for index in ApiResponse._meta.indexes
+                ],
+            },
+        )
+        yield type(
+            f"ApiResponse{match[1]}",
+            (models.Model,),
+            {"__module__": __name__, "Meta": meta, **fields},
+        )
+
+
+def to_microseconds(apps, schema_editor):
+    ApiResponse = apps.get_model("apm", "ApiResponse")
+    shards = list(shard_responses(apps, schema_editor))
+    for model in shards:
+        schema_editor.add_field(model, model._meta.get_field("ellapsed_us"))
+    for model in [ApiResponse, *shards]:
+        model.objects.filter(ellapsed__isnull=False).update(
+            ellapsed_us=Cast(
+                Round(F("ellapsed") * 1_000_000), models.PositiveBigIntegerField()
+            )
+        )
+    for model in shards:
+        schema_editor.remove_field(model, model._meta.get_field("ellapsed"))
+
+
+def to_seconds(apps, schema_editor):
+    ApiResponse = apps.get_model("apm", "ApiResponse")
+    shards = list(shard_responses(apps, schema_editor))
+    for model in shards:
+        schema_editor.add_field(model, model._meta.get_field("ellapsed"))
+    for model in [ApiResponse, *shards]:
+        model.objects.filter(ellapsed_us__isnull=False).update(
+            ellapsed=Least(
+                Cast(F("ellapsed_us"), models.FloatField()) / Value(1_000_000.0),
+                Value(MAX_ELLAPSED),
+            )
+        )
+    for model in shards:
+        schema_editor.remove_field(model, model._meta.get_field("ellapsed_us"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0014_rollup_sketch"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiresponse",
+            name="ellapsed_us",
+            field=models.PositiveBigIntegerField(
+                editable=False,
+                help_text="How many microseconds the server took to respond",
+                null=True,
+                verbose_name="Ellapsed (µs)",
+            ),
+        ),
+        migrations.RunPython(to_microseconds, to_seconds),
+        migrations.RemoveField(
+            model_name="apiresponse",
+            name="ellapsed",
+        ),
+    ]
@@ -0,0 +1,303 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:07
+
+import hashlib
+import json
+import lzma
+import re
+import zlib
+
+from django.apps.registry import Apps
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+# The fields moved to blobs, each referenced by its `<name>_blob` foreign key
+FIELDS = (
+    ("ApiRequest", "headers"),
+    ("ApiResponse", "body"),
+    ("ErrorTrace", "payload"),
+    ("ErrorTrace", "traceback"),
+)
+SHARDED = ("ApiRequest", "ApiResponse")
+BATCH_SIZE = 1000
+CODECS = {
+    "zlib": (zlib.compress, zlib.decompress),
+    "lzma": (lzma.compress, lzma.decompress),
+}
+
+
+def pack_value(value, codec):
+    """The fields of the blob of `value`, addressed by the SHA-256 of its canonical JSON"""
+    content = json.dumps(
+        value, cls=DjangoJSONEncoder, sort_keys=True, separators=(",", ":")
+    ).encode()
+    compress, _ = CODECS[codec]
+    return {
+        "digest": hashlib.sha256(content).hexdigest(),
+        "codec": codec,
+        "data": compress(content),
+        "size": len(content),
+    }
+
+
+def unpack_value(codec, data):
+    _, decompress = CODECS[codec]
+    return json.loads(decompress(bytes(data)))
+
+
+def shard_models(apps, schema_editor, model_name):
+    """The models of the `APM_SHARD_DAYS` tables of `model_name`, with the fields it has
+    on this state, since the migrations don't know about them. Like on the shards,
+    the relations are plain columns."""
+    model = apps.get_model("apm", model_name)
+    table = re.compile(rf"^{model._meta.db_table}_(\d{{8}})$")
+    registry = Apps(installed_apps=())
+    tables = []
+    for name in schema_editor.connection.introspection.table_names():
+        match = table.match(name)
+        if not match:
+            continue
+        fields = {}
+        for field in model._meta.local_fields:
+            if not field.is_relation:
+                fields[field.name] = field.clone()
+                continue
+            target = field.target_field
+            if field.primary_key:
+                options = {"primary_key": True}
+            else:
+                options = {"null": True, "db_index": field.db_index}
+            if isinstance(target, models.BigIntegerField):
+                column = models.BigIntegerField(**options)
+            elif isinstance(target, models.IntegerField):
+                column = models.IntegerField(**options)
+            else:
+                column = target.__class__(max_length=target.max_length, **options)
+            fields[field.attname] = column
+        meta = type(
+            "Meta",
+            (),
+            {
+                "apps": registry,
+                "app_label": "apm",
+                "db_table": name,
+                "managed": False,
+                "indexes": [
+                    models.Index(fields=index.fields, name=f"{index.name}_{match[1]}")
+                    for index in model._meta.indexes
+                ],
+            },
+        )
+        tables.append(
+            type(
+                f"{model_name}{match[1]}",
+                (models.Model,),
+                {"__module__": __name__, "Meta": meta, **fields},
+            )
+        )
+    return tables
+
+
+def batches(model, **filters):
+    """The rows of `model` matching the `filters`, `BATCH_SIZE` at a time by primary key"""
+    queryset = model.objects.filter(**filters).order_by("pk")
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        objs = list(page[:BATCH_SIZE])
+        if not objs:
+            return
+        yield objs
+        last = objs[-1].pk
+
+
+def pack(model, Blob, name, codec):
+    reference = model._meta.get_field(f"{name}_blob_id")
+    for objs in batches(model, **{f"{name}__isnull": False}):
+        blob_objs = {}
+        for obj in objs:
+            blob = pack_value(getattr(obj, name), codec)
+            blob_objs.setdefault(blob["digest"], Blob(**blob))
+            setattr(obj, reference.attname, blob["digest"])
+        Blob.objects.bulk_create(blob_objs.values(), ignore_conflicts=True)
+        model.objects.bulk_update(objs, [reference.name])
+
+
+def unpack(model, Blob, name):
+    reference = model._meta.get_field(f"{name}_blob_id")
+    for objs in batches(model, **{f"{reference.attname}__isnull": False}):
+        found = Blob.objects.in_bulk([getattr(o, reference.attname) for o in objs])
+        for obj in objs:
+            blob = found.get(getattr(obj, reference.attname))
+            if blob is not None:
+                setattr(obj, name, unpack_value(blob.codec, blob.data))
+            elif name == "traceback":
+                setattr(obj, name, "")
+        model.objects.bulk_update(objs, [name])
+
+
+def to_blobs(apps, schema_editor):
+    Blob = apps.get_model("apm", "Blob")
+    codec = getattr(settings, "APM_BLOB_CODEC", "zlib")
+    sharded = {name: shard_models(apps, schema_editor, name) for name in SHARDED}
+    for model_name, name in FIELDS:
+        on_shards = sharded.get(model_name, [])
+        for model in on_shards:
+            schema_editor.add_field(model, model._meta.get_field(f"{name}_blob_id"))
+        for model in [apps.get_model("apm", model_name), *on_shards]:
+            pack(model, Blob, name, codec)
+        for model in on_shards:
+            schema_editor.remove_field(model, model._meta.get_field(name))
+
+
+def from_blobs(apps, schema_editor):
+    Blob = apps.get_model("apm", "Blob")
+    sharded = {name: shard_models(apps, schema_editor, name) for name in SHARDED}
+    for model_name, name in FIELDS:
+        on_shards = sharded.get(model_name, [])
+        for model in on_shards:
+            schema_editor.add_field(model, model._meta.get_field(name))
+        for model in [apps.get_model("apm", model_name), *on_shards]:
+            unpack(model, Blob, name)
+        for model in on_shards:
+            schema_editor.remove_field(model, model._meta.get_field(f"{name}_blob_id"))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0015_apiresponse_ellapsed_us"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Blob",
+            fields=[
+                (
+                    "digest",
+                    models.CharField(
+                        editable=False,
+                        help_text="The SHA-256 of the value's JSON",
+                        max_length=64,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Digest",
+                    ),
+                ),
+                (
+                    "codec",
+                    models.CharField(
+                        choices=[("zlib", "zlib"), ("lzma", "lzma")],
+                        editable=False,
+                        max_length=8,
+                        verbose_name="Codec",
+                    ),
+                ),
+                (
+                    "data",
+                    models.BinaryField(
+                        help_text="The compressed JSON of the value",
+                        verbose_name="Data",
+                    ),
+                ),
+                (
+                    "size",
+                    models.PositiveIntegerField(
+                        editable=False,
+                        help_text="The size of the JSON, before being compressed",
+                        verbose_name="Size",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="Created at",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Blob",
+                "verbose_name_plural": "Blobs",
+            },
+        ),
+        migrations.AddField(
+            model_name="apirequest",
+            name="headers_blob",
+            field=models.ForeignKey(
+                db_constraint=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="apm.blob",
+                verbose_name="Request Headers",
+            ),
+        ),
+        migrations.AddField(
+            model_name="apiresponse",
+            name="body_blob",
+            field=models.ForeignKey(
+                db_constraint=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="apm.blob",
+                verbose_name="Body",
+            ),
+        ),
+        migrations.AddField(
+            model_name="errortrace",
+            name="payload_blob",
+            field=models.ForeignKey(
+                db_constraint=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="apm.blob",
+                verbose_name="Request Payload",
+            ),
+        ),
+        migrations.AddField(
+            model_name="errortrace",
+            name="traceback_blob",
+            field=models.ForeignKey(
+                db_constraint=False,
+                editable=False,
+                null=True,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="apm.blob",
+                verbose_name="Traceback",
+            ),
+        ),
+        # Nullable until the end, so it can be added back empty when reversed
+        migrations.AlterField(
+            model_name="errortrace",
+            name="traceback",
+            field=models.TextField(null=True, verbose_name="Traceback"),
+        ),
+        migrations.RunPython(to_blobs, from_blobs),
+        migrations.RemoveField(
+            model_name="apirequest",
+            name="headers",
+        ),
+        migrations.RemoveField(
+            model_name="apiresponse",
+            name="body",
+        ),
+        migrations.RemoveField(
+            model_name="errortrace",
+            name="payload",
+        ),
+        migrations.RemoveField(
+            model_name="errortrace",
+            name="traceback",
+        ),
+    ]
@@ -0,0 +1,249 @@
+# Generated by Django 4.2.30 on 2026-10-18 14:02
+
+import re
+
+from django.apps.registry import Apps
+from django.db import migrations, models
+from django.db.models import F, Value
+from django.db.models.functions import Cast, Least, Round
+
+
+# The former decimal columns, their microseconds columns, and the biggest value
+# the decimal ones could hold
+CONVERSIONS = (
+    ("ApiResponse", "db_time", "db_time_us", 999.999),
+    ("Span", "start", "start_us", 999.999999),
+    ("Span", "duration", "duration_us", 999.999999),
+    ("MinuteRollup", "ellapsed_sum", "ellapsed_sum_us", 9_999_999_999.0),
+    ("MinuteRollup", "ellapsed_min", "ellapsed_min_us", 999.999999),
+    ("MinuteRollup", "ellapsed_max", "ellapsed_max_us", 999.999999),
+    ("HourRollup", "ellapsed_sum", "ellapsed_sum_us", 9_999_999_999.0),
+    ("HourRollup", "ellapsed_min", "ellapsed_min_us", 999.999999),
+    ("HourRollup", "ellapsed_max", "ellapsed_max_us", 999.999999),
+)
+
+
+def shard_models(apps, schema_editor, model_name):
+    """The models of the `APM_SHARD_DAYS` tables of `model_name`, with the fields it has
+    on this state, since the migrations don't know about them. Like on the shards,
+    the relations are plain columns."""
+    model = apps.get_model("apm", model_name)
+    table = re.compile(rf"^{model._meta.db_table}_(\d{{8}})$")
+    registry = Apps(installed_apps=())
+    tables = []
+    for name in schema_editor.connection.introspection.table_names():
+        match = table.match(name)
+        if not match:
+            continue
+        fields = {}
+        for field in model._meta.local_fields:
+            if not field.is_relation:
+                fields[field.name] = field.clone()
+                continue
+            target = field.target_field
+            if field.primary_key:
+                options = {"primary_key": True}
+            else:
+                options = {"null": True, "db_index": field.db_index}
+            if isinstance(target, models.BigIntegerField):
+                column = models.BigIntegerField(**options)
+            elif isinstance(target, models.IntegerField):
+                column = models.IntegerField(**options)
+            else:
+                column = target.__class__(max_length=target.max_length, **options)
+            fields[field.attname] = column
+        meta = type(
+            "Meta",
+            (),
+            {
+                "apps": registry,
+                "app_label": "apm",
+                "db_table": name,
+                "managed": False,
+                "indexes": [
+                    models.Index(fields=index.fields, name=f"{index.name}_{match[1]}")
+                    for index in model._meta.indexes
+                ],
+            },
+        )
+        tables.append(
+            type(
+                f"{model_name}{match[1]}",
+                (models.Model,),
+                {"__module__": __name__, "Meta": meta, **fields},
+            )
+        )
+    return tables
+
+
+def to_microseconds(apps, schema_editor):
+    sharded = shard_models(apps, schema_editor, "ApiResponse")
+    for model in sharded:
+        schema_editor.add_field(model, model._meta.get_field("db_time_us"))
+    for model_name, seconds, microseconds, _ in CONVERSIONS:
+        on_shards = sharded if model_name == "ApiResponse" else []
+        for model in [apps.get_model("apm", model_name), *on_shards]:
+            model.objects.filter(**{f"{seconds}__isnull": False}).update(
+                **{
+                    microseconds: Cast(
+                        Round(F(seconds) * 1_000_000), models.PositiveBigIntegerField()
+                    )
+                }
+            )
+    for model in sharded:
+        schema_editor.remove_field(model, model._meta.get_field("db_time"))
+
+
+def to_seconds(apps, schema_editor):
+    sharded = shard_models(apps, schema_editor, "ApiResponse")
+    for model in sharded:
+        schema_editor.add_field(model, model._meta.get_field("db_time"))
+    for model_name, seconds, microseconds, biggest in CONVERSIONS:
+        on_shards = sharded if model_name == "ApiResponse" else []
+        for model in [apps.get_model("apm", model_name), *on_shards]:
+            model.objects.filter(**{f"{microseconds}__isnull": False}).update(
+                **{
+                    seconds: Least(
+                        Cast(F(microseconds), models.FloatField()) / Value(1_000_000.0),
+                        Value(biggest),
+                    )
+                }
+            )
+    for model in sharded:
+        schema_editor.remove_field(model, model._meta.get_field("db_time_us"))
+
+
+def rollup_fields(model_name):
+    return [
+        migrations.AddField(
+            model_name=model_name,
+            name="ellapsed_sum_us",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                editable=False,
+                help_text="How many microseconds the server took to respond, summed",
+                verbose_name="Ellapsed sum (µs)",
+            ),
+        ),
+        migrations.AddField(
+            model_name=model_name,
+            name="ellapsed_min_us",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, verbose_name="Ellapsed min (µs)"
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name=model_name,
+            name="ellapsed_max_us",
+            field=models.PositiveBigIntegerField(
+                default=0, editable=False, verbose_name="Ellapsed max (µs)"
+            ),
+            preserve_default=False,
+        ),
+        # Nullable until the end, so they can be added back empty when reversed
+        migrations.AlterField(
+            model_name=model_name,
+            name="ellapsed_min",
+            field=models.DecimalField(
+                decimal_places=6,
+                editable=False,
+                max_digits=9,
+                null=True,
+                verbose_name="Ellapsed min",
+            ),
+        ),
+        migrations.AlterField(
+            model_name=model_name,
+            name="ellapsed_max",
+            field=models.DecimalField(
+                decimal_places=6,
+                editable=False,
+                max_digits=9,
+                null=True,
+                verbose_name="Ellapsed max",
+            ),
+        ),
+    ]
+
+
+def remove_rollup_fields(model_name):
+    return [
+        migrations.RemoveField(model_name=model_name, name=name)
+        for name in ("ellapsed_sum", "ellapsed_min", "ellapsed_max")
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0016_blobs"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="apiresponse",
+            name="db_time_us",
+            field=models.PositiveBigIntegerField(
+                editable=False,
+                help_text="How many microseconds the queries took",
+                null=True,
+                verbose_name="Database time (µs)",
+            ),
+        ),
+        migrations.AddField(
+            model_name="span",
+            name="start_us",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                editable=False,
+                help_text="When the span started, in microseconds since the request started",
+                verbose_name="Start (µs)",
+            ),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name="span",
+            name="duration_us",
+            field=models.PositiveBigIntegerField(
+                default=0,
+                editable=False,
+                help_text="How many microseconds the span took",
+                verbose_name="Duration (µs)",
+            ),
+            preserve_default=False,
+        ),
+        # Nullable until the end, so they can be added back empty when reversed
+        migrations.AlterField(
+            model_name="span",
+            name="start",
+            field=models.DecimalField(
+                decimal_places=6,
+                editable=False,
+                help_text="When the span started, in seconds since the request started",
+                max_digits=9,
+                null=True,
+                verbose_name="Start",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="span",
+            name="duration",
+            field=models.DecimalField(
+                decimal_places=6,
+                editable=False,
+                help_text="How much time the span took",
+                max_digits=9,
+                null=True,
+                verbose_name="Duration",
+            ),
+        ),
+        *rollup_fields("minuterollup"),
+        *rollup_fields("hourrollup"),
+        migrations.RunPython(to_microseconds, to_seconds),
+        migrations.RemoveField(model_name="apiresponse", name="db_time"),
+        migrations.RemoveField(model_name="span", name="start"),
+        migrations.RemoveField(model_name="span", name="duration"),
+        *remove_rollup_fields("minuterollup"),
+        *remove_rollup_fields("hourrollup"),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:10
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0017_latency_microseconds"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProfileToken",
+            fields=[
+                (
+                    "nonce",
+                    models.CharField(
+                        editable=False,
+                        max_length=32,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="Nonce",
+                    ),
+                ),
+                (
+                    "created_at",
+                    models.DateTimeField(
+                        default=django.utils.timezone.now,
+                        editable=False,
+                        verbose_name="Created at",
+                    ),
+                ),
+            ],
+            options={
+                "verbose_name": "Profile Token",
+                "verbose_name_plural": "Profile Tokens",
+            },
+        ),
+    ]
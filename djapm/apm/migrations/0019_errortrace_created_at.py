@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:57
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("apm", "0018_profiletoken"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="errortrace",
+            name="created_at",
+            field=models.DateTimeField(
+                default=django.utils.timezone.now,
+                editable=False,
+                verbose_name="Created at",
+            ),
+        ),
+    ]
@@ -1,15 +1,29 @@
+import uuid
+from typing import Any, Optional
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
-from djapm.apm import dflt_conf
+from djapm.apm import blobs, dflt_conf
 
 __all__ = (
+    "Blob",
     "ApiRequest",
     "ApiResponse",
     "ErrorTrace",
     "RequestLog",
+    "Span",
+    "StackProfile",
+    "ProfileStats",
+    "ProfileToken",
+    "DroppedRequestCount",
+    "QueryFingerprint",
+    "MinuteRollup",
+    "HourRollup",
     "Integration",
     "NotificationReceiver",
 )
@@ -33,20 +47,81 @@ class ApmModel(models.Model):
         abstract = True
 
 
-class ApiRequest(ApmModel):
-    id = models.CharField(
-        verbose_name=_("Request ID"),
-        help_text=_("Unique identifier of this request"),
-        max_length=36,
+class Blob(ApmModel):
+    """A compressed JSON value, stored once however many rows reference it"""
+
+    digest = models.CharField(
+        verbose_name=_("Digest"),
+        help_text=_("The SHA-256 of the value's JSON"),
+        max_length=64,
         primary_key=True,
         editable=False,
     )
-    headers = models.JSONField(
-        verbose_name=_("Request Headers"),
-        help_text=_("The headers sent with this request"),
+    codec = models.CharField(
+        verbose_name=_("Codec"),
+        max_length=8,
+        choices=[(codec, codec) for codec in blobs.CODECS],
+        editable=False,
+    )
+    data = models.BinaryField(
+        verbose_name=_("Data"),
+        help_text=_("The compressed JSON of the value"),
         editable=False,
+    )
+    size = models.PositiveIntegerField(
+        verbose_name=_("Size"),
+        help_text=_("The size of the JSON, before being compressed"),
+        editable=False,
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("Created at"),
+        default=timezone.now,
+        editable=False,
+    )
+
+    class Meta:
+        verbose_name = _("Blob")
+        verbose_name_plural = _("Blobs")
+
+    def __str__(self):
+        return self.digest
+
+    @cached_property
+    def value(self) -> Any:
+        return blobs.unpack(self.codec, self.data)
+
+
+def blob_field(verbose_name: str) -> models.ForeignKey:
+    # Without a constraint, so the blobs can be created in bulk on any order and
+    # rows on the shards can reference them too
+    return models.ForeignKey(
+        verbose_name=verbose_name,
+        to=Blob,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        related_name="+",
         null=True,
+        editable=False,
+    )
+
+
+def blob_value(obj: models.Model, name: str) -> Any:
+    """The value of the `name` blob of `obj`, or `None` if it's missing"""
+    try:
+        blob = getattr(obj, name)
+    except Blob.DoesNotExist:
+        return None
+    return blob.value if blob is not None else None
+
+
+class ApiRequest(ApmModel):
+    id = models.UUIDField(
+        verbose_name=_("Request ID"),
+        help_text=_("Unique identifier of this request"),
+        primary_key=True,
+        editable=False,
     )
+    headers_blob = blob_field(_("Request Headers"))
     query_parameters = models.JSONField(
         verbose_name=_("Request Query Parameters"),
         help_text=_("The query parameters sent with this request"),
@@ -88,16 +163,30 @@ class ApiRequest(ApmModel):
     )
     requested_at = models.DateTimeField(
         verbose_name=_("Requested at"),
-        auto_now_add=True,
+        default=timezone.now,
         editable=False,
     )
 
     class Meta:
         verbose_name = _("API Request")
         verbose_name_plural = _("API Requests")
+        indexes = [
+            # The dashboard filters by date ranges, grouping by view
+            models.Index(
+                fields=["requested_at", "view_name"], name="apm_request_at_view_idx"
+            ),
+            # The admin filters by view, ordered by the newest
+            models.Index(
+                fields=["view_name", "-requested_at"], name="apm_request_view_at_idx"
+            ),
+        ]
 
     def __str__(self):
-        return self.id
+        return str(self.id)
+
+    @property
+    def headers(self) -> Optional[dict]:
+        return blob_value(self, "headers_blob")
 
 
 class ApiResponse(ApmModel):
@@ -114,35 +203,96 @@ class ApiResponse(ApmModel):
         help_text=_("The response's status code"),
         editable=False,
     )
-    ellapsed = models.DecimalField(
-        max_digits=6,
-        decimal_places=3,
-        verbose_name=_("Ellapsed"),
-        help_text=_("How much time the server took to respond"),
+    ellapsed_us = models.PositiveBigIntegerField(
+        verbose_name=_("Ellapsed (µs)"),
+        help_text=_("How many microseconds the server took to respond"),
         null=True,
         editable=False,
     )
-    body = models.JSONField(
-        verbose_name=_("Body"),
-        help_text=_("The response's body"),
+    body_blob = blob_field(_("Body"))
+    created_at = models.DateTimeField(
+        verbose_name=_("Created at"),
+        default=timezone.now,
         null=True,
         editable=False,
     )
-    created_at = models.DateTimeField(
-        verbose_name=_("Created at"),
-        auto_now_add=True,
+    db_query_count = models.PositiveIntegerField(
+        verbose_name=_("Database queries"),
+        help_text=_("How many queries were executed to respond"),
+        null=True,
+        editable=False,
+    )
+    db_time_us = models.PositiveBigIntegerField(
+        verbose_name=_("Database time (µs)"),
+        help_text=_("How many microseconds the queries took"),
+        null=True,
+        editable=False,
+    )
+    db_aliases = models.JSONField(
+        verbose_name=_("Queries per database"),
+        help_text=_("The count and time of the queries on each database alias"),
+        null=True,
+        editable=False,
+    )
+    db_repeated_queries = models.JSONField(
+        verbose_name=_("Repeated queries"),
+        help_text=_(
+            "The queries that ran more times than the N+1 threshold on this request"
+        ),
+        null=True,
+        editable=False,
+    )
+    memory_peak = models.PositiveBigIntegerField(
+        verbose_name=_("Memory peak"),
+        help_text=_("The most bytes allocated at once while responding"),
+        null=True,
+        editable=False,
+    )
+    memory_net = models.BigIntegerField(
+        verbose_name=_("Memory net"),
+        help_text=_("The bytes still allocated after responding"),
+        null=True,
+        editable=False,
+    )
+    memory_top = models.JSONField(
+        verbose_name=_("Top allocations"),
+        help_text=_("The lines that allocated the most bytes while responding"),
         null=True,
         editable=False,
     )
 
-    request_id: str
+    request_id: uuid.UUID
 
     class Meta:
         verbose_name = _("API Response")
         verbose_name_plural = _("API Responses")
+        indexes = [
+            models.Index(fields=["-created_at"], name="apm_response_created_idx"),
+            models.Index(
+                fields=["status_code", "-created_at"], name="apm_response_status_idx"
+            ),
+        ]
 
     def __str__(self):
-        return self.request_id
+        return str(self.request_id)
+
+    @property
+    def ellapsed(self) -> Optional[float]:
+        """How many seconds the server took to respond"""
+        if self.ellapsed_us is None:
+            return None
+        return self.ellapsed_us / 1_000_000
+
+    @property
+    def db_time(self) -> Optional[float]:
+        """How many seconds the queries took"""
+        if self.db_time_us is None:
+            return None
+        return self.db_time_us / 1_000_000
+
+    @property
+    def body(self) -> Any:
+        return blob_value(self, "body_blob")
 
 
 class ErrorTrace(ApmModel):
@@ -154,12 +304,7 @@ class ErrorTrace(ApmModel):
         related_name="error_trace",
         editable=False,
     )
-    payload = models.JSONField(
-        verbose_name=_("Request Payload"),
-        help_text=_("The payload sent with this request"),
-        null=True,
-        editable=False,
-    )
+    payload_blob = blob_field(_("Request Payload"))
     exception_class = models.CharField(
         verbose_name=_("Exception class"),
         max_length=255,
@@ -170,13 +315,10 @@ class ErrorTrace(ApmModel):
         max_length=255,
         editable=False,
     )
-    traceback = models.TextField(
-        verbose_name=_("Traceback"),
-        editable=False,
-    )
+    traceback_blob = blob_field(_("Traceback"))
     created_at = models.DateTimeField(
         verbose_name=_("Created at"),
-        auto_now_add=True,
+        default=timezone.now,
         editable=False,
     )
     dismissed_at = models.DateTimeField(
@@ -193,15 +335,32 @@ class ErrorTrace(ApmModel):
         null=True,
     )
 
-    request_id: str
+    request_id: uuid.UUID
     logs: models.QuerySet["RequestLog"]
 
     class Meta:
         verbose_name = _("Error Trace")
         verbose_name_plural = _("Error Traces")
+        indexes = [
+            models.Index(
+                fields=["created_at", "exception_class"], name="apm_trace_created_idx"
+            ),
+            # The admin lists the pending traces first, newest first
+            models.Index(
+                fields=["dismissed_at", "-created_at"], name="apm_trace_dismissed_idx"
+            ),
+        ]
 
     def __str__(self):
-        return self.request_id
+        return str(self.request_id)
+
+    @property
+    def payload(self) -> Any:
+        return blob_value(self, "payload_blob")
+
+    @property
+    def traceback(self) -> Optional[str]:
+        return blob_value(self, "traceback_blob")
 
 
 class RequestLog(ApmModel):
@@ -236,14 +395,365 @@ class RequestLog(ApmModel):
         editable=False,
     )
 
-    trace_id: str
+    trace_id: uuid.UUID
 
     class Meta:
         verbose_name = _("Request Log")
         verbose_name_plural = _("Request Logs")
 
     def __str__(self):
-        return self.trace_id
+        return str(self.trace_id)
+
+
+class Span(ApmModel):
+    request = models.ForeignKey(
+        verbose_name=_("Request"),
+        to=ApiRequest,
+        on_delete=models.CASCADE,
+        related_name="spans",
+        editable=False,
+    )
+    index = models.PositiveSmallIntegerField(
+        verbose_name=_("Index"),
+        help_text=_("The order that the span started on the request"),
+        editable=False,
+    )
+    parent = models.PositiveSmallIntegerField(
+        verbose_name=_("Parent"),
+        help_text=_("The index of the span that contains this one"),
+        null=True,
+        editable=False,
+    )
+    name = models.CharField(
+        verbose_name=_("Name"),
+        max_length=255,
+        editable=False,
+    )
+    start_us = models.PositiveBigIntegerField(
+        verbose_name=_("Start (µs)"),
+        help_text=_("When the span started, in microseconds since the request started"),
+        editable=False,
+    )
+    duration_us = models.PositiveBigIntegerField(
+        verbose_name=_("Duration (µs)"),
+        help_text=_("How many microseconds the span took"),
+        editable=False,
+    )
+
+    request_id: uuid.UUID
+
+    class Meta:
+        verbose_name = _("Span")
+        verbose_name_plural = _("Spans")
+        ordering = ("request", "index")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["request", "index"], name="apm_span_request_index"
+            )
+        ]
+
+    def __str__(self):
+        return self.name
+
+    @property
+    def start(self) -> float:
+        """When the span started, in seconds since the request started"""
+        return self.start_us / 1_000_000
+
+    @property
+    def duration(self) -> float:
+        """How many seconds the span took"""
+        return self.duration_us / 1_000_000
+
+
+class StackProfile(ApmModel):
+    request = models.OneToOneField(
+        verbose_name=_("Request"),
+        to=ApiRequest,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="stack_profile",
+        editable=False,
+    )
+    stacks = models.TextField(
+        verbose_name=_("Stacks"),
+        help_text=_("The sampled stacks, in the collapsed (flamegraph) format"),
+        editable=False,
+    )
+    samples = models.PositiveIntegerField(
+        verbose_name=_("Samples"),
+        help_text=_("How many times the stack was sampled"),
+        editable=False,
+    )
+    interval = models.DecimalField(
+        max_digits=6,
+        decimal_places=4,
+        verbose_name=_("Interval"),
+        help_text=_("The seconds between each sample"),
+        editable=False,
+    )
+    overhead = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        verbose_name=_("Overhead"),
+        help_text=_("How much time the profiler spent sampling this request"),
+        editable=False,
+    )
+
+    request_id: uuid.UUID
+
+    class Meta:
+        verbose_name = _("Stack Profile")
+        verbose_name_plural = _("Stack Profiles")
+
+    def __str__(self):
+        return str(self.request_id)
+
+
+class ProfileStats(ApmModel):
+    request = models.OneToOneField(
+        verbose_name=_("Request"),
+        to=ApiRequest,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="profile_stats",
+        editable=False,
+    )
+    data = models.BinaryField(
+        verbose_name=_("Data"),
+        help_text=_("The zlib compressed pstats of the request"),
+        editable=False,
+    )
+    total_time = models.DecimalField(
+        max_digits=9,
+        decimal_places=6,
+        verbose_name=_("Total time"),
+        help_text=_("The time spent on all the profiled functions"),
+        editable=False,
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("Created at"),
+        default=timezone.now,
+        editable=False,
+    )
+
+    request_id: uuid.UUID
+
+    class Meta:
+        verbose_name = _("Profile Stats")
+        verbose_name_plural = _("Profile Stats")
+
+    def __str__(self):
+        return str(self.request_id)
+
+
+class ProfileToken(ApmModel):
+    """An issued profile token, deleted by the first request that uses it"""
+
+    nonce = models.CharField(
+        verbose_name=_("Nonce"),
+        max_length=32,
+        primary_key=True,
+        editable=False,
+    )
+    created_at = models.DateTimeField(
+        verbose_name=_("Created at"),
+        default=timezone.now,
+        editable=False,
+    )
+
+    class Meta:
+        verbose_name = _("Profile Token")
+        verbose_name_plural = _("Profile Tokens")
+
+    def __str__(self):
+        return self.nonce
+
+
+class DroppedRequestCount(ApmModel):
+    bucket = models.DateTimeField(
+        verbose_name=_("Bucket"),
+        help_text=_("The hour that the requests were made"),
+        editable=False,
+    )
+    view_name = models.CharField(
+        verbose_name=_("View name"),
+        help_text=_("The name of the function/class that handled the requests"),
+        max_length=255,
+        editable=False,
+    )
+    count = models.PositiveIntegerField(
+        verbose_name=_("Count"),
+        help_text=_("How many requests were not stored due to sampling"),
+        default=0,
+        editable=False,
+    )
+
+    class Meta:
+        verbose_name = _("Dropped Request Count")
+        verbose_name_plural = _("Dropped Request Counts")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "view_name"], name="apm_dropped_count_bucket_view"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.view_name} {self.bucket}"
+
+
+class QueryFingerprint(ApmModel):
+    view_name = models.CharField(
+        verbose_name=_("View name"),
+        help_text=_("The name of the function/class that ran the query"),
+        max_length=255,
+        editable=False,
+    )
+    fingerprint = models.CharField(
+        verbose_name=_("Fingerprint"),
+        help_text=_("The SHA-1 of the normalized query"),
+        max_length=40,
+        editable=False,
+    )
+    sql = models.TextField(
+        verbose_name=_("SQL"),
+        help_text=_("The query, without its literals"),
+        editable=False,
+    )
+    count = models.PositiveBigIntegerField(
+        verbose_name=_("Count"),
+        help_text=_("How many times the query ran"),
+        default=0,
+        editable=False,
+    )
+    total_time = models.DecimalField(
+        max_digits=16,
+        decimal_places=6,
+        verbose_name=_("Total time"),
+        help_text=_("How much time the query took, summed"),
+        default=0,
+        editable=False,
+    )
+    requests = models.PositiveBigIntegerField(
+        verbose_name=_("Requests"),
+        help_text=_("On how many requests the query ran"),
+        default=0,
+        editable=False,
+    )
+    max_per_request = models.PositiveIntegerField(
+        verbose_name=_("Max per request"),
+        help_text=_("The most times the query ran on a single request"),
+        default=0,
+        editable=False,
+    )
+    last_seen_at = models.DateTimeField(
+        verbose_name=_("Last seen at"),
+        default=timezone.now,
+        editable=False,
+    )
+
+    class Meta:
+        verbose_name = _("Query Fingerprint")
+        verbose_name_plural = _("Query Fingerprints")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["view_name", "fingerprint"], name="apm_query_view_fingerprint"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.view_name} {self.fingerprint[:8]}"
+
+
+class MetricRollup(ApmModel):
+    """The requests of a time bucket, aggregated per view, method and status class"""
+
+    bucket = models.DateTimeField(
+        verbose_name=_("Bucket"),
+        help_text=_("The start of the period that the requests were made"),
+        editable=False,
+    )
+    view_name = models.CharField(
+        verbose_name=_("View name"),
+        help_text=_("The name of the function/class that handled the requests"),
+        max_length=255,
+        editable=False,
+    )
+    method = models.CharField(
+        verbose_name=_("HTTP Method"),
+        max_length=7,
+        editable=False,
+    )
+    status_class = models.PositiveSmallIntegerField(
+        verbose_name=_("Status class"),
+        help_text=_("The hundreds of the status codes, e.g. 5 for 5xx"),
+        editable=False,
+    )
+    count = models.PositiveIntegerField(
+        verbose_name=_("Count"),
+        help_text=_("How many requests were made"),
+        default=0,
+        editable=False,
+    )
+    errors = models.PositiveIntegerField(
+        verbose_name=_("Errors"),
+        help_text=_("How many requests raised an exception"),
+        default=0,
+        editable=False,
+    )
+    ellapsed_sum_us = models.PositiveBigIntegerField(
+        verbose_name=_("Ellapsed sum (µs)"),
+        help_text=_("How many microseconds the server took to respond, summed"),
+        default=0,
+        editable=False,
+    )
+    ellapsed_min_us = models.PositiveBigIntegerField(
+        verbose_name=_("Ellapsed min (µs)"),
+        editable=False,
+    )
+    ellapsed_max_us = models.PositiveBigIntegerField(
+        verbose_name=_("Ellapsed max (µs)"),
+        editable=False,
+    )
+    histogram = models.JSONField(
+        verbose_name=_("Histogram"),
+        help_text=_(
+            "How many requests took up to each of `rollups.LATENCY_BOUNDS` seconds, "
+            "the last one counts the slower requests"
+        ),
+        default=list,
+        editable=False,
+    )
+    sketch = models.JSONField(
+        verbose_name=_("Latency sketch"),
+        help_text=_("The bins of the ellapsed times, to estimate their percentiles"),
+        null=True,
+        editable=False,
+    )
+
+    class Meta:
+        abstract = True
+        constraints = [
+            models.UniqueConstraint(
+                fields=["bucket", "view_name", "method", "status_class"],
+                name="%(app_label)s_%(class)s_key",
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.view_name} {self.method} {self.status_class}xx {self.bucket}"
+
+
+class MinuteRollup(MetricRollup):
+    class Meta(MetricRollup.Meta):
+        verbose_name = _("Minute Rollup")
+        verbose_name_plural = _("Minute Rollups")
+
+
+class HourRollup(MetricRollup):
+    class Meta(MetricRollup.Meta):
+        verbose_name = _("Hour Rollup")
+        verbose_name_plural = _("Hour Rollups")
 
 
 class Integration(ApmModel):
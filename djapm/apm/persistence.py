@@ -0,0 +1,139 @@
+import logging
+from datetime import timedelta
+from time import monotonic, perf_counter
+from typing import Any, Dict, Iterable, List, Optional, Type
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.utils import timezone
+
+from djapm.apm import blobs, dflt_conf, models, shards
+from djapm.apm.spool import Record, Spool
+
+
+__all__ = ("bulk_save", "save", "get_spool")
+
+
+logger = logging.getLogger(__name__)
+
+# The values of the records that are stored as blobs, and the foreign keys to them
+BLOB_FIELDS: Dict[Type[models.ApmModel], Dict[str, str]] = {
+    models.ApiRequest: {"headers": "headers_blob_id"},
+    models.ApiResponse: {"body": "body_blob_id"},
+    models.ErrorTrace: {"payload": "payload_blob_id", "traceback": "traceback_blob_id"},
+}
+
+# The reused blobs older than this have their `created_at` refreshed, so `apm_prune`
+# (that keeps the blobs of the last hour) doesn't delete them under the rows being written
+BLOB_REFRESH_AGE = timedelta(minutes=10)
+
+# While the database is degraded (failed or over the latency budget), records go to the spool
+_degraded_until = 0.0
+
+
+def bulk_save(records: Iterable[Record]) -> None:
+    """Creates the rows of the `records` using `bulk_create`, ignoring the already existing ones.
+    Rows are grouped by model in the order they first appear,
+    so parents (`ApiRequest`) are always created before their children.
+    The `BLOB_FIELDS` values are stored on their `Blob`s, created (or refreshed, when
+    reused) before anything else.
+    When `APM_SHARD_DAYS` is set, the successful requests go to the shard of their day."""
+    sharded = shards.enabled()
+    codec = blobs.get_codec()
+    batches: Dict[Type[models.ApmModel], List[models.ApmModel]] = {}
+    blob_objs: Dict[str, models.Blob] = {}
+    for record in records:
+        record = _pack_blobs(record, codec, blob_objs)
+        if sharded:
+            record = shards.route(record)
+        for model, fields in record:
+            batches.setdefault(model, []).append(model(**fields))
+
+    if blob_objs:
+        models.Blob.objects.bulk_create(blob_objs.values(), ignore_conflicts=True)
+        now = timezone.now()
+        models.Blob.objects.filter(
+            digest__in=blob_objs, created_at__lt=now - BLOB_REFRESH_AGE
+        ).update(created_at=now)
+    for model, objs in batches.items():
+        model.objects.bulk_create(objs, ignore_conflicts=True)
+
+
+def _pack_blobs(
+    record: Record, codec: str, blob_objs: Dict[str, models.Blob]
+) -> Record:
+    """Replaces the `BLOB_FIELDS` values of the `record` by the digests of their blobs,
+    that are added to `blob_objs`. The record itself is left untouched, since it's
+    written as is to the spool when the transaction fails."""
+    packed: Record = []
+    for model, fields in record:
+        names = BLOB_FIELDS.get(model, {})
+        if any(name in fields for name in names):
+            fields = dict(fields)
+            for name, attname in names.items():
+                if name in fields:
+                    fields[attname] = _blob_digest(fields.pop(name), codec, blob_objs)
+        packed.append((model, fields))
+    return packed
+
+
+def _blob_digest(
+    value: Any, codec: str, blob_objs: Dict[str, models.Blob]
+) -> Optional[str]:
+    if value is None:
+        return None
+    blob = blobs.pack(value, codec)
+    blob_objs.setdefault(blob["digest"], models.Blob(**blob))
+    return blob["digest"]
+
+
+def get_spool() -> Optional[Spool]:
+    """Returns the `Spool` on `APM_SPOOL_DIR`, if set"""
+    directory = getattr(settings, "APM_SPOOL_DIR", dflt_conf.APM_SPOOL_DIR)
+    if not directory:
+        return None
+    return Spool(directory)
+
+
+def save(record: Record) -> bool:
+    """Saves the `record` on the database, in a single transaction.
+    When `APM_SPOOL_DIR` is set, the record is written to the spool instead if the database
+    fails, and the following records too for `APM_SPOOL_COOLDOWN` seconds.
+    The same happens when a write takes longer than `APM_SPOOL_LATENCY_BUDGET` seconds.
+    Returns `False` when the record was spooled."""
+    global _degraded_until
+
+    spool = get_spool()
+    if spool is None:
+        _save(record)
+        return True
+
+    if monotonic() < _degraded_until:
+        spool.write(record)
+        return False
+
+    cooldown = getattr(settings, "APM_SPOOL_COOLDOWN", dflt_conf.APM_SPOOL_COOLDOWN)
+    started = perf_counter()
+    try:
+        _save(record)
+    except DatabaseError:
+        logger.exception("Failed to save the APM record, writing it to the spool")
+        _degraded_until = monotonic() + cooldown
+        spool.write(record)
+        return False
+
+    budget = getattr(
+        settings, "APM_SPOOL_LATENCY_BUDGET", dflt_conf.APM_SPOOL_LATENCY_BUDGET
+    )
+    if budget is not None and perf_counter() - started > budget:
+        logger.warning(
+            "The APM database is over the latency budget, spooling for %ss", cooldown
+        )
+        _degraded_until = monotonic() + cooldown
+    return True
+
+
+def _save(record: Record) -> None:
+    database_alias = getattr(settings, "APM_USE_DATABASE", dflt_conf.APM_USE_DATABASE)
+    with transaction.atomic(using=database_alias):
+        bulk_save([record])
@@ -0,0 +1,161 @@
+import os
+import sys
+import threading
+from collections import Counter
+from functools import lru_cache
+from time import perf_counter, sleep
+from types import CodeType, FrameType
+from typing import Dict, List, Optional
+
+from django.conf import settings
+
+from djapm.apm import dflt_conf, models, registry
+from djapm.apm.spool import Row
+
+
+__all__ = ("Samples", "StackSampler", "enabled", "get_sampler")
+
+
+MAX_DEPTH = 128
+
+
+class Samples:
+    """The collapsed stacks sampled from a request thread"""
+
+    __slots__ = ("thread_id", "stacks", "overhead")
+
+    def __init__(self, thread_id: int):
+        self.thread_id = thread_id
+        self.stacks: "Counter[str]" = Counter()
+        # The time the sampler spent on this request, in seconds
+        self.overhead = 0.0
+
+    def collapsed(self) -> str:
+        """The stacks in the collapsed (flamegraph) format: `root;...;leaf count` per line"""
+        return "\n".join(f"{stack} {count}" for stack, count in self.stacks.items())
+
+    def row(self, request_id: str, interval: float) -> Row:
+        return (
+            models.StackProfile,
+            {
+                "request_id": request_id,
+                "stacks": self.collapsed(),
+                "samples": sum(self.stacks.values()),
+                "interval": interval,
+                "overhead": self.overhead,
+            },
+        )
+
+
+class StackSampler:
+    """Samples the stacks of the in-flight requests threads each `interval` seconds,
+    using `sys._current_frames`, from a background thread.
+    The thread only wakes up while there's a request being sampled."""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.ticks = 0
+        self.busy = 0.0
+        self._active: Dict[int, Samples] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+
+    @property
+    def overhead(self) -> float:
+        """The average time (seconds) spent on each sampling tick"""
+        return self.busy / self.ticks if self.ticks else 0.0
+
+    def start(self) -> Samples:
+        """Starts sampling the current thread"""
+        samples = Samples(threading.get_ident())
+        self._ensure_thread()
+        with self._lock:
+            self._active[samples.thread_id] = samples
+            self._wakeup.set()
+        return samples
+
+    def stop(self, samples: Samples) -> None:
+        """Stops sampling, its `samples` are not changed anymore after returning"""
+        with self._lock:
+            if self._active.get(samples.thread_id) is samples:
+                del self._active[samples.thread_id]
+
+    def _ensure_thread(self) -> None:
+        if self._thread is not None and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                # Threads don't survive a fork
+                self._active.clear()
+                self._pid = os.getpid()
+                self._thread = threading.Thread(
+                    target=self._run, name="djapm-profiler", daemon=True
+                )
+                self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            self._wakeup.wait()
+            with self._lock:
+                active = list(self._active.values())
+                if not active:
+                    self._wakeup.clear()
+                    continue
+            self._sample(active)
+            sleep(self.interval)
+
+    def _sample(self, active: List[Samples]) -> None:
+        started = perf_counter()
+        frames = sys._current_frames()
+        stacks = {
+            samples.thread_id: _collapse(frames.get(samples.thread_id))
+            for samples in active
+            if samples.thread_id in frames
+        }
+        del frames
+        spent = perf_counter() - started
+        # Under the lock, so the samples are never changed once `stop` returns
+        with self._lock:
+            self.ticks += 1
+            self.busy += spent
+            for samples in active:
+                if self._active.get(samples.thread_id) is not samples:
+                    continue
+                if samples.thread_id in stacks:
+                    samples.stacks[stacks[samples.thread_id]] += 1
+                samples.overhead += spent / len(active)
+
+
+def _collapse(frame: Optional[FrameType]) -> str:
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_label(frame.f_code))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+@lru_cache(maxsize=4096)
+def _label(code: CodeType) -> str:
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ",")
+
+
+def enabled() -> bool:
+    return registry.get_settings().profiler_threshold is not None
+
+
+_sampler: Optional[StackSampler] = None
+
+
+def get_sampler() -> StackSampler:
+    """Returns the process-wide `StackSampler`"""
+    global _sampler
+    if _sampler is None:
+        _sampler = StackSampler(
+            interval=getattr(
+                settings, "APM_PROFILER_INTERVAL", dflt_conf.APM_PROFILER_INTERVAL
+            )
+        )
+    return _sampler
@@ -0,0 +1,163 @@
+import cProfile
+import logging
+import marshal
+import secrets
+import threading
+import zlib
+from datetime import timedelta
+from typing import Any, Dict, List, Optional
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.http import QueryDict
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, models, types
+from djapm.apm.spool import Row
+
+
+__all__ = (
+    "HEADER",
+    "QUERY_PARAMETER",
+    "afinish",
+    "finish",
+    "load",
+    "make_token",
+    "query_parameters",
+    "query_string",
+    "row",
+    "start",
+    "top",
+)
+
+
+logger = logging.getLogger(__name__)
+
+HEADER = "X-Apm-Profile"
+QUERY_PARAMETER = "apm_profile"
+SALT = "djapm.apm.profiling"
+
+
+def _max_age() -> int:
+    return getattr(
+        settings, "APM_PROFILE_TOKEN_MAX_AGE", dflt_conf.APM_PROFILE_TOKEN_MAX_AGE
+    )
+
+
+def make_token(user) -> str:
+    """A token that marks a single request to be profiled,
+    valid for `APM_PROFILE_TOKEN_MAX_AGE`"""
+    models.ProfileToken.objects.filter(
+        created_at__lt=timezone.now() - timedelta(seconds=_max_age())
+    ).delete()
+    nonce = secrets.token_hex(16)
+    models.ProfileToken.objects.create(nonce=nonce)
+    return signing.TimestampSigner(salt=SALT).sign(f"{user.pk}:{nonce}")
+
+
+def _consume(token: str) -> bool:
+    """Whether the `token` is valid, it can't be used again afterwards"""
+    try:
+        value = signing.TimestampSigner(salt=SALT).unsign(token, max_age=_max_age())
+        user_pk, nonce = value.rsplit(":", 1)
+    except (signing.BadSignature, ValueError):
+        logger.warning("Ignoring an invalid or expired APM profile token")
+        return False
+    deleted, _ = models.ProfileToken.objects.filter(nonce=nonce).delete()
+    if not deleted:
+        logger.warning("Ignoring an already used APM profile token")
+        return False
+    # The token may have been issued before the user lost its privileges
+    return (
+        get_user_model()
+        ._default_manager.filter(pk=user_pk, is_active=True, is_superuser=True)
+        .exists()
+    )
+
+
+def start(request: types.PatchedHttpRequest) -> None:
+    """Starts a `cProfile` of the request, when it carries a valid profile token.
+    Profiled requests are always kept by the sampling."""
+    token = request.headers.get(HEADER) or request.GET.get(QUERY_PARAMETER)
+    if not token or not _consume(token):
+        return
+    profile = cProfile.Profile()
+    request._apm_cprofile = profile
+    request._apm_cprofile_thread = threading.get_ident()  # type: ignore
+    request.apm_sampled = True
+    profile.enable()
+
+
+def query_parameters(request: types.PatchedHttpRequest) -> QueryDict:
+    """The query parameters of the `request`, without the profile token"""
+    if QUERY_PARAMETER not in request.GET:
+        return request.GET
+    parameters = request.GET.copy()
+    del parameters[QUERY_PARAMETER]
+    return parameters
+
+
+def query_string(request: types.PatchedHttpRequest) -> str:
+    """The query string of the `request`, without the profile token"""
+    if QUERY_PARAMETER not in request.GET:
+        return request.META.get("QUERY_STRING", "")
+    return query_parameters(request).urlencode()
+
+
+def finish(request: types.PatchedHttpRequest) -> None:
+    """Stops the profile of the request, if any, keeping its stats to be saved"""
+    profile: Optional[cProfile.Profile] = getattr(request, "_apm_cprofile", None)
+    if profile is None:
+        return
+    profile.disable()
+    profile.create_stats()
+    request._apm_cprofile = None
+    request._apm_cprofile_stats = profile.stats  # type: ignore
+
+
+async def afinish(request: types.PatchedHttpRequest) -> None:
+    """`finish` for async mode: the profile is stopped on the thread that started it,
+    that's the sync thread of the request when the view is sync"""
+    if getattr(request, "_apm_cprofile", None) is None:
+        return
+    if getattr(request, "_apm_cprofile_thread", None) == threading.get_ident():
+        finish(request)
+    else:
+        await sync_to_async(finish)(request)
+
+
+def row(request: types.PatchedHttpRequest) -> Optional[Row]:
+    """The `ProfileStats` row of the request, if it was profiled"""
+    stats = getattr(request, "_apm_cprofile_stats", None)
+    if stats is None:
+        return None
+    return (
+        models.ProfileStats,
+        {
+            "request_id": request.id,
+            "data": zlib.compress(marshal.dumps(stats)),
+            "total_time": sum(tt for _, _, tt, _, _ in stats.values()),
+        },
+    )
+
+
+def load(data: bytes) -> Dict[Any, Any]:
+    """The pstats dict of a `ProfileStats.data`, as written by `pstats.Stats.dump_stats`"""
+    return marshal.loads(zlib.decompress(data))
+
+
+def top(data: bytes, n: int = 20) -> List[Dict[str, Any]]:
+    """The `n` functions with the most cumulative time"""
+    stats = load(data)
+    ordered = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)
+    return [
+        {
+            "function": f"{func} ({file}:{line})",
+            "calls": nc,
+            "total_time": tt,
+            "cumulative_time": ct,
+        }
+        for (file, line, func), (cc, nc, tt, ct, callers) in ordered[:n]
+    ]
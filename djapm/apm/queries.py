@@ -0,0 +1,242 @@
+import atexit
+import hashlib
+import logging
+import os
+import re
+import threading
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from decimal import Decimal
+from functools import lru_cache
+from time import monotonic, perf_counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, models, registry, writer
+
+
+__all__ = (
+    "QueryStats",
+    "QueryFingerprintCounter",
+    "counter",
+    "enabled",
+    "fingerprint",
+    "paused",
+)
+
+
+logger = logging.getLogger(__name__)
+
+_STRING = re.compile(r"'(?:''|[^'])*'")
+_NUMBER = re.compile(r"(?<![\w.])\d+(?:\.\d+)?(?![\w.])")
+_PLACEHOLDER = re.compile(r"%s|%\(\w+\)s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.IGNORECASE)
+_VALUES_LIST = re.compile(
+    r"\bVALUES\s*\([?,\s]*\)(?:\s*,\s*\([?,\s]*\))*", re.IGNORECASE
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+@lru_cache(maxsize=2048)
+def fingerprint(sql: str) -> str:
+    """Normalizes the `sql`, so the same query with different values has the same fingerprint:
+    literals and placeholders become `?`, and `IN`/`VALUES` lists are collapsed."""
+    sql = _STRING.sub("?", sql)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (...)", sql)
+    sql = _VALUES_LIST.sub("VALUES (...)", sql)
+    return _WHITESPACE.sub(" ", sql).strip()
+
+
+def fingerprint_hash(normalized: str) -> str:
+    return hashlib.sha1(normalized.encode()).hexdigest()
+
+
+_paused: ContextVar[bool] = ContextVar("djapm_queries_paused", default=False)
+
+
+def enabled() -> bool:
+    return registry.get_settings().track_queries
+
+
+@contextmanager
+def paused():
+    """The queries executed inside this block are not counted, used on the APM own writes"""
+    token = _paused.set(True)
+    try:
+        yield
+    finally:
+        _paused.reset(token)
+
+
+class QueryStats:
+    """Counts the queries, and sums their time, per database alias.
+    It's installed as an `execute_wrapper` on every connection of the current thread
+    between `start` and `stop`."""
+
+    __slots__ = ("aliases", "fingerprints", "_stack")
+
+    def __init__(self):
+        # alias: [count, time]
+        self.aliases: Dict[str, List[Any]] = {}
+        # fingerprint: [count, time], the raw sql is not kept
+        self.fingerprints: Dict[str, List[Any]] = {}
+        self._stack: Optional[ExitStack] = None
+
+    def __call__(self, execute, sql, params, many, context):
+        if _paused.get():
+            return execute(sql, params, many, context)
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            ellapsed = perf_counter() - started
+            stats = self.aliases.setdefault(context["connection"].alias, [0, 0.0])
+            stats[0] += 1
+            stats[1] += ellapsed
+            # Cached, so the same query is only normalized once
+            stats = self.fingerprints.setdefault(fingerprint(sql), [0, 0.0])
+            stats[0] += 1
+            stats[1] += ellapsed
+
+    def start(self) -> None:
+        self._stack = ExitStack()
+        for connection in connections.all():
+            self._stack.enter_context(connection.execute_wrapper(self))
+
+    def stop(self) -> None:
+        if self._stack is not None:
+            self._stack.close()
+            self._stack = None
+
+    @property
+    def count(self) -> int:
+        return sum(count for count, _ in self.aliases.values())
+
+    @property
+    def time(self) -> float:
+        return sum(time for _, time in self.aliases.values())
+
+    def normalized(self) -> Dict[str, List[Any]]:
+        """The count and time of each query fingerprint"""
+        return self.fingerprints
+
+    def repeated(self) -> List[Dict[str, Any]]:
+        """The fingerprints that ran more than `APM_N_PLUS_ONE_THRESHOLD` times,
+        most likely a N+1 queries problem."""
+        threshold = registry.get_settings().n_plus_one_threshold
+        return [
+            {
+                "fingerprint": fingerprint_hash(sql),
+                "sql": sql,
+                "count": count,
+                "time": round(time, 6),
+            }
+            for sql, (count, time) in self.normalized().items()
+            if count > threshold
+        ]
+
+    def as_fields(self) -> Dict[str, Any]:
+        """The `ApiResponse` fields of these stats"""
+        return {
+            "db_query_count": self.count,
+            "db_time_us": round(self.time * 1_000_000),
+            "db_aliases": {
+                alias: {"count": count, "time": round(time, 6)}
+                for alias, (count, time) in self.aliases.items()
+            },
+            "db_repeated_queries": self.repeated() or None,
+        }
+
+
+class QueryFingerprintCounter:
+    """Aggregates in memory the queries fingerprints of each view.
+    The aggregates are periodically added to the `QueryFingerprint` model, by the
+    `ApmWriter` thread, that's the "top queries" table of each view."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        # (view_name, sql): [count, time, requests, max per request]
+        self._stats: Dict[Tuple[str, str], List[Any]] = {}
+        self._lock = threading.Lock()
+        self._last_flush = monotonic()
+        self._scheduled_pid: Optional[int] = None
+
+    def add(self, view_name: str, stats: QueryStats) -> None:
+        normalized = stats.normalized()
+        with self._lock:
+            for sql, (count, time) in normalized.items():
+                aggregate = self._stats.setdefault((view_name, sql), [0, 0.0, 0, 0])
+                aggregate[0] += count
+                aggregate[1] += time
+                aggregate[2] += 1
+                aggregate[3] = max(aggregate[3], count)
+        if self._scheduled_pid != os.getpid():
+            writer.get_writer().add_flusher(self.flush_if_due)
+            self._scheduled_pid = os.getpid()
+
+    def flush_if_due(self) -> None:
+        if monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            aggregates, self._stats = self._stats, {}
+            self._last_flush = monotonic()
+        try:
+            with paused():
+                for (view_name, sql), aggregate in aggregates.items():
+                    self._increment(view_name, sql, *aggregate)
+        except Exception:
+            logger.exception("Failed to persist the APM query fingerprints")
+
+    @staticmethod
+    def _increment(
+        view_name: str, sql: str, count: int, time: float, requests: int, max_count: int
+    ) -> None:
+        hash = fingerprint_hash(sql)
+        total_time = Decimal(time).quantize(Decimal("0.000001"))
+        now = timezone.now()
+        queryset = models.QueryFingerprint.objects.filter(
+            view_name=view_name, fingerprint=hash
+        )
+        changes = {
+            "count": F("count") + count,
+            "total_time": F("total_time") + total_time,
+            "requests": F("requests") + requests,
+            "max_per_request": Greatest(F("max_per_request"), max_count),
+            "last_seen_at": now,
+        }
+        if queryset.update(**changes):
+            return
+        try:
+            with transaction.atomic(using=queryset.db):
+                models.QueryFingerprint.objects.create(
+                    view_name=view_name,
+                    fingerprint=hash,
+                    sql=sql,
+                    count=count,
+                    total_time=total_time,
+                    requests=requests,
+                    max_per_request=max_count,
+                    last_seen_at=now,
+                )
+        except IntegrityError:
+            # Another worker created it in the meantime
+            queryset.update(**changes)
+
+
+counter = QueryFingerprintCounter(
+    flush_interval=getattr(
+        settings,
+        "APM_QUERY_FINGERPRINTS_FLUSH_INTERVAL",
+        dflt_conf.APM_QUERY_FINGERPRINTS_FLUSH_INTERVAL,
+    )
+)
+atexit.register(counter.flush)
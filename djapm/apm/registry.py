@@ -0,0 +1,172 @@
+import logging
+from typing import Any, Dict, Optional, Tuple
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+from djapm.apm import dflt_conf, log, sampling
+
+
+__all__ = ("ApmSettings", "ViewConfig", "get_config", "get_settings")
+
+
+class ViewConfig:
+    """The APM configuration of a view, built once per view and cached on the registry,
+    so tracking a request doesn't have to look up the settings again."""
+
+    __slots__ = (
+        "view_name",
+        "logger",
+        "capture_max_records",
+        "capture_level",
+        "save_headers",
+        "save_query_parameters",
+        "save_query_string",
+        "sampling_rate",
+        "keep_slower_than",
+    )
+
+    def __init__(self, view_name: str, logger_name: Optional[str]):
+        self.view_name = view_name
+        self.logger = logging.getLogger(
+            logger_name
+            or getattr(
+                settings, "APM_DEFAULT_LOGGER_NAME", dflt_conf.APM_DEFAULT_LOGGER_NAME
+            )
+        )
+        log.install_handler(self.logger)
+        self.capture_max_records = getattr(
+            settings,
+            "APM_LOG_CAPTURE_MAX_RECORDS",
+            dflt_conf.APM_LOG_CAPTURE_MAX_RECORDS,
+        )
+        self.capture_level = log._get_level(
+            getattr(settings, "APM_LOG_CAPTURE_LEVEL", dflt_conf.APM_LOG_CAPTURE_LEVEL)
+        )
+        self.save_headers = getattr(
+            settings,
+            "APM_REQUEST_SAVE_HEADERS",
+            dflt_conf.APM_REQUEST_SAVE_HEADERS,
+        )
+        self.save_query_parameters = getattr(
+            settings,
+            "APM_REQUEST_SAVE_QUERY_PARAMETERS",
+            dflt_conf.APM_REQUEST_SAVE_QUERY_PARAMETERS,
+        )
+        self.save_query_string = getattr(
+            settings,
+            "APM_REQUEST_SAVE_QUERY_STRING",
+            dflt_conf.APM_REQUEST_SAVE_QUERY_STRING,
+        )
+        self.sampling_rate = sampling.get_rate(view_name)
+        self.keep_slower_than = getattr(
+            settings,
+            "APM_SAMPLING_KEEP_SLOWER_THAN",
+            dflt_conf.APM_SAMPLING_KEEP_SLOWER_THAN,
+        )
+
+
+class ApmSettings:
+    """The APM settings read on every request that aren't specific to a view,
+    built once per process, so the instruments don't have to look up the settings again."""
+
+    __slots__ = (
+        "auto_instrument",
+        "collector_address",
+        "live_counters",
+        "max_spans",
+        "memory_sampling_rate",
+        "memory_top_allocations",
+        "n_plus_one_threshold",
+        "profiler_threshold",
+        "request_id_version",
+        "rollups",
+        "server_timing",
+        "track_queries",
+        "write_behind",
+    )
+
+    def __init__(self):
+        self.auto_instrument = getattr(
+            settings, "APM_AUTO_INSTRUMENT", dflt_conf.APM_AUTO_INSTRUMENT
+        )
+        self.collector_address = getattr(
+            settings, "APM_COLLECTOR_ADDRESS", dflt_conf.APM_COLLECTOR_ADDRESS
+        )
+        self.live_counters = getattr(
+            settings, "APM_LIVE_COUNTERS", dflt_conf.APM_LIVE_COUNTERS
+        )
+        self.max_spans = getattr(
+            settings, "APM_MAX_SPANS_PER_REQUEST", dflt_conf.APM_MAX_SPANS_PER_REQUEST
+        )
+        self.memory_sampling_rate = getattr(
+            settings, "APM_MEMORY_SAMPLING_RATE", dflt_conf.APM_MEMORY_SAMPLING_RATE
+        )
+        self.memory_top_allocations = getattr(
+            settings,
+            "APM_MEMORY_TOP_ALLOCATIONS",
+            dflt_conf.APM_MEMORY_TOP_ALLOCATIONS,
+        )
+        self.n_plus_one_threshold = getattr(
+            settings, "APM_N_PLUS_ONE_THRESHOLD", dflt_conf.APM_N_PLUS_ONE_THRESHOLD
+        )
+        self.profiler_threshold = getattr(
+            settings, "APM_PROFILER_THRESHOLD", dflt_conf.APM_PROFILER_THRESHOLD
+        )
+        self.request_id_version = getattr(
+            settings, "APM_REQUEST_ID_VERSION", dflt_conf.APM_REQUEST_ID_VERSION
+        )
+        self.rollups = getattr(settings, "APM_ROLLUPS", dflt_conf.APM_ROLLUPS)
+        self.server_timing = getattr(
+            settings, "APM_SERVER_TIMING", dflt_conf.APM_SERVER_TIMING
+        )
+        self.track_queries = getattr(
+            settings, "APM_TRACK_QUERIES", dflt_conf.APM_TRACK_QUERIES
+        )
+        self.write_behind = getattr(
+            settings, "APM_WRITE_BEHIND", dflt_conf.APM_WRITE_BEHIND
+        )
+
+
+_registry: Dict[Tuple[Any, str, Optional[str]], ViewConfig] = {}
+_settings: Optional[ApmSettings] = None
+
+
+def get_config(view: Any, prefix: str, logger_name: Optional[str]) -> ViewConfig:
+    """Returns the `ViewConfig` of the `view`, building it on the first request"""
+    # Class-based views are given as instances, that change on every request
+    key = (view if hasattr(view, "__name__") else view.__class__, prefix, logger_name)
+    config = _registry.get(key)
+    if config is None:
+        app, view_name = _app_view_name_from_view(view)
+        config = _registry[key] = ViewConfig(
+            ".".join((app, prefix, view_name)), logger_name
+        )
+    return config
+
+
+def get_settings() -> ApmSettings:
+    """Returns the `ApmSettings` of the process, building it on the first call"""
+    global _settings
+    if _settings is None:
+        _settings = ApmSettings()
+    return _settings
+
+
+def _app_view_name_from_view(view: Any) -> Tuple[str, str]:
+    app, *mod = view.__module__.split(".")
+
+    view_name = getattr(view, "__name__", getattr(view.__class__, "__name__", "View"))
+    if hasattr(view, "view_class"):
+        view_name = view.view_class.__name__
+
+    return app, view_name
+
+
+@receiver(setting_changed)
+def _clear_registry(*, setting: str, **kwargs):
+    global _settings
+    if setting.startswith("APM_"):
+        _registry.clear()
+        _settings = None
@@ -0,0 +1,345 @@
+import atexit
+import logging
+import os
+import threading
+from bisect import bisect_left
+from datetime import datetime, timedelta, timezone as dt_timezone
+from time import monotonic
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Type
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, F, QuerySet, Value
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, models, registry, shards, writer
+from djapm.apm.sketch import LatencySketch
+
+
+__all__ = (
+    "LATENCY_BOUNDS",
+    "Rollup",
+    "RollupCounter",
+    "enabled",
+    "rebuild",
+    "fold",
+    "counter",
+)
+
+
+logger = logging.getLogger(__name__)
+
+# The upper bounds, in seconds, of the histogram bins. An extra bin counts the slower ones
+LATENCY_BOUNDS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+RESOLUTIONS: Tuple[Type[models.MetricRollup], ...] = (
+    models.MinuteRollup,
+    models.HourRollup,
+)
+
+# (bucket, view_name, method, status_class)
+Key = Tuple[datetime, str, str, int]
+Rollups = Dict[Type[models.MetricRollup], Dict[Key, "Rollup"]]
+
+
+def enabled() -> bool:
+    return registry.get_settings().rollups
+
+
+def truncate(at: datetime, model: Type[models.MetricRollup]) -> datetime:
+    """The bucket of `model` that `at` falls into"""
+    if model is models.MinuteRollup:
+        return at.replace(second=0, microsecond=0)
+    return at.replace(minute=0, second=0, microsecond=0)
+
+
+class Rollup:
+    """The aggregates of the requests of a bucket, that can be merged with others"""
+
+    __slots__ = ("count", "errors", "sum", "min", "max", "histogram", "sketch")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.sum = 0.0
+        self.min = float("inf")
+        self.max = 0.0
+        self.histogram = [0] * (len(LATENCY_BOUNDS) + 1)
+        self.sketch = LatencySketch()
+
+    def add(self, ellapsed: float, error: bool) -> None:
+        self.count += 1
+        self.errors += error
+        self.sum += ellapsed
+        self.min = min(self.min, ellapsed)
+        self.max = max(self.max, ellapsed)
+        self.histogram[bisect_left(LATENCY_BOUNDS, ellapsed)] += 1
+        self.sketch.add(ellapsed)
+
+    def merge(self, other: "Rollup") -> None:
+        self.count += other.count
+        self.errors += other.errors
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.histogram = [a + b for a, b in zip(self.histogram, other.histogram)]
+        self.sketch.merge(other.sketch)
+
+    @classmethod
+    def from_instance(cls, instance: models.MetricRollup) -> "Rollup":
+        rollup = cls()
+        rollup.count = instance.count
+        rollup.errors = instance.errors
+        rollup.sum = instance.ellapsed_sum_us / 1_000_000
+        rollup.min = instance.ellapsed_min_us / 1_000_000
+        rollup.max = instance.ellapsed_max_us / 1_000_000
+        if len(instance.histogram) == len(rollup.histogram):
+            rollup.histogram = list(instance.histogram)
+        rollup.sketch = LatencySketch.from_dict(instance.sketch)
+        return rollup
+
+    def as_fields(self) -> dict:
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "ellapsed_sum_us": round(self.sum * 1_000_000),
+            "ellapsed_min_us": round(self.min * 1_000_000),
+            "ellapsed_max_us": round(self.max * 1_000_000),
+            "histogram": self.histogram,
+            "sketch": self.sketch.to_dict(),
+        }
+
+
+def _accumulate(
+    rollups: Rollups,
+    view_name: str,
+    method: str,
+    status_code: int,
+    ellapsed: float,
+    error: bool,
+    at: datetime,
+) -> None:
+    for model, buckets in rollups.items():
+        key = (truncate(at, model), view_name, method, status_code // 100)
+        rollup = buckets.get(key)
+        if rollup is None:
+            rollup = buckets[key] = Rollup()
+        rollup.add(ellapsed, error)
+
+
+class RollupCounter:
+    """Aggregates in memory the requests of each minute and hour.
+    The aggregates are periodically merged into the `MinuteRollup` and `HourRollup` models,
+    by the `ApmWriter` thread, that the dashboard reads instead of the requests,
+    when `APM_ROLLUPS` is enabled."""
+
+    def __init__(
+        self,
+        flush_interval: float,
+        resolutions: Tuple[Type[models.MetricRollup], ...] = RESOLUTIONS,
+    ):
+        self.flush_interval = flush_interval
+        self.resolutions = resolutions
+        self._rollups: Rollups = {model: {} for model in resolutions}
+        self._lock = threading.Lock()
+        self._last_flush = monotonic()
+        self._scheduled_pid: Optional[int] = None
+
+    def add(
+        self,
+        view_name: str,
+        method: str,
+        status_code: int,
+        ellapsed: float,
+        error: bool,
+        at: Optional[datetime] = None,
+    ) -> None:
+        at = at or timezone.now()
+        with self._lock:
+            _accumulate(
+                self._rollups, view_name, method, status_code, ellapsed, error, at
+            )
+        if self._scheduled_pid != os.getpid():
+            writer.get_writer().add_flusher(self.flush_if_due)
+            self._scheduled_pid = os.getpid()
+
+    def flush_if_due(self) -> None:
+        if monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            pending = self._rollups
+            self._rollups = {model: {} for model in self.resolutions}
+            self._last_flush = monotonic()
+        for model, rollups in pending.items():
+            for key, rollup in rollups.items():
+                # One failing row doesn't lose the others
+                try:
+                    self._merge(model, key, rollup)
+                except Exception:
+                    logger.exception("Failed to persist the APM rollup %s", key)
+
+    @staticmethod
+    def _merge(model: Type[models.MetricRollup], key: Key, rollup: Rollup) -> None:
+        bucket, view_name, method, status_class = key
+        lookup = {
+            "bucket": bucket,
+            "view_name": view_name,
+            "method": method,
+            "status_class": status_class,
+        }
+        db = model.objects.db
+        # The histogram can't be incremented with F() expressions, so the row is locked
+        with transaction.atomic(using=db):
+            instance = model.objects.select_for_update().filter(**lookup).first()
+            if instance is None:
+                try:
+                    with transaction.atomic(using=db):
+                        model.objects.create(**lookup, **rollup.as_fields())
+                    return
+                except IntegrityError:
+                    # Another worker created it in the meantime
+                    instance = model.objects.select_for_update().get(**lookup)
+            merged = Rollup.from_instance(instance)
+            merged.merge(rollup)
+            model.objects.filter(pk=instance.pk).update(**merged.as_fields())
+
+
+def _sources(since: Optional[datetime], until: datetime) -> List[QuerySet]:
+    """The stored responses from `since` (or the oldest) until `until`,
+    including the ones on the shards"""
+    sources = [
+        models.ApiResponse.objects.annotate(trace=F("request__error_trace")),
+        *(
+            # The requests on the shards have no error traces
+            shard.response.objects.annotate(trace=Value(None, CharField()))
+            for shard in shards.overlapping(since, until)
+        ),
+    ]
+    filtered = []
+    for queryset in sources:
+        queryset = queryset.filter(
+            request__requested_at__lt=until, ellapsed_us__isnull=False
+        )
+        if since is not None:
+            queryset = queryset.filter(request__requested_at__gte=since)
+        filtered.append(queryset)
+    return filtered
+
+
+def _aggregate(
+    since: Optional[datetime],
+    until: datetime,
+    resolutions: Tuple[Type[models.MetricRollup], ...] = RESOLUTIONS,
+) -> Tuple[Rollups, int]:
+    """Aggregates the stored requests from `since` (or the oldest) until `until`"""
+    aggregated: Rollups = {model: {} for model in resolutions}
+    total = 0
+    for queryset in _sources(since, until):
+        rows: Iterable[
+            Tuple[datetime, str, str, int, int, Optional[str]]
+        ] = queryset.values_list(
+            "request__requested_at",
+            "request__view_name",
+            "request__method",
+            "status_code",
+            "ellapsed_us",
+            "trace",
+        ).iterator()
+        for requested_at, view_name, method, status_code, ellapsed_us, trace in rows:
+            _accumulate(
+                aggregated,
+                view_name or "",
+                method,
+                status_code,
+                ellapsed_us / 1_000_000,
+                trace is not None,
+                requested_at,
+            )
+            total += 1
+    return aggregated, total
+
+
+def _stored_keys(since: Optional[datetime], until: datetime) -> Set[Key]:
+    """The hour rollup keys of the stored requests, grouped by the database"""
+    keys = set()
+    for queryset in _sources(since, until):
+        rows = (
+            queryset.annotate(
+                hour=TruncHour("request__requested_at", tzinfo=dt_timezone.utc)
+            )
+            .values_list("hour", "request__view_name", "request__method", "status_code")
+            .order_by()
+            .distinct()
+        )
+        for hour, view_name, method, status_code in rows:
+            keys.add((hour, view_name or "", method, status_code // 100))
+    return keys
+
+
+def _instances(
+    model: Type[models.MetricRollup], rollups: Dict[Key, Rollup]
+) -> Iterable[models.MetricRollup]:
+    return (
+        model(
+            bucket=bucket,
+            view_name=view_name,
+            method=method,
+            status_class=status_class,
+            **rollup.as_fields(),
+        )
+        for (bucket, view_name, method, status_class), rollup in rollups.items()
+    )
+
+
+def rebuild(since: datetime, until: Optional[datetime] = None) -> int:
+    """Recomputes the rollups of the hours from `since` until `until` (or the current hour,
+    exclusive) from the stored requests, replacing the existing ones. The requests dropped
+    by the sampling aren't stored, so they're missing from the rebuilt rollups.
+    Returns how many requests were aggregated."""
+    since = truncate(since, models.HourRollup)
+    until = truncate(until or timezone.now(), models.HourRollup)
+    rebuilt, total = _aggregate(since, until)
+    for model, rollups in rebuilt.items():
+        with transaction.atomic(using=model.objects.db):
+            model.objects.filter(bucket__gte=since, bucket__lt=until).delete()
+            model.objects.bulk_create(_instances(model, rollups))
+    return total
+
+
+def fold(until: datetime, since: Optional[datetime] = None) -> int:
+    """Aggregates the stored requests from `since` (or the oldest) before the hour of
+    `until` into the hour rollups that don't exist yet, so the charts keep them after
+    they're deleted or their shard is dropped. Only the hours with missing rollups are read.
+    Returns how many rollups were created."""
+    until = truncate(until, models.HourRollup)
+    if since is not None:
+        since = truncate(since, models.HourRollup)
+    existing = models.HourRollup.objects.filter(bucket__lt=until)
+    if since is not None:
+        existing = existing.filter(bucket__gte=since)
+    covered = set(existing.values_list("bucket", "view_name", "method", "status_class"))
+    hours = sorted({key[0] for key in _stored_keys(since, until) - covered})
+    if not hours:
+        return 0
+    aggregated, _ = _aggregate(
+        hours[0], hours[-1] + timedelta(hours=1), resolutions=(models.HourRollup,)
+    )
+    missing = {
+        key: rollup
+        for key, rollup in aggregated[models.HourRollup].items()
+        if key not in covered
+    }
+    models.HourRollup.objects.bulk_create(_instances(models.HourRollup, missing))
+    return len(missing)
+
+
+counter = RollupCounter(
+    flush_interval=getattr(
+        settings,
+        "APM_ROLLUPS_FLUSH_INTERVAL",
+        dflt_conf.APM_ROLLUPS_FLUSH_INTERVAL,
+    )
+)
+atexit.register(counter.flush)
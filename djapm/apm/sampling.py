@@ -0,0 +1,129 @@
+import atexit
+import logging
+import os
+import random
+import threading
+from collections import Counter
+from datetime import datetime
+from time import monotonic
+from typing import Optional, Tuple, TYPE_CHECKING
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, models, writer
+
+
+__all__ = (
+    "get_rate",
+    "sample",
+    "should_sample",
+    "should_keep",
+    "DroppedRequestsCounter",
+    "counter",
+)
+
+
+if TYPE_CHECKING:
+    from djapm.apm.types import PatchedHttpRequest
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_rate(view_name: str) -> float:
+    """The rate of `view_name` on `APM_SAMPLING_RATES`,
+    or fallbacks to `APM_SAMPLING_DEFAULT_RATE`."""
+    rates = getattr(settings, "APM_SAMPLING_RATES", dflt_conf.APM_SAMPLING_RATES)
+    rate = rates.get(view_name)
+    if rate is None:
+        rate = getattr(
+            settings, "APM_SAMPLING_DEFAULT_RATE", dflt_conf.APM_SAMPLING_DEFAULT_RATE
+        )
+    return rate
+
+
+def sample(rate: float) -> bool:
+    return rate >= 1 or random.random() < rate
+
+
+def should_sample(view_name: str) -> bool:
+    """The head sampling decision, taken before the view runs, see `get_rate`."""
+    return sample(get_rate(view_name))
+
+
+def should_keep(
+    request: "PatchedHttpRequest", status_code: int, ellapsed: float
+) -> bool:
+    """The tail sampling decision, taken after the response.
+    Requests that were not sampled are still kept when they failed (4xx/5xx/exceptions)
+    or took longer than `APM_SAMPLING_KEEP_SLOWER_THAN` seconds."""
+    if getattr(request, "apm_sampled", True) or status_code >= 400:
+        return True
+    if getattr(request, "_apm_exception", False):
+        return True
+    threshold = request._apm_config.keep_slower_than
+    return threshold is not None and ellapsed >= threshold
+
+
+class DroppedRequestsCounter:
+    """Counts in memory the requests dropped by the sampling, per hour and view.
+    The counts are periodically added to the `DroppedRequestCount` model, by the
+    `ApmWriter` thread, so the throughput charts stay accurate."""
+
+    def __init__(self, flush_interval: float):
+        self.flush_interval = flush_interval
+        self._counts: "Counter[Tuple[datetime, str]]" = Counter()
+        self._lock = threading.Lock()
+        self._last_flush = monotonic()
+        self._scheduled_pid: Optional[int] = None
+
+    def add(self, view_name: str) -> None:
+        bucket = timezone.now().replace(minute=0, second=0, microsecond=0)
+        with self._lock:
+            self._counts[(bucket, view_name)] += 1
+        if self._scheduled_pid != os.getpid():
+            writer.get_writer().add_flusher(self.flush_if_due)
+            self._scheduled_pid = os.getpid()
+
+    def flush_if_due(self) -> None:
+        if monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+            self._last_flush = monotonic()
+        try:
+            for (bucket, view_name), count in counts.items():
+                self._increment(bucket, view_name, count)
+        except Exception:
+            logger.exception("Failed to persist the APM dropped requests counts")
+
+    @staticmethod
+    def _increment(bucket: datetime, view_name: str, count: int) -> None:
+        queryset = models.DroppedRequestCount.objects.filter(
+            bucket=bucket, view_name=view_name
+        )
+        if queryset.update(count=F("count") + count):
+            return
+        try:
+            with transaction.atomic(using=queryset.db):
+                models.DroppedRequestCount.objects.create(
+                    bucket=bucket, view_name=view_name, count=count
+                )
+        except IntegrityError:
+            # Another worker created it in the meantime
+            queryset.update(count=F("count") + count)
+
+
+counter = DroppedRequestsCounter(
+    flush_interval=getattr(
+        settings,
+        "APM_SAMPLING_COUNTERS_FLUSH_INTERVAL",
+        dflt_conf.APM_SAMPLING_COUNTERS_FLUSH_INTERVAL,
+    )
+)
+atexit.register(counter.flush)
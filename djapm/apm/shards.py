@@ -0,0 +1,252 @@
+import logging
+import re
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from time import monotonic
+from typing import Any, Dict, List, Optional, Set, Tuple, Type
+
+from django.apps.registry import Apps
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connections, models as db_models
+from django.dispatch import receiver
+from django.utils import timezone
+
+from djapm.apm import dflt_conf, models
+from djapm.apm.spool import Record
+
+
+__all__ = (
+    "Shard",
+    "enabled",
+    "get_shard",
+    "existing",
+    "overlapping",
+    "route",
+)
+
+
+logger = logging.getLogger(__name__)
+
+# The shard models are kept apart from the app models, so they never show up on migrations
+shard_apps = Apps(installed_apps=())
+
+_TABLE = re.compile(rf"^{models.ApiRequest._meta.db_table}_(\d{{8}})$")
+# Weekly shards start on mondays
+_EPOCH = date(1970, 1, 5).toordinal()
+_REFRESH_INTERVAL = 60.0
+
+
+def shard_days() -> Optional[int]:
+    return getattr(settings, "APM_SHARD_DAYS", dflt_conf.APM_SHARD_DAYS)
+
+
+def enabled() -> bool:
+    return shard_days() is not None
+
+
+def _utc_date(at: datetime) -> date:
+    if timezone.is_aware(at):
+        at = at.astimezone(dt_timezone.utc)
+    return at.date()
+
+
+class Shard:
+    """The `ApiRequest` and `ApiResponse` tables of the requests made on the
+    `APM_SHARD_DAYS` days from `start` (in UTC), e.g. `apm_apirequest_20240101`."""
+
+    def __init__(self, start: date):
+        self.start = start
+        self.end = start + timedelta(days=shard_days() or 1)
+        self.suffix = start.strftime("%Y%m%d")
+        self.request, self.response = _shard_models(self.suffix)
+
+    def __repr__(self):
+        return f"<Shard {self.suffix}>"
+
+    @property
+    def tables(self) -> Tuple[Type[db_models.Model], Type[db_models.Model]]:
+        return self.request, self.response
+
+    def create(self) -> None:
+        connection = connections[self.request.objects.db]
+        with connection.schema_editor() as editor:
+            for model in self.tables:
+                editor.create_model(model)
+                # The indexes of unmanaged models are skipped by `create_model`
+                for index in model._meta.indexes:
+                    editor.add_index(model, index)
+        _existing.add(self.start)
+
+    def drop(self) -> None:
+        connection = connections[self.request.objects.db]
+        with connection.schema_editor() as editor:
+            for model in reversed(self.tables):
+                editor.delete_model(model)
+        _existing.discard(self.start)
+
+
+_models: Dict[str, Tuple[Type[db_models.Model], Type[db_models.Model]]] = {}
+
+
+def _columns(model: Type[db_models.Model]) -> Dict[str, db_models.Field]:
+    """Copies the local fields of `model`. The relations become plain columns, named by
+    their attnames, since the shards are on another registry and have no constraints."""
+    fields: Dict[str, db_models.Field] = {}
+    for field in model._meta.local_fields:
+        if not field.is_relation:
+            name, path, args, kwargs = field.deconstruct()
+            fields[name] = field.__class__(*args, **kwargs)
+            continue
+        target = field.target_field
+        if field.primary_key:
+            options: Dict[str, Any] = {"primary_key": True}
+        else:
+            options = {"null": True, "editable": False, "db_index": field.db_index}
+        if isinstance(target, db_models.BigIntegerField):
+            column = db_models.BigIntegerField(**options)
+        elif isinstance(target, db_models.IntegerField):
+            column = db_models.IntegerField(**options)
+        else:
+            column = target.__class__(max_length=target.max_length, **options)
+        fields[field.attname] = column
+    return fields
+
+
+def _build(
+    model: Type[db_models.Model],
+    suffix: str,
+    fields: Dict[str, db_models.Field],
+    registry: Apps,
+    **attrs: Any,
+) -> Type[db_models.Model]:
+    meta = type(
+        "Meta",
+        (),
+        {
+            "apps": registry,
+            "app_label": model._meta.app_label,
+            "db_table": f"{model._meta.db_table}_{suffix}",
+            "managed": False,
+            "indexes": [
+                db_models.Index(fields=index.fields, name=f"{index.name}_{suffix}")
+                for index in model._meta.indexes
+            ],
+        },
+    )
+    return type(
+        f"{model.__name__}{suffix}",
+        (db_models.Model,),
+        {"__module__": __name__, "Meta": meta, **fields, **attrs},
+    )
+
+
+def _shard_models(
+    suffix: str,
+) -> Tuple[Type[db_models.Model], Type[db_models.Model]]:
+    """Builds the models of the shard tables, copying the fields of the app models"""
+    if suffix in _models:
+        return _models[suffix]
+
+    request = _build(
+        models.ApiRequest,
+        suffix,
+        _columns(models.ApiRequest),
+        shard_apps,
+        objects=models.ApmManager(),
+    )
+    fields = _columns(models.ApiResponse)
+    del fields["request_id"]
+    fields["request"] = db_models.OneToOneField(
+        to=request,
+        on_delete=db_models.DO_NOTHING,
+        primary_key=True,
+        related_name="response",
+        db_constraint=False,
+        editable=False,
+    )
+    response = _build(
+        models.ApiResponse, suffix, fields, shard_apps, objects=models.ApmManager()
+    )
+    _models[suffix] = request, response
+    return request, response
+
+
+def get_shard(day: date) -> Shard:
+    """The shard that holds the requests of `day`"""
+    days = shard_days() or 1
+    ordinal = day.toordinal()
+    return Shard(date.fromordinal(ordinal - (ordinal - _EPOCH) % days))
+
+
+_existing: Set[date] = set()
+_missing: Set[str] = set()
+_last_refresh = float("-inf")
+
+
+def _refresh(force: bool = False) -> None:
+    """Looks up the shard tables again every minute, or when `force`"""
+    global _last_refresh
+    if not force and monotonic() - _last_refresh < _REFRESH_INTERVAL:
+        return
+    connection = connections[models.ApiRequest.objects.db]
+    _existing.clear()
+    for table in connection.introspection.table_names():
+        match = _TABLE.match(table)
+        if match:
+            _existing.add(datetime.strptime(match[1], "%Y%m%d").date())
+    _last_refresh = monotonic()
+
+
+def existing(refresh: bool = False) -> List[Shard]:
+    """The shards whose tables exist, oldest first"""
+    _refresh(force=refresh)
+    return [Shard(start) for start in sorted(_existing)]
+
+
+def overlapping(
+    since: Optional[datetime], until: Optional[datetime] = None
+) -> List[Shard]:
+    """The existing shards with requests made from `since` (or the oldest)
+    until `until` (or now)"""
+    last = _utc_date(until or timezone.now())
+    shards = [s for s in existing() if s.start <= last]
+    if since is not None:
+        first = _utc_date(since)
+        shards = [s for s in shards if s.end > first]
+    return shards
+
+
+def route(record: Record) -> Record:
+    """Moves the rows of a successful request, that has only its `ApiRequest` and a
+    2xx/3xx `ApiResponse`, to the shard of its day when it exists. The other requests
+    stay on the app tables, since their error traces, logs, spans and profiles
+    reference them."""
+    requested_at = None
+    for model, fields in record:
+        if model is models.ApiRequest:
+            requested_at = fields["requested_at"]
+        elif model is not models.ApiResponse or fields["status_code"] >= 400:
+            return record
+    if requested_at is None:
+        return record
+    shard = get_shard(_utc_date(requested_at))
+    _refresh()
+    if shard.start not in _existing:
+        if shard.suffix not in _missing:
+            _missing.add(shard.suffix)
+            logger.warning(
+                "The APM shard %s doesn't exist, run `manage.py apm_shards`",
+                shard.suffix,
+            )
+        return record
+    return [
+        (shard.request if model is models.ApiRequest else shard.response, fields)
+        for model, fields in record
+    ]
+
+
+@receiver(setting_changed)
+def _reset_existing(*, setting: str, **kwargs):
+    global _last_refresh
+    if setting == "APM_SHARD_DAYS":
+        _last_refresh = float("-inf")
@@ -0,0 +1,107 @@
+import math
+from typing import Any, Dict, Iterable, List, Optional
+
+
+__all__ = ("RELATIVE_ACCURACY", "QUANTILES", "LatencySketch")
+
+
+# Every quantile is within 1% of the exact value, see `LatencySketch`.
+# It's a constant, since only sketches with the same accuracy can be merged
+RELATIVE_ACCURACY = 0.01
+# Values up to this (1µs) are counted on the zero bin, and estimated as 0
+MIN_VALUE = 1e-6
+# Up to 1µs..~13min at 1%, the lowest bins are collapsed past this
+MAX_BINS = 1024
+QUANTILES = (0.5, 0.9, 0.95, 0.99)
+
+_GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+_LOG_GAMMA = math.log(_GAMMA)
+
+
+class LatencySketch:
+    """A mergeable quantile sketch of positive values (DDSketch).
+
+    Each value `x` is counted on the bin `ceil(log(x, gamma))`, with
+    `gamma = (1 + a) / (1 - a)` and `a = RELATIVE_ACCURACY`. Every value of a bin is within
+    `a` of its center, so any estimated quantile `q` is within `a * q` of the exact one.
+    The bins are kept on a dense list, starting at the `offset` bin.
+
+    Merging adds up the bins, so merging the sketches of many workers or buckets gives
+    the same estimates of the sketch of all their values. When the range of the values
+    needs more than `MAX_BINS` bins, the lowest ones are collapsed together, so only
+    the lowest quantiles lose their accuracy."""
+
+    __slots__ = ("offset", "bins", "zero", "count")
+
+    def __init__(self):
+        self.offset = 0
+        self.bins: List[int] = []
+        self.zero = 0
+        self.count = 0
+
+    def add(self, value: float, count: int = 1) -> None:
+        self.count += count
+        if value <= MIN_VALUE:
+            self.zero += count
+            return
+        index = math.ceil(math.log(value) / _LOG_GAMMA)
+        self._extend(index, index)
+        self.bins[max(index - self.offset, 0)] += count
+
+    def merge(self, other: "LatencySketch") -> None:
+        self.count += other.count
+        self.zero += other.zero
+        if not other.bins:
+            return
+        self._extend(other.offset, other.offset + len(other.bins) - 1)
+        for index, count in enumerate(other.bins, other.offset):
+            self.bins[max(index - self.offset, 0)] += count
+
+    def _extend(self, low: int, high: int) -> None:
+        """Grows the bins to hold the `low` to `high` indexes, collapsing the lowest ones
+        past `MAX_BINS`"""
+        if not self.bins:
+            self.offset = low
+            self.bins = [0] * (high - low + 1)
+        if low < self.offset:
+            self.bins[:0] = [0] * (self.offset - low)
+            self.offset = low
+        last = self.offset + len(self.bins) - 1
+        if high > last:
+            self.bins.extend([0] * (high - last))
+        excess = len(self.bins) - MAX_BINS
+        if excess > 0:
+            collapsed = sum(self.bins[: excess + 1])
+            self.bins[: excess + 1] = [collapsed]
+            self.offset += excess
+
+    def quantile(self, q: float) -> Optional[float]:
+        """The estimated `q` quantile, from 0 to 1, or `None` if the sketch is empty"""
+        if not self.count:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero
+        if rank < seen:
+            return 0.0
+        for index, count in enumerate(self.bins, self.offset):
+            seen += count
+            if rank < seen:
+                return 2 * _GAMMA**index / (_GAMMA + 1)
+        return 2 * _GAMMA ** (self.offset + len(self.bins) - 1) / (_GAMMA + 1)
+
+    def quantiles(self, qs: Iterable[float] = QUANTILES) -> Dict[str, Optional[float]]:
+        """The estimates of `qs`, keyed by their percentile, e.g. `p99`"""
+        return {f"p{round(q * 100):g}": self.quantile(q) for q in qs}
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"offset": self.offset, "bins": self.bins, "zero": self.zero}
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "LatencySketch":
+        sketch = cls()
+        if data:
+            sketch.offset = data["offset"]
+            sketch.bins = list(data["bins"])
+            sketch.zero = data["zero"]
+            sketch.count = sketch.zero + sum(sketch.bins)
+        return sketch
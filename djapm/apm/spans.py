@@ -0,0 +1,106 @@
+import logging
+from contextlib import ContextDecorator
+from time import perf_counter
+from typing import List, Optional, Tuple
+
+from djapm.apm import models, registry
+from djapm.apm.spool import Row
+
+
+__all__ = ("ApmContext", "Span", "create_context")
+
+
+logger = logging.getLogger(__name__)
+
+# name, parent index (-1 for the root spans), start and end (seconds since the request started)
+SpanTuple = Tuple[str, int, float, float]
+
+
+class Span(ContextDecorator):
+    """Times the block (or function) it wraps, see `ApmContext.span`"""
+
+    def __init__(self, context: "ApmContext", name: str):
+        self.context = context
+        self.name = name
+        self.index = -1
+
+    def _recreate_cm(self):
+        # Each call of a decorated function is a new span
+        return Span(self.context, self.name)
+
+    def __enter__(self):
+        self.index = self.context._open(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.context._close(self.index)
+        return False
+
+
+class ApmContext:
+    """The APM helpers available on a tracked request, as `request.apm`"""
+
+    __slots__ = ("origin", "max_spans", "spans", "dropped", "_stack")
+
+    def __init__(self, origin: float, max_spans: int):
+        self.origin = origin
+        self.max_spans = max_spans
+        self.spans: List[SpanTuple] = []
+        self.dropped = 0
+        self._stack: List[int] = []
+
+    def span(self, name: str) -> Span:
+        """Records how long a block of code took, nested on the current span (if any).
+        Usage: `with request.apm.span("charge_card"): ...`,
+        or as a decorator: `@request.apm.span("charge_card")`."""
+        return Span(self, name)
+
+    def _open(self, name: str) -> int:
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return -1
+        parent = self._stack[-1] if self._stack else -1
+        start = perf_counter() - self.origin
+        self.spans.append((name, parent, start, start))
+        index = len(self.spans) - 1
+        self._stack.append(index)
+        return index
+
+    def _close(self, index: int) -> None:
+        if index < 0:
+            return
+        name, parent, start, _ = self.spans[index]
+        self.spans[index] = (name, parent, start, perf_counter() - self.origin)
+        if index in self._stack:
+            # Closes any child span that was left open
+            del self._stack[self._stack.index(index) :]
+
+    def rows(self, request_id: str) -> List[Row]:
+        """The `Span` rows to save"""
+        if self.dropped:
+            logger.warning(
+                "%s spans of the request %s were dropped, over APM_MAX_SPANS_PER_REQUEST",
+                self.dropped,
+                request_id,
+            )
+        return [
+            (
+                models.Span,
+                {
+                    "request_id": request_id,
+                    "index": index,
+                    "parent": parent if parent >= 0 else None,
+                    "name": name[:255],
+                    "start_us": round(start * 1_000_000),
+                    "duration_us": round((end - start) * 1_000_000),
+                },
+            )
+            for index, (name, parent, start, end) in enumerate(self.spans)
+        ]
+
+
+def create_context(started_at: Optional[float]) -> ApmContext:
+    return ApmContext(
+        origin=started_at if started_at is not None else perf_counter(),
+        max_spans=registry.get_settings().max_spans,
+    )
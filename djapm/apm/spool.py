@@ -0,0 +1,140 @@
+import base64
+import json
+import logging
+import os
+import socket
+import struct
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Tuple, Type
+
+from django.apps import apps
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import models as db_models
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+
+__all__ = (
+    "ApmJSONEncoder",
+    "Spool",
+    "dumps",
+    "from_json",
+    "loads",
+    "read",
+    "to_json",
+)
+
+
+logger = logging.getLogger(__name__)
+
+# Each entry is a 4 bytes big-endian length, followed by a JSON document of that length.
+HEADER = struct.Struct(">I")
+SUFFIX = ".spool"
+
+Row = Tuple[Type[db_models.Model], Dict[str, Any]]
+Record = List[Row]
+
+
+class ApmJSONEncoder(DjangoJSONEncoder):
+    def default(self, o):
+        if isinstance(o, datetime):
+            # DjangoJSONEncoder truncates them to milliseconds
+            return o.isoformat()
+        if isinstance(o, (bytes, memoryview)):
+            # Decoded back by `BinaryField.to_python`
+            return base64.b64encode(o).decode()
+        try:
+            return super().default(o)
+        except TypeError:
+            return str(o)
+
+
+def to_json(record: Record) -> List[List[Any]]:
+    """Converts the `record` rows to `[[model_name, {attname: value}], ...]`"""
+    return [[model._meta.object_name, fields] for model, fields in record]
+
+
+def from_json(rows: List[List[Any]]) -> Record:
+    """The reverse of `to_json`, the values are converted back using each field `to_python`.
+    The values that are stored as blobs have no field, and are kept as their JSON."""
+    record: Record = []
+    for model_name, values in rows:
+        model = apps.get_model("apm", model_name)
+        fields = {f.attname: f for f in model._meta.concrete_fields}
+        record.append(
+            (
+                model,
+                {
+                    name: fields[name].to_python(value) if name in fields else value
+                    for name, value in values.items()
+                },
+            )
+        )
+    return record
+
+
+def dumps(record: Record) -> bytes:
+    return json.dumps(
+        to_json(record), cls=ApmJSONEncoder, separators=(",", ":")
+    ).encode()
+
+
+def loads(data: bytes) -> Record:
+    return from_json(json.loads(data))
+
+
+def read(path: Path) -> Iterator[Record]:
+    """Yields the records of the spool file at `path`.
+    A truncated entry at the end of the file (an interrupted write) is ignored."""
+    data = path.read_bytes()
+    offset = 0
+    while offset + HEADER.size <= len(data):
+        (size,) = HEADER.unpack_from(data, offset)
+        offset += HEADER.size
+        if offset + size > len(data):
+            logger.warning("Ignoring a truncated entry at the end of %s", path)
+            return
+        yield loads(data[offset : offset + size])
+        offset += size
+
+
+class Spool:
+    """An append-only spool file per worker process, on the `directory`.
+    Each `write` opens the file in append mode and writes a whole entry with a single call,
+    holding an exclusive lock, so `apm_replay_spool` can safely take over the file."""
+
+    def __init__(self, directory: str):
+        self.directory = Path(directory)
+
+    @property
+    def path(self) -> Path:
+        return self.directory / f"{socket.gethostname()}-{os.getpid()}{SUFFIX}"
+
+    def write(self, record: Record) -> None:
+        payload = dumps(record)
+        entry = HEADER.pack(len(payload)) + payload
+        self.directory.mkdir(parents=True, exist_ok=True)
+        path = self.path
+        while True:
+            fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            try:
+                if fcntl is not None:
+                    fcntl.flock(fd, fcntl.LOCK_EX)
+                    if not _is_same_file(fd, path):
+                        # Taken over by a replay after we opened it, retry on a new file
+                        continue
+                os.write(fd, entry)
+                return
+            finally:
+                os.close(fd)
+
+
+def _is_same_file(fd: int, path: Path) -> bool:
+    try:
+        return os.stat(path).st_ino == os.fstat(fd).st_ino
+    except FileNotFoundError:
+        return False
@@ -140,6 +140,97 @@ async function loadResponseEllapsedTimeByViewChart() {
     );
 }
 
+async function loadResponseDbTimeByViewChart() {
+
+    const CHART_ID = "ResponseDbTimeByView"
+    const json = await fetchJson(apiUrls[CHART_ID])
+    const data = {
+        datasets: [
+            {
+                label: gettext('Avg DB time'),
+                data: json.db,
+                backgroundColor: DARK_GREEN,
+                borderColor: DARK_GREEN,
+            },
+            {
+                label: gettext('Avg total time'),
+                data: json.total,
+                backgroundColor: BLUE,
+                borderColor: BLUE,
+            },
+        ]
+    };
+    const config = {
+        type: 'bar',
+        data: data,
+        options: {
+            plugins: {
+                title: { display: true, text: gettext("DB time vs total time") },
+                subtitle: { display: true, text: gettext("The time spent on database queries at each view (last week)") }
+            },
+            scales: {
+                y: {
+                    title: { display: true, text: gettext("Time (seconds)") }
+                }
+            }
+        }
+    }
+    new Chart(
+        document.getElementById(CHART_ID),
+        config
+    );
+}
+
+async function loadResponseMemoryByViewChart() {
+
+    const CHART_ID = "ResponseMemoryByView"
+    const json = await fetchJson(apiUrls[CHART_ID])
+    const toMiB = (values) => Object.fromEntries(
+        Object.entries(values).map(([view, bytes]) => [view, bytes / 1048576])
+    );
+    const data = {
+        datasets: [
+            {
+                label: gettext('Avg net'),
+                data: toMiB(json.avg_net),
+                backgroundColor: DARK_GREEN,
+                borderColor: DARK_GREEN,
+            },
+            {
+                label: gettext('Avg peak'),
+                data: toMiB(json.avg_peak),
+                backgroundColor: BLUE,
+                borderColor: BLUE,
+            },
+            {
+                label: gettext('Max peak'),
+                data: toMiB(json.max_peak),
+                backgroundColor: RED,
+                borderColor: RED,
+            },
+        ]
+    };
+    const config = {
+        type: 'bar',
+        data: data,
+        options: {
+            plugins: {
+                title: { display: true, text: gettext("View memory allocations") },
+                subtitle: { display: true, text: gettext("The memory allocated at each view, on the traced requests (last week)") }
+            },
+            scales: {
+                y: {
+                    title: { display: true, text: gettext("Memory (MiB)") }
+                }
+            }
+        }
+    }
+    new Chart(
+        document.getElementById(CHART_ID),
+        config
+    );
+}
+
 async function loadResponseEllapsedTimeByDateChart() {
 
     const CHART_ID = "ResponseEllapsedTimeByDate"
@@ -185,6 +276,63 @@ async function loadResponseEllapsedTimeByDateChart() {
     );
 }
 
+const percentileDatasets = (json) => [
+    { label: 'p50', data: json.p50, backgroundColor: DARK_GREEN, borderColor: DARK_GREEN },
+    { label: 'p90', data: json.p90, backgroundColor: BLUE, borderColor: BLUE },
+    { label: 'p95', data: json.p95, backgroundColor: 'rgb(255, 140, 0)', borderColor: 'rgb(255, 140, 0)' },
+    { label: 'p99', data: json.p99, backgroundColor: RED, borderColor: RED },
+];
+
+async function loadResponsePercentilesByViewChart() {
+
+    const CHART_ID = "ResponsePercentilesByView"
+    const json = await fetchJson(apiUrls[CHART_ID])
+    const config = {
+        type: 'bar',
+        data: { datasets: percentileDatasets(json) },
+        options: {
+            plugins: {
+                title: { display: true, text: gettext("View response time percentiles") },
+                subtitle: { display: true, text: gettext("The response's time percentiles at each view, within 1% (last week)") }
+            },
+            scales: {
+                y: {
+                    title: { display: true, text: gettext("Time (seconds)") }
+                }
+            }
+        }
+    }
+    new Chart(
+        document.getElementById(CHART_ID),
+        config
+    );
+}
+
+async function loadResponsePercentilesByDateChart() {
+
+    const CHART_ID = "ResponsePercentilesByDate"
+    const json = await fetchJson(apiUrls[CHART_ID])
+    const config = {
+        type: 'line',
+        data: { datasets: percentileDatasets(json) },
+        options: {
+            plugins: {
+                title: { display: true, text: gettext("Response time percentiles") },
+                subtitle: { display: true, text: gettext("The response's time percentiles at each date, within 1% (last week)") }
+            },
+            scales: {
+                y: {
+                    title: { display: true, text: gettext("Time (seconds)") }
+                }
+            }
+        }
+    }
+    new Chart(
+        document.getElementById(CHART_ID),
+        config
+    );
+}
+
 async function loadRequestCountLast24HoursChart() {
 
     const CHART_ID = "RequestsCountLast24Hours"
@@ -246,14 +394,57 @@ async function loadErrorsPerClassLastWeekChart() {
     );
 }
 
+async function loadLiveRequestsPerViewChart() {
+    const CHART_ID = "LiveRequestsPerView"
+    const json = await fetchJson(apiUrls[CHART_ID])
+    const data = {
+        datasets: [
+            {
+                label: gettext('Requests'),
+                data: json.requests,
+                backgroundColor: DARK_GREEN,
+            },
+            {
+                label: gettext('Errors'),
+                backgroundColor: RED,
+                borderColor: RED,
+                data: json.errors,
+            },
+        ]
+    };
+    const config = {
+        type: 'bar',
+        data: data,
+        options: {
+            plugins: {
+                title: { display: true, text: gettext("Live requests per view") },
+                subtitle: { display: true, text: gettext("The number of requests on each view (last 5 minutes, all workers)") }
+            },
+            scales: {
+                x: { stacked: true },
+                y: { stacked: true, title: { display: true, text: gettext("Requests") } }
+            }
+        }
+    };
+    new Chart(
+        document.getElementById(CHART_ID),
+        config
+    );
+}
+
 const loadCharts = () => {
     Promise.all([
         loadRequestCountByDateChart(),
         loadRequestsViewNameCountChart(),
         loadResponseEllapsedTimeByViewChart(),
+        loadResponseDbTimeByViewChart(),
+        loadResponseMemoryByViewChart(),
         loadResponseEllapsedTimeByDateChart(),
+        loadResponsePercentilesByViewChart(),
+        loadResponsePercentilesByDateChart(),
         loadRequestCountLast24HoursChart(),
         loadErrorsPerClassLastWeekChart(),
+        loadLiveRequestsPerViewChart(),
     ])
 }
 
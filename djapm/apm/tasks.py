@@ -1,13 +1,39 @@
 import logging
+import warnings
 
 from celery import shared_task
+from django.conf import settings
 from django.contrib.sites.models import Site
 from django.urls import reverse
 
-from djapm.apm import models
+from djapm.apm import dflt_conf, models
 from djapm.apm.integrations import base
 
 
+def notify_error_trace(trace_id: str) -> None:
+    """Sends the notifications of the error trace, through celery if `APM_NOTIFY_USING_CELERY`.
+    Notifications aren't sent when `DEBUG=True`, unless `APM_NOTIFY_ON_DEBUG_TRUE`."""
+    notify_on_debug_true = getattr(
+        settings, "APM_NOTIFY_ON_DEBUG_TRUE", dflt_conf.APM_NOTIFY_ON_DEBUG_TRUE
+    )
+    if settings.DEBUG and not notify_on_debug_true:
+        warnings.warn(
+            "Errors Notifications aren't sent when DEBUG=True and APM_NOTIFY_ON_DEBUG_TRUE=False"
+        )
+        return
+
+    use_celery = getattr(
+        settings, "APM_NOTIFY_USING_CELERY", dflt_conf.APM_NOTIFY_USING_CELERY
+    )
+    if use_celery:
+        send_notifications.apply_async(
+            kwargs={"trace_id": trace_id},
+            countdown=3,
+        )  # type: ignore
+    else:
+        send_notifications(trace_id=trace_id)
+
+
 @shared_task(
     autoretry_for=(models.ErrorTrace.DoesNotExist,),
     max_retries=3,
@@ -52,7 +78,7 @@ Logs associated with this request:
         req_path=request.path,
         exc_class=trace.exception_class,
         exc_args=trace.exception_args,
-        traceback="\n".join(trace.traceback.split("\n")[-10:]),
+        traceback="\n".join((trace.traceback or "").split("\n")[-10:]),
         logs="\n".join(
             [
                 f"`[{l.timestamp!s} {l.level}] {l.message}`".format(l)
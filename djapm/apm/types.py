@@ -1,11 +1,28 @@
+import cProfile
 import logging
-from typing import Any, Callable, Dict, Protocol, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Optional,
+    Protocol,
+    Union,
+)
 from django.http import HttpRequest, HttpResponse
 
 from rest_framework.request import Request
 from rest_framework.response import Response
 
-from djapm.apm.log import ApmStreamHandler
+from djapm.apm.log import LogCapture
+from djapm.apm.memory import MemoryTrace
+from djapm.apm.profiler import Samples
+from djapm.apm.queries import QueryStats
+from djapm.apm.spans import ApmContext
+
+if TYPE_CHECKING:
+    from djapm.apm.registry import ViewConfig
 
 
 __all__ = (
@@ -21,6 +38,7 @@ class ApmRequest(Request):
     id: str
     view_name: str
     logger: logging.Logger
+    apm: ApmContext
     _request: "PatchedHttpRequest"
 
     @property
@@ -37,9 +55,11 @@ class ApiApmView(Protocol):
 
 
 class ApmView(Protocol):
-    """A regular django-view that receives a PatchedHttpRequest and any kwargs"""
+    """A regular django-view (sync or async) that receives a PatchedHttpRequest and any kwargs"""
 
-    def __call__(self, request: "PatchedHttpRequest", *args, **kwargs) -> HttpResponse:
+    def __call__(
+        self, request: "PatchedHttpRequest", *args, **kwargs
+    ) -> Union[HttpResponse, Awaitable[HttpResponse]]:
         ...
 
 
@@ -53,7 +73,16 @@ class PatchedHttpRequest(HttpRequest):
 
     id: str
     logger: logging.Logger
+    apm: ApmContext
     view_name: str
-    _log_handler: ApmStreamHandler
+    _log_capture: LogCapture
     started_at: float
+    apm_sampled: bool
+    _apm_exception: bool
     _json: Dict[str, Any]
+    _apm_queries: "QueryStats"
+    _apm_profile: "Samples"
+    _apm_cprofile: Optional[cProfile.Profile]
+    _apm_memory: Optional["MemoryTrace"]
+    _apm_config: "ViewConfig"
+    _apm_start_instruments: Callable[["PatchedHttpRequest"], None]
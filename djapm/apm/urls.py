@@ -26,11 +26,31 @@ urlpatterns = [
         api_views.response_view_name_ellapsed_time,
         name="response_view_name_ellapsed_time",
     ),
+    path(
+        "metrics/rvndb_date/",
+        api_views.response_view_name_db_time,
+        name="response_view_name_db_time",
+    ),
+    path(
+        "metrics/rvnm_date/",
+        api_views.response_view_name_memory,
+        name="response_view_name_memory",
+    ),
     path(
         "metrics/ret_date/",
         api_views.response_ellapsed_time_by_date,
         name="response_ellapsed_time_by_date",
     ),
+    path(
+        "metrics/rvnp_date/",
+        api_views.response_view_name_percentiles,
+        name="response_view_name_percentiles",
+    ),
+    path(
+        "metrics/rp_date/",
+        api_views.response_percentiles_by_date,
+        name="response_percentiles_by_date",
+    ),
     path(
         "metrics/rch/",
         api_views.requests_count_by_hour,
@@ -41,4 +61,19 @@ urlpatterns = [
         api_views.errors_per_exception_class,
         name="errors_per_exception_class",
     ),
+    path(
+        "metrics/live/",
+        api_views.live_view_stats,
+        name="live_view_stats",
+    ),
+    path(
+        "metrics/top_queries/",
+        api_views.top_queries,
+        name="top_queries",
+    ),
+    path(
+        "profile/token/",
+        api_views.profile_token,
+        name="profile_token",
+    ),
 ]
@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import Awaitable, Optional, Union
 
 from django.contrib.admin.sites import site
 from django.http import HttpResponse
@@ -15,7 +15,8 @@ __all__ = ("ApmView",)
 
 class ApmView(View):
     """Apm Django Class-based view that will contribute to the `request` before dispatching.
-    Allowing it to be tracked by the middlewares."""
+    Allowing it to be tracked by the middlewares.
+    The handlers may be `async def`, following the same rules of the django `View`."""
 
     logger_name: Optional[str] = None
 
@@ -24,7 +25,7 @@ class ApmView(View):
         request: types.PatchedHttpRequest,
         *args,
         **kwargs,
-    ) -> HttpResponse:
+    ) -> Union[HttpResponse, Awaitable[HttpResponse]]:
         """Wraps the standard `View.dispatch`"""
         contrib._contribute_to_request(request, view=self, logger_name=self.logger_name)
         return super().dispatch(request, *args, **kwargs)
@@ -65,8 +66,13 @@ def render_dashboard(request):
                 "ResponseEllapsedTimeByView": reverse(
                     "response_view_name_ellapsed_time"
                 ),
+                "ResponseDbTimeByView": reverse("response_view_name_db_time"),
+                "ResponseMemoryByView": reverse("response_view_name_memory"),
+                "ResponsePercentilesByView": reverse("response_view_name_percentiles"),
+                "ResponsePercentilesByDate": reverse("response_percentiles_by_date"),
                 "RequestsCountLast24Hours": reverse("requests_count_by_hour"),
                 "ErrorsPerClassLastWeek": reverse("errors_per_exception_class"),
+                "LiveRequestsPerView": reverse("live_view_stats"),
             },
         },
     )
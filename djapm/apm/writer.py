@@ -0,0 +1,199 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+from time import monotonic
+from typing import Callable, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+
+from djapm.apm import dflt_conf, persistence
+from djapm.apm.spool import Record
+
+
+__all__ = ("ApmWriter", "get_writer")
+
+
+logger = logging.getLogger(__name__)
+
+
+class ApmWriter:
+    """A write-behind writer for the APM models.
+    The middlewares push a `Record` (the rows of a single request) into a bounded
+    in-process queue, and a background thread persists them in batches using
+    `bulk_create`, once `batch_size` records are queued or `flush_interval` seconds passed.
+    Records pushed when the queue is full are dropped and counted on `dropped`.
+    The thread also runs the flushers added with `add_flusher`, after each batch.
+    """
+
+    def __init__(self, max_size: int, batch_size: int, flush_interval: float):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.dropped = 0
+        self._reported_dropped = 0
+        self._queue: "queue.Queue[Record]" = queue.Queue(maxsize=max_size)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._flushers: List[Callable[[], None]] = []
+
+    def put(self, record: Record) -> bool:
+        """Queues the `record` without blocking. Returns `False` if it was dropped."""
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        return True
+
+    def add_flusher(self, flush: Callable[[], None]) -> None:
+        """Runs `flush` on the background thread after each batch, so the aggregates kept
+        in memory (e.g. the rollups) are persisted outside of the requests."""
+        with self._lock:
+            if flush not in self._flushers:
+                self._flushers.append(flush)
+
+    def start(self) -> None:
+        """Starts the flusher thread. It's restarted when running on a forked process."""
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            if self._pid is not None:
+                # Forked: the parent's queue and thread are not usable here
+                self._queue = queue.Queue(maxsize=self.max_size)
+            self._pid = os.getpid()
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, name="djapm-writer", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stops the flusher thread and flushes all pending records."""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread.is_alive() and self._pid == os.getpid():
+            thread.join(timeout if timeout is not None else self.flush_interval * 2)
+        self._thread = None
+        self.flush()
+
+    def flush(self) -> int:
+        """Persists all the currently queued records. Returns how many were persisted."""
+        persisted = 0
+        while True:
+            records = self._drain()
+            if not records:
+                break
+            self._save(records)
+            persisted += len(records)
+        return persisted
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            records = self._collect()
+            if records:
+                self._save(records)
+            self._run_flushers()
+        close_old_connections()
+
+    def _collect(self) -> List[Record]:
+        """Waits for a batch: either `batch_size` records or `flush_interval` seconds."""
+        records: List[Record] = []
+        deadline = monotonic() + self.flush_interval
+        while len(records) < self.batch_size and not self._stop.is_set():
+            timeout = deadline - monotonic()
+            if timeout <= 0:
+                break
+            try:
+                records.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return records
+
+    def _drain(self) -> List[Record]:
+        records: List[Record] = []
+        while len(records) < self.batch_size:
+            try:
+                records.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return records
+
+    def _save(self, records: List[Record]) -> None:
+        close_old_connections()
+        try:
+            persistence.bulk_save(records)
+        except Exception:
+            spool = persistence.get_spool()
+            if spool is None:
+                logger.exception("Failed to persist %s APM records", len(records))
+            else:
+                logger.exception(
+                    "Failed to persist %s APM records, writing them to the spool",
+                    len(records),
+                )
+                for record in records:
+                    spool.write(record)
+        self._report_dropped()
+
+    def _run_flushers(self) -> None:
+        if not self._flushers:
+            return
+        close_old_connections()
+        for flush in list(self._flushers):
+            try:
+                flush()
+            except Exception:
+                logger.exception("Failed to run the APM flusher %r", flush)
+
+    def _report_dropped(self) -> None:
+        with self._lock:
+            dropped = self.dropped - self._reported_dropped
+            self._reported_dropped = self.dropped
+        if dropped:
+            logger.warning(
+                "The APM write-behind queue is full, %s records were dropped "
+                "(%s since startup). Consider increasing APM_WRITE_BEHIND_QUEUE_SIZE",
+                dropped,
+                self.dropped,
+            )
+
+
+_writer: Optional[ApmWriter] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> ApmWriter:
+    """Returns the process-wide `ApmWriter`, creating and starting it on the first call.
+    The writer is flushed when the process exits."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = ApmWriter(
+                    max_size=getattr(
+                        settings,
+                        "APM_WRITE_BEHIND_QUEUE_SIZE",
+                        dflt_conf.APM_WRITE_BEHIND_QUEUE_SIZE,
+                    ),
+                    batch_size=getattr(
+                        settings,
+                        "APM_WRITE_BEHIND_BATCH_SIZE",
+                        dflt_conf.APM_WRITE_BEHIND_BATCH_SIZE,
+                    ),
+                    flush_interval=getattr(
+                        settings,
+                        "APM_WRITE_BEHIND_FLUSH_INTERVAL",
+                        dflt_conf.APM_WRITE_BEHIND_FLUSH_INTERVAL,
+                    ),
+                )
+                atexit.register(_writer.stop)
+    _writer.start()
+    return _writer
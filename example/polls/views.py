@@ -6,7 +6,7 @@ from django.views.generic import ListView
 from djapm.apm import decorators, generics
 from djapm.apm.types import ApmRequest, PatchedHttpRequest
 from djapm.apm.views import ApmView
-from rest_framework import serializers
+from rest_framework import serializers, viewsets
 from rest_framework.response import Response
 
 from polls.models import Poll
@@ -30,6 +30,12 @@ class Polls(generics.ApmListAPIView):
     serializer_class = PollSerializer
 
 
+class PollViewSet(viewsets.ReadOnlyModelViewSet):
+    # A plain rest_framework view, tracked by the auto instrumentation
+    queryset = Poll.objects.all()
+    serializer_class = PollSerializer
+
+
 class OrderedPolls(ApmView, ListView):
     # A view that will raise TemplateDoesNotExistsError
     queryset = Poll.objects.order_by("name")
@@ -61,3 +67,13 @@ def fail(request: ApmRequest, **kwargs) -> Response:
 @decorators.apm_view()
 def get_polls_page(request: PatchedHttpRequest, **kwargs) -> HttpResponse:
     return HttpResponse()
+
+
+@decorators.apm_view()
+async def get_polls_page_async(request: PatchedHttpRequest, **kwargs) -> HttpResponse:
+    return HttpResponse()
+
+
+class AsyncPollsPage(ApmView):
+    async def get(self, request: PatchedHttpRequest, **kwargs) -> HttpResponse:
+        return HttpResponse()
@@ -0,0 +1,144 @@
+from datetime import timedelta
+from io import StringIO
+import uuid
+
+import pytest
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.urls import reverse
+from django.utils import timezone
+
+from djapm.apm import models, persistence
+
+
+BEFORE = [("apm", "0015_apiresponse_ellapsed_us")]
+AFTER = [("apm", "0016_blobs")]
+
+
+def _record(headers, traceback=None):
+    request_id = uuid.uuid4()
+    record = [
+        (
+            models.ApiRequest,
+            {
+                "id": request_id,
+                "view_name": "polls.drf.get_polls",
+                "method": "GET",
+                "path": "/polls/",
+                "requested_at": timezone.now(),
+                "headers": headers,
+            },
+        )
+    ]
+    if traceback is not None:
+        record.append(
+            (
+                models.ErrorTrace,
+                {
+                    "request_id": request_id,
+                    "payload": {"name": "poll"},
+                    "exception_class": "ValueError",
+                    "exception_args": "",
+                    "traceback": traceback,
+                },
+            )
+        )
+    return record
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize("codec", ["zlib", "lzma"])
+def test_values_are_stored_once_and_read_back(settings, codec):
+    settings.APM_BLOB_CODEC = codec
+    persistence.save(_record({"Host": "testserver", "Accept": "*/*"}))
+    persistence.save(
+        _record({"Accept": "*/*", "Host": "testserver"}, traceback="Traceback (...)")
+    )
+
+    assert models.Blob.objects.filter(codec=codec).count() == 3
+    headers = {r.headers["Host"] for r in models.ApiRequest.objects.all()}
+    assert headers == {"testserver"}
+    trace = models.ErrorTrace.objects.get()
+    assert trace.traceback == "Traceback (...)"
+    assert trace.payload == {"name": "poll"}
+
+
+@pytest.mark.django_db
+def test_admin_shows_the_values(admin_client):
+    record = _record({"Host": "testserver"}, traceback="Traceback (...)")
+    persistence.save(record)
+    request_id = record[0][1]["id"]
+
+    request_page = admin_client.get(
+        reverse("admin:apm_apirequest_change", args=(request_id,))
+    )
+    trace_page = admin_client.get(
+        reverse("admin:apm_errortrace_change", args=(request_id,))
+    )
+
+    assert "testserver" in request_page.content.decode()
+    assert "Traceback (...)" in trace_page.content.decode()
+
+
+@pytest.mark.django_db
+def test_prune_deletes_the_unreferenced_blobs():
+    record = _record({"Host": "testserver"})
+    persistence.save(record)
+    persistence.save(_record({"Host": "example.com"}))
+    models.ApiRequest.objects.filter(pk=record[0][1]["id"]).delete()
+    models.Blob.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+    call_command("apm_prune", stdout=StringIO())
+
+    assert [r.headers for r in models.ApiRequest.objects.all()] == [
+        {"Host": "example.com"}
+    ]
+    assert models.Blob.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_reused_blobs_are_refreshed():
+    persistence.save(_record({"Host": "testserver"}))
+    models.ApiRequest.objects.all().delete()
+    models.Blob.objects.update(created_at=timezone.now() - timedelta(days=1))
+
+    # Reused by a row that's still being written when the prune runs
+    record = _record({"Host": "testserver"})
+    persistence.save(record)
+    models.ApiRequest.objects.filter(pk=record[0][1]["id"]).delete()
+    call_command("apm_prune", stdout=StringIO())
+
+    blob = models.Blob.objects.get()
+    assert blob.created_at > timezone.now() - timedelta(minutes=1)
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_moves_the_values_to_blobs():
+    executor = MigrationExecutor(connection)
+    executor.migrate(BEFORE)
+    old_apps = executor.loader.project_state(BEFORE).apps
+    ids = [uuid.uuid4(), uuid.uuid4()]
+    for request_id in ids:
+        old_apps.get_model("apm", "ApiRequest").objects.create(
+            id=request_id, method="GET", path="/", headers={"Host": "testserver"}
+        )
+    old_apps.get_model("apm", "ErrorTrace").objects.create(
+        request_id=ids[0], exception_class="ValueError", traceback="Traceback (...)"
+    )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(AFTER)
+    assert models.Blob.objects.count() == 2
+    assert models.ApiRequest.objects.get(pk=ids[1]).headers == {"Host": "testserver"}
+    assert models.ErrorTrace.objects.get().traceback == "Traceback (...)"
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(BEFORE)
+    ApiRequest = old_apps.get_model("apm", "ApiRequest")
+    assert ApiRequest.objects.get(pk=ids[1]).headers == {"Host": "testserver"}
+    trace = old_apps.get_model("apm", "ErrorTrace").objects.get()
+    assert trace.traceback == "Traceback (...)"
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
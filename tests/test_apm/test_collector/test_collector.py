@@ -0,0 +1,74 @@
+import socket
+import uuid
+
+import pytest
+from django.urls import reverse
+
+from djapm.apm import collector, models
+from djapm.apm.collector import Collector
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+@pytest.fixture
+def apm_collector(settings, tmp_path):
+    address = str(tmp_path / "collector.sock")
+    settings.APM_COLLECTOR_ADDRESS = address
+    server = Collector(address, batch_size=10, flush_interval=1)
+    server.bind()
+    yield server
+    server.close()
+
+
+@pytest.mark.django_db
+def test_middleware_records_are_saved_by_the_collector(
+    apm_collector: Collector, apm_rf: ApmRequestFactory
+):
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    middleware(request)
+
+    assert not models.ApiRequest.objects.exists()
+    assert apm_collector.receive(timeout=1)
+    assert apm_collector.flush() == 1
+    assert models.ApiResponse.objects.get(request_id=request.id).status_code == 200
+
+
+def test_send_fails_when_the_collector_is_down(settings, tmp_path):
+    settings.APM_COLLECTOR_ADDRESS = str(tmp_path / "missing.sock")
+    record = [(models.ApiRequest, {"id": str(uuid.uuid4()), "method": "GET"})]
+
+    assert not collector.send(record)
+
+
+def test_send_is_disabled_without_an_address(settings):
+    settings.APM_COLLECTOR_ADDRESS = None
+
+    assert not collector.send([])
+
+
+@pytest.mark.django_db
+def test_records_bigger_than_a_datagram_are_saved_directly(
+    apm_collector: Collector, apm_rf: ApmRequestFactory
+):
+    # The query string is stored on the request, so the record is over 64KB
+    url = reverse("polls-list") + "?q=" + "x" * 100_000
+    request = apm_rf("GET", url, get_polls, drf_req=True)
+    record = [(models.ApiRequest, {"id": str(uuid.uuid4()), "path": "x" * 100_000})]
+
+    assert not collector.send(record)
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    middleware(request)
+
+    assert not apm_collector.receive(timeout=0.1)
+    assert models.ApiRequest.objects.filter(id=request.id).exists()
+
+
+def test_truncated_messages_are_ignored(apm_collector: Collector):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    client.sendto(b"[" * (apm_collector.max_message_size + 10), apm_collector.address)
+    client.close()
+
+    assert apm_collector.receive(timeout=1)
+    assert apm_collector.pending == []
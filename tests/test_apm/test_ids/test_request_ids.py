@@ -0,0 +1,92 @@
+import uuid
+
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.urls import reverse
+from django.utils import timezone
+
+from djapm.apm import ids, models
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+def test_uuid7_are_time_ordered():
+    generated = [ids.uuid7() for _ in range(5000)]
+
+    assert generated == sorted(generated)
+    assert {u.version for u in generated} == {7}
+    assert {u.variant for u in generated} == {uuid.RFC_4122}
+
+
+def test_request_id_version_setting(settings, apm_rf: ApmRequestFactory):
+    settings.APM_REQUEST_ID_VERSION = 7
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+
+    assert uuid.UUID(request.id).version == 7
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_keeps_the_existing_string_ids():
+    executor = MigrationExecutor(connection)
+    before = [("apm", "0010_apiresponse_memory")]
+    executor.migrate(before)
+    old_apps = executor.loader.project_state(before).apps
+    request_id = str(uuid.uuid4())
+    ApiRequest = old_apps.get_model("apm", "ApiRequest")
+    ApiResponse = old_apps.get_model("apm", "ApiResponse")
+    ApiRequest.objects.create(id=request_id, method="GET", path="/")
+    ApiResponse.objects.create(request_id=request_id, status_code=200, ellapsed=0.1)
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+    api_request = models.ApiRequest.objects.get(id=request_id)
+    assert api_request.id == uuid.UUID(request_id)
+    assert api_request.response.status_code == 200
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_restores_the_string_ids():
+    executor = MigrationExecutor(connection)
+    before = [("apm", "0010_apiresponse_memory")]
+    after = [("apm", "0011_apirequest_uuid_id")]
+    executor.migrate(after)
+    request_id = str(uuid.uuid4())
+    new_apps = executor.loader.project_state(after).apps
+    new_apps.get_model("apm", "ApiRequest").objects.create(
+        id=request_id, method="GET", path="/"
+    )
+    new_apps.get_model("apm", "ApiResponse").objects.create(
+        request_id=request_id, status_code=200, ellapsed=0.1
+    )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(before)
+    old_apps = executor.loader.project_state(before).apps
+    ApiRequest = old_apps.get_model("apm", "ApiRequest")
+    assert ApiRequest.objects.get().id == request_id
+    assert ApiRequest.objects.get(id=request_id).response.status_code == 200
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+@pytest.mark.django_db
+def test_request_log_is_named_after_its_trace():
+    request = models.ApiRequest.objects.create(
+        id=uuid.uuid4(), view_name="polls.drf.get_polls", method="GET", path="/"
+    )
+    trace = models.ErrorTrace.objects.create(
+        request=request, exception_class="ValueError", exception_args="Oops"
+    )
+    log = models.RequestLog.objects.create(
+        trace=trace,
+        level="ERROR",
+        file_path="views.py",
+        func_name="view",
+        timestamp=timezone.now(),
+        message="Oops",
+    )
+
+    assert str(log) == str(request.id)
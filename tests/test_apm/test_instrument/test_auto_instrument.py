@@ -0,0 +1,47 @@
+import pytest
+from django.core.exceptions import ImproperlyConfigured
+from django.urls import reverse
+
+from djapm.apm import instrument, models
+
+
+@pytest.fixture
+def auto_instrument(settings):
+    settings.APM_AUTO_INSTRUMENT = True
+    settings.MIDDLEWARE = [
+        *settings.MIDDLEWARE,
+        "djapm.apm.middlewares.ApmMetricsMiddleware",
+    ]
+    return settings
+
+
+@pytest.mark.django_db
+def test_plain_views_are_tracked(auto_instrument, admin_client):
+    admin_client.get(reverse("polls-list-viewset"))
+
+    api_request = models.ApiRequest.objects.get()
+    assert api_request.view_name == "polls.drf.PollViewSet"
+    assert api_request.response.status_code == 200
+
+
+@pytest.mark.django_db
+def test_decorated_views_are_tracked_once(auto_instrument, admin_client):
+    admin_client.get(reverse("polls-list"))
+
+    assert models.ApiRequest.objects.get().view_name == "polls.drf.get_polls"
+
+
+@pytest.mark.django_db
+def test_excluded_views_are_not_tracked(auto_instrument, admin_client):
+    auto_instrument.APM_AUTO_INSTRUMENT_EXCLUDE = ["path:^/api/polls-view"]
+    admin_client.get(reverse("polls-list-viewset"))
+    auto_instrument.APM_AUTO_INSTRUMENT_EXCLUDE = []
+    auto_instrument.APM_AUTO_INSTRUMENT_INCLUDE = ["namespace:api"]
+    admin_client.get(reverse("polls-list-viewset"))
+
+    assert not models.ApiRequest.objects.exists()
+
+
+def test_invalid_rules_are_rejected():
+    with pytest.raises(ImproperlyConfigured):
+        instrument.compile_rules(["url:polls-list"])
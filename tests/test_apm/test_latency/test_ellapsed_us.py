@@ -0,0 +1,114 @@
+import uuid
+
+import pytest
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.urls import reverse
+from django.utils import timezone
+
+from djapm.apm import models
+
+
+BEFORE = [("apm", "0014_rollup_sketch")]
+AFTER = [("apm", "0015_apiresponse_ellapsed_us")]
+DECIMALS = [("apm", "0016_blobs")]
+MICROSECONDS = [("apm", "0017_latency_microseconds")]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_converts_the_ellapsed_times():
+    executor = MigrationExecutor(connection)
+    executor.migrate(BEFORE)
+    old_apps = executor.loader.project_state(BEFORE).apps
+    request_id = uuid.uuid4()
+    old_apps.get_model("apm", "ApiRequest").objects.create(
+        id=request_id, method="GET", path="/"
+    )
+    old_apps.get_model("apm", "ApiResponse").objects.create(
+        request_id=request_id, status_code=200, ellapsed="0.123"
+    )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(AFTER)
+    new_apps = executor.loader.project_state(AFTER).apps
+    response = new_apps.get_model("apm", "ApiResponse").objects.get()
+    assert response.ellapsed_us == 123_000
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(BEFORE)
+    response = old_apps.get_model("apm", "ApiResponse").objects.get()
+    assert float(response.ellapsed) == pytest.approx(0.123)
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+@pytest.mark.django_db(transaction=True)
+def test_migration_converts_the_other_times():
+    executor = MigrationExecutor(connection)
+    executor.migrate(DECIMALS)
+    old_apps = executor.loader.project_state(DECIMALS).apps
+    request_id = uuid.uuid4()
+    old_apps.get_model("apm", "ApiRequest").objects.create(
+        id=request_id, method="GET", path="/"
+    )
+    old_apps.get_model("apm", "ApiResponse").objects.create(
+        request_id=request_id, status_code=200, ellapsed_us=1, db_time="0.042"
+    )
+    old_apps.get_model("apm", "Span").objects.create(
+        request_id=request_id, index=0, name="view", start="0.001", duration="0.5"
+    )
+    old_apps.get_model("apm", "HourRollup").objects.create(
+        bucket=timezone.now().replace(minute=0, second=0, microsecond=0),
+        view_name="polls.drf.get_polls",
+        method="GET",
+        status_class=2,
+        count=2,
+        ellapsed_sum="1.5",
+        ellapsed_min="0.25",
+        ellapsed_max="1.25",
+    )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(MICROSECONDS)
+    new_apps = executor.loader.project_state(MICROSECONDS).apps
+    response = new_apps.get_model("apm", "ApiResponse").objects.get()
+    span = new_apps.get_model("apm", "Span").objects.get()
+    rollup = new_apps.get_model("apm", "HourRollup").objects.get()
+    assert response.db_time_us == 42_000
+    assert (span.start_us, span.duration_us) == (1_000, 500_000)
+    assert (rollup.ellapsed_sum_us, rollup.ellapsed_min_us, rollup.ellapsed_max_us) == (
+        1_500_000,
+        250_000,
+        1_250_000,
+    )
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(DECIMALS)
+    response = old_apps.get_model("apm", "ApiResponse").objects.get()
+    rollup = old_apps.get_model("apm", "HourRollup").objects.get()
+    assert float(response.db_time) == pytest.approx(0.042)
+    assert float(rollup.ellapsed_max) == pytest.approx(1.25)
+
+    executor = MigrationExecutor(connection)
+    executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+@pytest.mark.django_db
+def test_sub_millisecond_times_are_kept(admin_client):
+    for ellapsed_us in (150, 2_500_000):
+        request = models.ApiRequest.objects.create(
+            id=uuid.uuid4(), view_name="polls.drf.get_polls", method="GET", path="/"
+        )
+        models.ApiResponse.objects.create(
+            request=request, status_code=200, ellapsed_us=ellapsed_us
+        )
+
+    ellapsed = admin_client.get(reverse("response_view_name_ellapsed_time")).json()
+    listed = admin_client.get(
+        reverse("admin:apm_apiresponse_changelist"), {"ellapsed": "<=,0.2"}
+    )
+
+    assert ellapsed["min"]["polls.drf.get_polls"] == pytest.approx(0.00015)
+    assert ellapsed["avg"]["polls.drf.get_polls"] == pytest.approx(1.250075)
+    assert listed.context["cl"].result_count == 1
@@ -0,0 +1,131 @@
+import threading
+import time
+import uuid
+
+import pytest
+from django.urls import reverse
+
+from djapm.apm import live
+from djapm.apm.live import LiveCounters
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+@pytest.fixture
+def counters():
+    counters = LiveCounters(f"djapm_test_{uuid.uuid4().hex[:8]}", 4, 8, 5)
+    yield counters
+    counters.unlink()
+    counters.close()
+
+
+def test_counters_are_shared_between_instances(counters: LiveCounters):
+    counters.record("polls-list", 0.01, error=False)
+    counters.record("polls-list", 0.3, error=True)
+
+    other = LiveCounters(counters.name, 4, 8, 5)
+    other.record("polls-detail", 2, error=False)
+    snapshot = other.snapshot(5)
+    other.close()
+
+    assert snapshot["polls-list"]["count"] == 2
+    assert snapshot["polls-list"]["errors"] == 1
+    assert snapshot["polls-list"]["avg"] == pytest.approx(0.155)
+    assert snapshot["polls-list"]["histogram"] == [1, 0, 0, 0, 1, 0, 0, 0]
+    assert counters.snapshot(5)["polls-detail"]["count"] == 1
+
+
+class _YieldingInts:
+    """Switches to the other threads between reading and writing an integer,
+    like a free-threaded interpreter may do"""
+
+    def __init__(self, ints):
+        self.ints = ints
+
+    def __getitem__(self, index):
+        value = self.ints[index]
+        time.sleep(0)
+        return value
+
+    def __setitem__(self, index, value):
+        self.ints[index] = value
+
+
+def test_counters_are_thread_safe(counters: LiveCounters, monkeypatch):
+    monkeypatch.setattr(counters, "ints", _YieldingInts(counters.ints))
+
+    def record():
+        for _ in range(200):
+            counters.record("polls-list", 0.01, error=False)
+
+    threads = [threading.Thread(target=record) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    monkeypatch.undo()
+
+    snapshot = counters.snapshot(5)["polls-list"]
+    assert snapshot["count"] == 1600
+    assert snapshot["histogram"][0] == 1600
+
+
+def test_counters_layout_must_match(counters: LiveCounters):
+    with pytest.raises(ValueError):
+        LiveCounters(counters.name, 4, 8, 10)
+
+
+def test_long_view_names_keep_their_own_slots(counters: LiveCounters):
+    prefix = "ç" * live.NAME_SIZE
+    counters.record(prefix + "list", 0.01, error=False)
+    counters.record(prefix + "detail", 0.01, error=False)
+    counters.record(prefix + "detail", 0.01, error=False)
+
+    snapshot = counters.snapshot(5)
+
+    assert sorted(view["count"] for view in snapshot.values()) == [1, 2]
+    for name in snapshot:
+        assert len(name.encode()) <= live.NAME_SIZE
+        assert name.startswith("ç" * 50)
+
+
+def test_failing_to_open_the_segment_disables_the_counters(settings, monkeypatch):
+    settings.APM_LIVE_COUNTERS = True
+    monkeypatch.setattr(live, "_counters", None)
+    monkeypatch.setattr(live, "_failed", False)
+
+    def denied(*args, **kwargs):
+        raise PermissionError("Permission denied: '/djapm_live_counters'")
+
+    monkeypatch.setattr(live.shared_memory, "SharedMemory", denied)
+
+    assert live.get_counters() is None
+    assert live._failed
+
+
+@pytest.mark.django_db
+def test_middleware_counts_requests(
+    counters: LiveCounters, apm_rf: ApmRequestFactory, monkeypatch
+):
+    monkeypatch.setattr(live, "_counters", counters)
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    middleware(request)
+
+    assert counters.snapshot(1)[request.view_name]["count"] == 1
+
+
+@pytest.mark.django_db
+def test_live_view_stats_validates_the_minutes(
+    counters: LiveCounters, admin_client, monkeypatch
+):
+    monkeypatch.setattr(live, "_counters", counters)
+    counters.record("polls-list", 0.01, error=False)
+    url = reverse("live_view_stats")
+
+    assert admin_client.get(url, {"minutes": "abc"}).status_code == 400
+    for minutes in ("-3", "0", "1000"):
+        response = admin_client.get(url, {"minutes": minutes})
+        assert response.status_code == 200
+        assert response.json()["requests"] == {"polls-list": 1}
@@ -0,0 +1,74 @@
+import contextvars
+import io
+import logging
+
+from django.urls import reverse
+
+from djapm.apm import log
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+def test_records_are_captured_by_the_request_on_the_current_context(
+    apm_rf: ApmRequestFactory,
+):
+    first = contextvars.copy_context().run(
+        apm_rf, "GET", reverse("polls-list"), get_polls, drf_req=True
+    )
+    second_context = contextvars.copy_context()
+    second = second_context.run(
+        apm_rf, "GET", reverse("polls-list"), get_polls, drf_req=True
+    )
+
+    second_context.run(second.logger.error, "Second request")
+
+    assert [r.getMessage() for r in second._log_capture.records] == ["Second request"]
+    assert not first._log_capture.records
+    assert second.logger.handlers.count(log.handler) == 1
+
+
+def test_capture_is_bounded_and_respects_the_level(settings, apm_rf: ApmRequestFactory):
+    settings.APM_LOG_CAPTURE_MAX_RECORDS = 2
+    settings.APM_LOG_CAPTURE_LEVEL = "ERROR"
+
+    def handle_request():
+        request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+        request.logger.warning("Not captured")
+        for i in range(3):
+            request.logger.error("Error %s", i)
+        return request
+
+    request = contextvars.copy_context().run(handle_request)
+
+    assert [r.getMessage() for r in request._log_capture.records] == [
+        "Error 1",
+        "Error 2",
+    ]
+
+
+def test_release_capture_stops_capturing(apm_rf: ApmRequestFactory):
+    def handle_request():
+        request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+        log._release_capture()
+        request.logger.error("After the request")
+        return request
+
+    request = contextvars.copy_context().run(handle_request)
+
+    assert not request._log_capture.records
+
+
+def test_queue_output_writes_the_records_from_the_listener_thread(tmp_path):
+    stream = io.StringIO()
+    file_path = tmp_path / "apm.log"
+    handler = log.ApmStreamHandler(stream)
+    handler.enable_queue_output(str(file_path))
+    logger = logging.getLogger("test_queue_output")
+    logger.addHandler(handler)
+    logger.propagate = False
+
+    logger.error("Written by the %s", "listener")
+    handler.queue_output.stop()
+
+    assert stream.getvalue() == "Written by the listener\n"
+    assert file_path.read_text() == "Written by the listener\n"
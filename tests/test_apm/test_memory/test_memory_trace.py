@@ -0,0 +1,50 @@
+import tracemalloc
+
+import pytest
+from django.http import HttpResponse
+from django.urls import reverse
+
+from djapm.apm import models
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+@pytest.mark.django_db
+def test_sampled_requests_memory_is_traced(settings, apm_rf: ApmRequestFactory):
+    settings.APM_MEMORY_SAMPLING_RATE = 1.0
+    leak = []
+
+    def get_response(request):
+        leak.append(bytearray(1024 * 1024))
+        return HttpResponse()
+
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(get_response)(request)
+
+    response = models.ApiResponse.objects.get(request_id=request.id)
+    assert response.memory_peak >= 1024 * 1024
+    assert response.memory_net >= 1024 * 1024
+    assert "test_memory_trace.py" in response.memory_top[0]["site"]
+    assert not tracemalloc.is_tracing()
+
+
+@pytest.mark.django_db
+def test_memory_is_not_traced_by_default(apm_rf: ApmRequestFactory):
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(lambda r: HttpResponse())(request)
+
+    assert models.ApiResponse.objects.get(request_id=request.id).memory_peak is None
+
+
+def test_untracked_requests_memory_is_not_traced(settings, rf):
+    settings.APM_MEMORY_SAMPLING_RATE = 1.0
+    tracing = []
+
+    def get_response(request):
+        tracing.append(tracemalloc.is_tracing())
+        return HttpResponse()
+
+    ApmMetricsMiddleware(get_response)(rf.get("/"))
+
+    assert tracing == [False]
@@ -0,0 +1,41 @@
+import asyncio
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.urls import reverse
+
+from djapm.apm import models
+from djapm.apm.middlewares import ApmMetricsMiddleware, ErrorTraceMiddleware
+from polls.views import AsyncPollsPage, get_polls_page_async
+
+
+def test_middlewares_switch_to_async_mode_when_get_response_is_async():
+    async def get_response(request):
+        ...
+
+    assert asyncio.iscoroutinefunction(ApmMetricsMiddleware(get_response))
+    assert asyncio.iscoroutinefunction(ErrorTraceMiddleware(get_response))
+    assert not asyncio.iscoroutinefunction(ApmMetricsMiddleware(lambda r: r))
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize(
+    "url_name, view",
+    [
+        ("polls-page-async", get_polls_page_async),
+        ("polls-page-async-cbv", AsyncPollsPage.as_view()),
+    ],
+)
+def test_async_view_is_registered_by_async_middleware(
+    async_rf, admin_user, url_name, view
+):
+    middleware = ApmMetricsMiddleware(view)
+    request = async_rf.get(reverse(url_name))
+    request.user = admin_user
+
+    response = async_to_sync(middleware)(request)
+
+    assert response.status_code == 200
+    api_request = models.ApiRequest.objects.get(id=request.id)
+    assert api_request.view_name.startswith("polls.dj.")
+    assert api_request.response.status_code == 200
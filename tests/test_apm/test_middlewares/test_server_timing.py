@@ -0,0 +1,36 @@
+import pytest
+from django.http import HttpResponse
+from django.urls import reverse
+
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+def get_response(request):
+    with request.apm.span('charge "card"'):
+        return HttpResponse()
+
+
+@pytest.mark.django_db
+def test_server_timing_header_is_added(settings, apm_rf: ApmRequestFactory):
+    settings.APM_SERVER_TIMING = True
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    response = ApmMetricsMiddleware(get_response)(request)
+
+    total, db, span = response["Server-Timing"].split(", ")
+    assert total.startswith("total;dur=")
+    assert db == "db;dur=0.00"
+    assert span.startswith('span0;desc="charge _card_";dur=')
+
+
+@pytest.mark.django_db
+def test_server_timing_header_is_restricted_to_staff(
+    settings, apm_rf: ApmRequestFactory, django_user_model
+):
+    settings.APM_SERVER_TIMING = "staff"
+    user = django_user_model.objects.create_user(username="user")
+    request = apm_rf("GET", reverse("polls-list"), get_polls, user=user)
+    response = ApmMetricsMiddleware(get_response)(request)
+
+    assert not response.has_header("Server-Timing")
@@ -0,0 +1,85 @@
+import threading
+import time
+
+import pytest
+from django.http import HttpResponse
+from django.urls import reverse
+
+from djapm.apm import admin, decorators, models, profiler
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+@pytest.fixture
+def sampler(settings, monkeypatch):
+    settings.APM_PROFILER_THRESHOLD = 0.01
+    sampler = profiler.StackSampler(interval=0.001)
+    monkeypatch.setattr(profiler, "_sampler", sampler)
+    return sampler
+
+
+@pytest.mark.django_db
+def test_slow_requests_stacks_are_saved(
+    sampler: profiler.StackSampler, apm_rf: ApmRequestFactory
+):
+    def slow_view(request):
+        time.sleep(0.05)
+        return HttpResponse()
+
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(slow_view)(request)
+
+    profile = models.StackProfile.objects.get(request_id=request.id)
+    assert profile.samples > 0
+    assert "slow_view (test_profiler.py:" in profile.stacks
+    assert sampler.ticks > 0 and profile.overhead > 0
+    assert "slow_view" in admin.display_flamegraph(profile.stacks)
+
+
+@pytest.mark.django_db
+def test_fast_requests_stacks_are_not_saved(
+    sampler: profiler.StackSampler, apm_rf: ApmRequestFactory
+):
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(lambda r: HttpResponse())(request)
+
+    assert models.ApiResponse.objects.filter(request_id=request.id).exists()
+    assert not models.StackProfile.objects.exists()
+
+
+@pytest.mark.django_db
+def test_only_the_tracked_requests_are_sampled(
+    sampler: profiler.StackSampler, rf, admin_user
+):
+    sampled = []
+
+    def untracked_view(request):
+        sampled.append(dict(sampler._active))
+        return HttpResponse()
+
+    @decorators.apm_view()
+    def tracked_view(request):
+        sampled.append(dict(sampler._active))
+        time.sleep(0.05)
+        return HttpResponse()
+
+    ApmMetricsMiddleware(untracked_view)(rf.get("/"))
+    request = rf.get("/")
+    request.user = admin_user
+    ApmMetricsMiddleware(tracked_view)(request)
+
+    assert sampled[0] == {}
+    assert list(sampled[1]) == [threading.get_ident()]
+    assert models.StackProfile.objects.filter(request_id=request.id).exists()
+
+
+def test_samples_are_not_changed_after_stop(sampler: profiler.StackSampler):
+    samples = sampler.start()
+    time.sleep(0.02)
+    sampler.stop(samples)
+    stacks = dict(samples.stacks)
+    time.sleep(0.02)
+
+    assert sum(stacks.values()) > 0
+    assert samples.stacks == stacks
@@ -0,0 +1,75 @@
+import marshal
+
+import pytest
+from django.contrib.auth import get_user_model
+from django.contrib.admin.sites import site
+from django.urls import reverse
+
+from djapm.apm import models, profiling
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+
+
+@pytest.mark.django_db
+def test_request_with_profile_token_is_profiled(admin_client, admin_user, rf):
+    token = admin_client.post(reverse("profile_token")).json()["token"]
+
+    request = rf.get(reverse("polls-list"), HTTP_X_APM_PROFILE=token)
+    request.user = admin_user
+    ApmMetricsMiddleware(get_polls)(request)
+
+    stats = models.ProfileStats.objects.get(request_id=request.id)
+    assert any(f["function"].startswith("get_polls") for f in profiling.top(stats.data))
+    model_admin = site._registry[models.ApiRequest]
+    assert "Download pstats" in model_admin.display_profile_stats(
+        models.ApiRequest.objects.get(id=request.id)
+    )
+    response = admin_client.get(
+        reverse("admin:apm_apirequest_profile", args=(request.id,))
+    )
+    assert marshal.loads(response.content) == profiling.load(stats.data)
+
+
+@pytest.mark.django_db
+def test_request_with_invalid_profile_token_is_not_profiled(admin_user, rf):
+    request = rf.get(reverse("polls-list"), {"apm_profile": "1:forged:token"})
+    request.user = admin_user
+    ApmMetricsMiddleware(get_polls)(request)
+
+    assert models.ApiRequest.objects.filter(id=request.id).exists()
+    assert not models.ProfileStats.objects.exists()
+
+
+@pytest.mark.django_db
+def test_profile_tokens_are_single_use(admin_client, admin_user, rf):
+    token = admin_client.post(reverse("profile_token")).json()["token"]
+
+    requests = []
+    for _ in range(2):
+        request = rf.get(reverse("polls-list"), {"page": "1", "apm_profile": token})
+        request.user = admin_user
+        ApmMetricsMiddleware(get_polls)(request)
+        requests.append(request)
+
+    assert models.ProfileStats.objects.filter(request_id=requests[0].id).exists()
+    assert not models.ProfileStats.objects.filter(request_id=requests[1].id).exists()
+    # The token is not stored with the request
+    stored = models.ApiRequest.objects.get(id=requests[0].id)
+    assert stored.query_string == "page=1"
+    assert "apm_profile" not in stored.query_parameters
+
+
+@pytest.mark.django_db
+def test_profiles_are_only_downloaded_by_superusers(
+    admin_client, admin_user, client, rf
+):
+    token = admin_client.post(reverse("profile_token")).json()["token"]
+    request = rf.get(reverse("polls-list"), HTTP_X_APM_PROFILE=token)
+    request.user = admin_user
+    ApmMetricsMiddleware(get_polls)(request)
+    staff = get_user_model().objects.create_user("staff", is_staff=True)
+    client.force_login(staff)
+
+    response = client.get(reverse("admin:apm_apirequest_profile", args=(request.id,)))
+
+    assert response.status_code == 403
@@ -0,0 +1,78 @@
+from datetime import timedelta
+from io import StringIO
+import uuid
+
+import pytest
+from django.core.management import call_command
+from django.utils import timezone
+
+from djapm.apm import models, rollups
+
+
+def _request(days_ago: int, error: bool = False) -> models.ApiRequest:
+    at = timezone.now() - timedelta(days=days_ago)
+    request = models.ApiRequest.objects.create(
+        id=uuid.uuid4(),
+        view_name="polls.drf.get_polls",
+        method="GET",
+        path="/polls/",
+        requested_at=at,
+    )
+    models.ApiResponse.objects.create(
+        request=request, status_code=500 if error else 200, ellapsed_us=100_000
+    )
+    if error:
+        models.ErrorTrace.objects.create(request=request, exception_class="ValueError")
+        models.ErrorTrace.objects.filter(pk=request.pk).update(created_at=at)
+    return request
+
+
+@pytest.fixture
+def requests(settings):
+    settings.APM_RETENTION_DAYS = {"ApiRequest": 30, "ErrorTrace": 90}
+    return {
+        "expired": [_request(40), _request(40), _request(41)],
+        "error": _request(40, error=True),
+        "recent": _request(1),
+    }
+
+
+@pytest.mark.django_db
+def test_prune_deletes_the_expired_rows_in_chunks(requests):
+    call_command("apm_prune", chunk_size=2, sleep=0, stdout=StringIO())
+
+    remaining = set(models.ApiRequest.objects.values_list("pk", flat=True))
+    assert remaining == {requests["error"].pk, requests["recent"].pk}
+    assert models.ApiResponse.objects.count() == 2
+    # The expired requests are kept on the hour rollups
+    folded = models.HourRollup.objects.filter(status_class=2)
+    assert sum(r.count for r in folded) == 3
+
+
+@pytest.mark.django_db
+def test_prune_dry_run(requests):
+    out = StringIO()
+    call_command("apm_prune", dry_run=True, stdout=out)
+
+    assert models.ApiRequest.objects.count() == 5
+    assert not models.HourRollup.objects.exists()
+    assert "ApiRequest: 3 ApiRequest rows" in out.getvalue()
+    assert "ApiRequest: 3 ApiResponse rows" in out.getvalue()
+    assert "Would delete 6 rows" in out.getvalue()
+
+
+@pytest.mark.django_db
+def test_prune_folds_once_over_the_expired_range(requests, monkeypatch):
+    calls = []
+    fold = rollups.fold
+    monkeypatch.setattr(
+        rollups,
+        "fold",
+        lambda *args, **kwargs: calls.append(kwargs) or fold(*args, **kwargs),
+    )
+
+    call_command("apm_prune", sleep=0, stdout=StringIO())
+
+    assert len(calls) == 1
+    assert calls[0]["since"] == requests["expired"][2].requested_at
+    assert sum(r.count for r in models.HourRollup.objects.all()) == 4
@@ -0,0 +1,127 @@
+import pytest
+from django.db import connection
+from django.http import HttpResponse
+from django.urls import reverse
+
+from djapm.apm import models, queries
+from djapm.apm.middlewares import ApmMetricsMiddleware, ErrorTraceMiddleware
+from polls.models import Poll
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+@pytest.mark.django_db
+def test_request_queries_are_saved_on_the_response(apm_rf: ApmRequestFactory):
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    middleware(request)
+
+    response = models.ApiResponse.objects.get(request_id=request.id)
+    assert response.db_query_count == 1
+    assert response.db_time is not None
+    assert response.db_aliases["default"]["count"] == 1
+
+
+@pytest.mark.django_db
+def test_apm_writes_are_not_counted(apm_rf: ApmRequestFactory):
+    def get_response(request):
+        response = get_polls(request)
+        ErrorTraceMiddleware(get_polls).process_exception(request, ValueError("Oops"))
+        return response
+
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(get_response)(request)
+
+    assert models.ErrorTrace.objects.filter(request_id=request.id).exists()
+    response = models.ApiResponse.objects.get(request_id=request.id)
+    assert response.db_query_count == 1
+
+
+@pytest.mark.django_db
+def test_queries_are_not_tracked_when_disabled(settings, apm_rf: ApmRequestFactory):
+    settings.APM_TRACK_QUERIES = False
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(lambda r: get_polls(r))(request)
+
+    response = models.ApiResponse.objects.get(request_id=request.id)
+    assert response.db_query_count is None
+
+
+def test_fingerprint_strips_literals_and_collapses_lists():
+    assert queries.fingerprint(
+        "SELECT * FROM t WHERE name = 'it''s'  AND id IN (1, 2, 3) LIMIT 21"
+    ) == queries.fingerprint("SELECT * FROM t WHERE name = 'x' AND id IN (%s) LIMIT 1")
+    assert (
+        queries.fingerprint('INSERT INTO "t1" ("a") VALUES (%s), (%s), (%s)')
+        == 'INSERT INTO "t1" ("a") VALUES (...)'
+    )
+
+
+@pytest.mark.django_db
+def test_repeated_queries_are_flagged_and_aggregated(
+    apm_rf: ApmRequestFactory, monkeypatch
+):
+    monkeypatch.setattr(queries, "counter", queries.QueryFingerprintCounter(60))
+
+    def get_response(request):
+        for poll_id in range(7):
+            Poll.objects.filter(id=poll_id).first()
+        return get_polls(request)
+
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(get_response)(request)
+    queries.counter.flush()
+
+    response = models.ApiResponse.objects.get(request_id=request.id)
+    [repeated] = response.db_repeated_queries
+    assert repeated["count"] == 7
+    top = models.QueryFingerprint.objects.filter(view_name=request.view_name)
+    assert top.get(fingerprint=repeated["fingerprint"]).max_per_request == 7
+    assert top.count() == 2  # and the get_polls query
+
+
+@pytest.mark.django_db
+def test_queries_of_untracked_requests_are_not_wrapped(rf):
+    wrappers = []
+
+    def get_response(request):
+        wrappers.append(list(connection.execute_wrappers))
+        return HttpResponse()
+
+    ApmMetricsMiddleware(get_response)(rf.get("/"))
+
+    assert wrappers == [[]]
+
+
+@pytest.mark.django_db
+def test_only_the_fingerprints_are_kept():
+    stats = queries.QueryStats()
+    stats.start()
+    try:
+        for pk in (1, 2, 3):
+            list(Poll.objects.filter(pk__in=[pk] * pk))
+    finally:
+        stats.stop()
+
+    # The three IN lists have the same fingerprint
+    [(sql, (count, _))] = stats.fingerprints.items()
+    assert "IN (...)" in sql
+    assert count == 3
+
+
+@pytest.mark.django_db
+def test_top_queries_validates_the_limit(admin_client):
+    for i in range(3):
+        models.QueryFingerprint.objects.create(
+            view_name="get_polls",
+            fingerprint=str(i) * 40,
+            sql="SELECT ?",
+            count=i,
+            total_time=i,
+        )
+    url = reverse("top_queries")
+
+    assert admin_client.get(url, {"limit": "abc"}).status_code == 400
+    assert len(admin_client.get(url, {"limit": "-1"}).json()) == 1
+    assert len(admin_client.get(url, {"limit": "2"}).json()) == 2
+    assert len(admin_client.get(url, {"limit": "1000"}).json()) == 3
@@ -0,0 +1,77 @@
+import pytest
+from django.conf import LazySettings
+from django.urls import reverse
+
+from djapm.apm import registry, rollups
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import AsyncPollsPage, get_polls
+from tests.types import ApmRequestFactory
+
+
+def test_view_config_is_cached_per_view(apm_rf: ApmRequestFactory):
+    first = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    second = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+
+    assert first._apm_config is second._apm_config
+    assert first._apm_config.view_name == "polls.drf.get_polls"
+    assert registry.get_config(AsyncPollsPage(), "dj", None) is registry.get_config(
+        AsyncPollsPage(), "dj", None
+    )
+
+
+def test_view_config_is_rebuilt_when_settings_change(
+    settings, apm_rf: ApmRequestFactory
+):
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    assert request._apm_config.save_headers
+
+    settings.APM_REQUEST_SAVE_HEADERS = False
+    settings.APM_SAMPLING_RATES = {"polls.drf.get_polls": 0.5}
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+
+    assert not request._apm_config.save_headers
+    assert request._apm_config.sampling_rate == 0.5
+
+
+def test_apm_settings_are_rebuilt_when_settings_change(settings):
+    settings.APM_ROLLUPS = False
+    assert registry.get_settings() is registry.get_settings()
+    assert not rollups.enabled()
+
+    settings.APM_ROLLUPS = True
+
+    assert rollups.enabled()
+
+
+@pytest.mark.django_db
+def test_tracked_requests_dont_read_the_settings(
+    apm_rf: ApmRequestFactory, monkeypatch
+):
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    middleware(apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True))
+    read = []
+    lookup = LazySettings.__getattr__
+
+    def recording(self, name):
+        read.append(name)
+        return lookup(self, name)
+
+    monkeypatch.setattr(LazySettings, "__getattr__", recording)
+    middleware(apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True))
+    monkeypatch.undo()
+
+    assert not set(read) & {
+        "APM_AUTO_INSTRUMENT",
+        "APM_COLLECTOR_ADDRESS",
+        "APM_LIVE_COUNTERS",
+        "APM_MAX_SPANS_PER_REQUEST",
+        "APM_MEMORY_SAMPLING_RATE",
+        "APM_N_PLUS_ONE_THRESHOLD",
+        "APM_PROFILER_THRESHOLD",
+        "APM_REQUEST_ID_VERSION",
+        "APM_ROLLUPS",
+        "APM_SAMPLING_KEEP_SLOWER_THAN",
+        "APM_SERVER_TIMING",
+        "APM_TRACK_QUERIES",
+        "APM_WRITE_BEHIND",
+    }
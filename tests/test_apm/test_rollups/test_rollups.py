@@ -0,0 +1,158 @@
+from datetime import timedelta
+import uuid
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from djapm.apm import models, rollups, sampling, writer
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+def test_rollups_merge():
+    first, second = rollups.Rollup(), rollups.Rollup()
+    first.add(0.003, False)
+    first.add(0.2, True)
+    second.add(20.0, False)
+
+    first.merge(second)
+
+    assert (first.count, first.errors) == (3, 1)
+    assert (first.min, first.max) == (0.003, 20.0)
+    assert first.histogram[0] == 1
+    assert first.histogram[rollups.LATENCY_BOUNDS.index(0.25)] == 1
+    assert first.histogram[-1] == 1
+
+
+@pytest.mark.django_db
+def test_requests_are_rolled_up(settings, apm_rf: ApmRequestFactory):
+    settings.APM_ROLLUPS = True
+    settings.APM_SAMPLING_RATES = {"polls.drf.get_polls": 0}
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+
+    # Flushed twice, so the second flush is merged into the existing rows
+    for _ in range(2):
+        for _ in range(3):
+            middleware(request)
+        rollups.counter.flush()
+    sampling.counter.flush()
+
+    for model in (models.MinuteRollup, models.HourRollup):
+        rollup = model.objects.get(view_name="polls.drf.get_polls")
+        assert (rollup.method, rollup.status_class) == ("GET", 2)
+        # The requests dropped by the sampling are rolled up too
+        assert rollup.count == 6
+        assert sum(rollup.histogram) == 6
+
+
+@pytest.mark.django_db
+def test_rebuild_from_stored_requests():
+    requested_at = timezone.now() - timedelta(hours=2)
+    for ellapsed_us, status_code in ((100_000, 200), (300_000, 200), (200_000, 500)):
+        request = models.ApiRequest.objects.create(
+            id=uuid.uuid4(),
+            view_name="polls.drf.get_polls",
+            method="GET",
+            path="/polls/",
+            requested_at=requested_at,
+        )
+        models.ApiResponse.objects.create(
+            request=request, status_code=status_code, ellapsed_us=ellapsed_us
+        )
+
+    assert rollups.rebuild(since=requested_at) == 3
+
+    ok = models.HourRollup.objects.get(status_class=2)
+    assert ok.count == 2
+    assert ok.ellapsed_sum_us == 400_000
+    assert models.HourRollup.objects.get(status_class=5).count == 1
+    assert models.MinuteRollup.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_dashboard_reads_the_rollups(settings, admin_client):
+    settings.APM_ROLLUPS = True
+    rollup = rollups.Rollup()
+    rollup.add(0.1, False)
+    rollup.add(0.3, True)
+    models.HourRollup.objects.create(
+        bucket=timezone.now().replace(minute=0, second=0, microsecond=0),
+        view_name="polls.drf.get_polls",
+        method="GET",
+        status_class=2,
+        **rollup.as_fields(),
+    )
+
+    counts = admin_client.get(reverse("request_view_name_count_by_date")).json()
+    ellapsed = admin_client.get(reverse("response_view_name_ellapsed_time")).json()
+
+    assert counts == {
+        "requests": {"polls.drf.get_polls": 2},
+        "errors": {"polls.drf.get_polls": 1},
+    }
+    assert ellapsed["avg"]["polls.drf.get_polls"] == pytest.approx(0.2)
+    assert ellapsed["max"]["polls.drf.get_polls"] == pytest.approx(0.3)
+
+
+@pytest.mark.django_db
+def test_rollups_of_responses_longer_than_1000s(settings, admin_client):
+    settings.APM_ROLLUPS = True
+    counter = rollups.RollupCounter(flush_interval=3600)
+    counter.add("polls.drf.get_polls", "GET", 200, 0.2, False)
+    counter.add("polls.drf.get_polls", "GET", 200, 1500.25, False)
+    counter.add("polls.drf.get_polls", "POST", 200, 0.1, False)
+    counter.flush()
+
+    rollup = models.HourRollup.objects.get(method="GET")
+    assert rollup.ellapsed_max_us == 1_500_250_000
+    assert rollup.ellapsed_min_us == 200_000
+    # The rollups after the long one are persisted too
+    assert models.HourRollup.objects.filter(method="POST").exists()
+    ellapsed = admin_client.get(reverse("response_view_name_ellapsed_time")).json()
+    assert ellapsed["max"]["polls.drf.get_polls"] == pytest.approx(1500.25)
+
+
+@pytest.mark.django_db
+def test_rollups_are_not_flushed_on_the_request_path():
+    counter = rollups.RollupCounter(flush_interval=0)
+    counter.add("polls.drf.get_polls", "GET", 200, 0.1, False)
+
+    assert not models.HourRollup.objects.exists()
+    assert counter.flush_if_due in writer.get_writer()._flushers
+    counter.flush_if_due()
+    assert models.HourRollup.objects.get().count == 1
+
+
+@pytest.mark.django_db
+def test_fold_completes_the_partially_covered_hours():
+    requested_at = timezone.now() - timedelta(hours=2)
+    for method in ("GET", "GET", "POST"):
+        request = models.ApiRequest.objects.create(
+            id=uuid.uuid4(),
+            view_name="polls.drf.get_polls",
+            method=method,
+            path="/polls/",
+            requested_at=requested_at,
+        )
+        models.ApiResponse.objects.create(
+            request=request, status_code=200, ellapsed_us=100_000
+        )
+    # Rolled up live, before the POST request
+    live = rollups.Rollup()
+    live.add(0.1, False)
+    models.HourRollup.objects.create(
+        bucket=rollups.truncate(requested_at, models.HourRollup),
+        view_name="polls.drf.get_polls",
+        method="GET",
+        status_class=2,
+        **live.as_fields(),
+    )
+
+    assert rollups.fold(timezone.now()) == 1
+    assert models.HourRollup.objects.get(method="POST").count == 1
+    # The existing rollups are kept as they are
+    assert models.HourRollup.objects.get(method="GET").count == 1
+    assert rollups.fold(timezone.now()) == 0
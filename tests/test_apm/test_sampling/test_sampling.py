@@ -0,0 +1,44 @@
+import pytest
+from django.urls import reverse
+
+from djapm.apm import models, sampling
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+def test_should_sample_uses_the_view_rate(settings):
+    settings.APM_SAMPLING_DEFAULT_RATE = 1
+    settings.APM_SAMPLING_RATES = {"polls.drf.get_polls": 0}
+
+    assert not sampling.should_sample("polls.drf.get_polls")
+    assert sampling.should_sample("polls.drf.Polls")
+
+
+@pytest.mark.parametrize(
+    "status_code, ellapsed, kept",
+    [(200, 0.1, False), (404, 0.1, True), (500, 0.1, True), (200, 2, True)],
+)
+def test_should_keep_errors_and_slow_requests(
+    settings, apm_rf: ApmRequestFactory, status_code, ellapsed, kept
+):
+    settings.APM_SAMPLING_KEEP_SLOWER_THAN = 1
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    request.apm_sampled = False
+
+    assert sampling.should_keep(request, status_code, ellapsed) is kept
+
+
+@pytest.mark.django_db
+def test_dropped_requests_are_counted(settings, apm_rf: ApmRequestFactory):
+    settings.APM_SAMPLING_RATES = {"polls.drf.get_polls": 0}
+    middleware = ApmMetricsMiddleware(lambda r: get_polls(r))
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+
+    for _ in range(3):
+        middleware(request)
+    sampling.counter.flush()
+
+    assert not models.ApiRequest.objects.exists()
+    dropped = models.DroppedRequestCount.objects.get(view_name="polls.drf.get_polls")
+    assert dropped.count == 3
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from io import StringIO
+import uuid
+
+import pytest
+from django.core.management import call_command
+from django.urls import reverse
+from django.utils import timezone
+
+from djapm.apm import models, persistence, shards
+
+
+@pytest.fixture
+def sharded(settings):
+    settings.APM_SHARD_DAYS = 1
+    settings.APM_ROLLUPS = True
+    call_command("apm_shards", ahead=1, stdout=StringIO())
+    yield
+    for shard in shards.existing(refresh=True):
+        shard.drop()
+
+
+def _record(status_code: int, requested_at=None):
+    request_id = uuid.uuid4()
+    return [
+        (
+            models.ApiRequest,
+            {
+                "id": request_id,
+                "view_name": "polls.drf.get_polls",
+                "method": "GET",
+                "path": "/polls/",
+                "requested_at": requested_at or timezone.now(),
+            },
+        ),
+        (
+            models.ApiResponse,
+            {
+                "request_id": request_id,
+                "status_code": status_code,
+                "ellapsed_us": 100_000,
+                "db_time_us": 50_000,
+                "db_query_count": 2,
+            },
+        ),
+    ]
+
+
+@pytest.mark.django_db(transaction=True)
+def test_successful_requests_go_to_their_shard(sharded):
+    persistence.save(_record(200))
+    persistence.save(_record(500))
+
+    shard = shards.get_shard(timezone.now().date())
+    assert shard.request.objects.count() == 1
+    assert shard.response.objects.get().status_code == 200
+    # The failed requests stay on the app tables, along with their error traces
+    assert models.ApiResponse.objects.get().status_code == 500
+
+
+@pytest.mark.django_db(transaction=True)
+def test_endpoints_and_admin_read_the_shards(sharded, admin_client):
+    record = _record(200)
+    persistence.save(record)
+    persistence.save(_record(500))
+
+    db_time = admin_client.get(reverse("response_view_name_db_time")).json()
+    page = admin_client.get(reverse("admin:apm_apirequest_shards"))
+
+    assert db_time["queries"] == {"polls.drf.get_polls": 2}
+    assert str(record[0][1]["id"]) in page.content.decode()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_expired_shards_are_folded_and_dropped(sharded, settings):
+    settings.APM_RETENTION_DAYS = {"ApiRequest": 30}
+    requested_at = timezone.now() - timedelta(days=40)
+    expired = shards.get_shard(requested_at.date())
+    expired.create()
+    persistence.save(_record(200, requested_at))
+    assert expired.request.objects.count() == 1
+
+    call_command("apm_shards", stdout=StringIO())
+
+    assert expired.start not in {s.start for s in shards.existing(refresh=True)}
+    assert models.HourRollup.objects.get().count == 1
@@ -0,0 +1,88 @@
+import random
+import uuid
+
+import pytest
+from django.urls import reverse
+from django.utils import timezone
+
+from djapm.apm import models, rollups
+from djapm.apm.sketch import MAX_BINS, RELATIVE_ACCURACY, LatencySketch
+
+
+def _exact(values, q):
+    return sorted(values)[int(q * (len(values) - 1))]
+
+
+@pytest.fixture
+def latencies():
+    rng = random.Random(42)
+    return [rng.lognormvariate(-3, 1.5) for _ in range(50_000)]
+
+
+@pytest.mark.parametrize("q", [0.01, 0.5, 0.9, 0.95, 0.99, 0.999, 1])
+def test_quantiles_are_within_the_relative_accuracy(latencies, q):
+    sketch = LatencySketch()
+    for value in latencies:
+        sketch.add(value)
+
+    exact = _exact(latencies, q)
+    assert abs(sketch.quantile(q) - exact) <= RELATIVE_ACCURACY * exact
+
+
+def test_merged_sketches_match_the_sketch_of_all_values(latencies):
+    whole, parts = LatencySketch(), [LatencySketch() for _ in range(4)]
+    for index, value in enumerate(latencies):
+        whole.add(value)
+        parts[index % 4].add(value)
+
+    merged = LatencySketch()
+    for part in parts:
+        merged.merge(LatencySketch.from_dict(part.to_dict()))
+
+    assert merged.count == whole.count
+    assert merged.quantiles() == whole.quantiles()
+
+
+def test_lowest_bins_are_collapsed(latencies):
+    sketch = LatencySketch()
+    for value in latencies + [1e-5, 1e5]:
+        sketch.add(value)
+
+    assert len(sketch.bins) == MAX_BINS
+    exact = _exact(latencies + [1e-5, 1e5], 0.99)
+    assert abs(sketch.quantile(0.99) - exact) <= RELATIVE_ACCURACY * exact
+
+
+@pytest.mark.django_db
+def test_percentiles_endpoint(settings, admin_client):
+    settings.APM_ROLLUPS = True
+    rollup = rollups.Rollup()
+    for ellapsed in (0.1, 0.2, 0.3, 0.4):
+        rollup.add(ellapsed, False)
+    models.HourRollup.objects.create(
+        bucket=timezone.now().replace(minute=0, second=0, microsecond=0),
+        view_name="polls.drf.get_polls",
+        method="GET",
+        status_class=2,
+        **rollup.as_fields(),
+    )
+
+    response = admin_client.get(reverse("response_view_name_percentiles"))
+
+    datasets = response.json()
+    assert set(datasets) == {"p50", "p90", "p95", "p99"}
+    assert datasets["p50"]["polls.drf.get_polls"] == pytest.approx(0.2, rel=0.01)
+    # The lower of the values around the rank, like `_exact`
+    assert datasets["p99"]["polls.drf.get_polls"] == pytest.approx(0.3, rel=0.01)
+
+
+@pytest.mark.django_db
+def test_percentiles_require_the_rollups(settings, admin_client):
+    settings.APM_ROLLUPS = False
+    request = models.ApiRequest.objects.create(
+        id=uuid.uuid4(), view_name="polls.drf.get_polls", method="GET", path="/"
+    )
+    models.ApiResponse.objects.create(request=request, status_code=200, ellapsed_us=1)
+
+    for url in ("response_view_name_percentiles", "response_percentiles_by_date"):
+        assert admin_client.get(reverse(url)).json() == {}
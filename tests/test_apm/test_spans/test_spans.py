@@ -0,0 +1,52 @@
+import pytest
+from django.contrib.admin.sites import site
+from django.http import HttpResponse
+from django.urls import reverse
+
+from djapm.apm import models
+from djapm.apm.middlewares import ApmMetricsMiddleware
+from djapm.apm.spans import ApmContext
+from polls.views import get_polls
+from tests.types import ApmRequestFactory
+
+
+def test_spans_are_nested_and_capped():
+    context = ApmContext(origin=0, max_spans=3)
+
+    @context.span("decorated")
+    def decorated():
+        pass
+
+    with context.span("outer"):
+        with context.span("inner"):
+            pass
+        decorated()
+        decorated()
+
+    assert [(name, parent) for name, parent, *_ in context.spans] == [
+        ("outer", -1),
+        ("inner", 0),
+        ("decorated", 0),
+    ]
+    assert context.dropped == 1
+    assert all(start <= end for *_, start, end in context.spans)
+
+
+@pytest.mark.django_db
+def test_spans_are_saved_with_the_request(apm_rf: ApmRequestFactory):
+    def get_response(request):
+        with request.apm.span("load"):
+            with request.apm.span("serialize"):
+                return HttpResponse()
+
+    request = apm_rf("GET", reverse("polls-list"), get_polls, drf_req=True)
+    ApmMetricsMiddleware(get_response)(request)
+
+    spans = models.Span.objects.filter(request_id=request.id)
+    assert [(s.index, s.parent, s.name) for s in spans] == [
+        (0, None, "load"),
+        (1, 0, "serialize"),
+    ]
+    model_admin = site._registry[models.ApiRequest]
+    waterfall = model_admin.display_waterfall(models.ApiRequest.objects.get())
+    assert "serialize" in waterfall
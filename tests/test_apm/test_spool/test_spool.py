@@ -0,0 +1,97 @@
+import uuid
+from datetime import timedelta
+
+import pytest
+from django.core.management import call_command
+from django.db import OperationalError
+from django.utils import timezone
+
+from djapm.apm import models, persistence, spool
+
+
+def make_record(request_id: uuid.UUID):
+    now = timezone.now()
+    return [
+        (
+            models.ApiRequest,
+            {"id": request_id, "method": "GET", "path": "/", "requested_at": now},
+        ),
+        (
+            models.ErrorTrace,
+            {
+                "request_id": request_id,
+                "exception_class": "ValueError",
+                "exception_args": "Oops",
+                "traceback": "Traceback",
+            },
+        ),
+        (
+            models.RequestLog,
+            {
+                "trace_id": request_id,
+                "level": "ERROR",
+                "file_path": "views.py",
+                "func_name": "view",
+                "timestamp": now,
+                "message": "Oops",
+            },
+        ),
+    ]
+
+
+def test_spool_entries_are_read_back(tmp_path):
+    records = [make_record(uuid.uuid4()) for _ in range(3)]
+    file_spool = spool.Spool(str(tmp_path))
+    for record in records:
+        file_spool.write(record)
+
+    assert list(spool.read(file_spool.path)) == records
+
+
+def test_truncated_entry_is_ignored(tmp_path):
+    file_spool = spool.Spool(str(tmp_path))
+    record = make_record(uuid.uuid4())
+    file_spool.write(record)
+    file_spool.write(record)
+    data = file_spool.path.read_bytes()
+    file_spool.path.write_bytes(data[:-10])
+
+    assert list(spool.read(file_spool.path)) == [record]
+
+
+@pytest.mark.django_db
+def test_failed_writes_are_spooled_and_replayed_once(settings, tmp_path, monkeypatch):
+    settings.APM_SPOOL_DIR = str(tmp_path)
+    request_id = str(uuid.uuid4())
+
+    def fail(record):
+        raise OperationalError("The database is down")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(persistence, "_save", fail)
+        assert not persistence.save(make_record(request_id))
+    # Spooled twice, as if the worker retried it
+    spool.Spool(str(tmp_path)).write(make_record(request_id))
+    monkeypatch.setattr(persistence, "_degraded_until", 0.0)
+
+    call_command("apm_replay_spool")
+    call_command("apm_replay_spool")
+
+    assert models.ErrorTrace.objects.filter(request_id=request_id).count() == 1
+    assert models.RequestLog.objects.filter(trace_id=request_id).count() == 1
+    assert not list(tmp_path.iterdir())
+
+
+@pytest.mark.django_db
+def test_replayed_error_trace_keeps_its_created_at(settings, tmp_path):
+    settings.APM_SPOOL_DIR = str(tmp_path)
+    request_id = uuid.uuid4()
+    record = make_record(request_id)
+    failed_at = timezone.now() - timedelta(hours=2)
+    record[1][1]["created_at"] = failed_at
+    spool.Spool(str(tmp_path)).write(record)
+
+    call_command("apm_replay_spool")
+
+    trace = models.ErrorTrace.objects.get(request_id=request_id)
+    assert trace.created_at == failed_at
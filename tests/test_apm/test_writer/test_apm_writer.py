@@ -0,0 +1,67 @@
+import threading
+import uuid
+
+import pytest
+from django.utils import timezone
+
+from djapm.apm import models
+from djapm.apm.writer import ApmWriter
+
+
+def make_record(request_id: str):
+    now = timezone.now()
+    return [
+        (
+            models.ApiRequest,
+            {"id": request_id, "method": "GET", "path": "/", "requested_at": now},
+        ),
+        (
+            models.ApiResponse,
+            {"request_id": request_id, "status_code": 200, "created_at": now},
+        ),
+    ]
+
+
+@pytest.mark.django_db
+def test_flush_persists_queued_records_in_batches():
+    writer = ApmWriter(max_size=10, batch_size=2, flush_interval=1)
+    ids = [str(uuid.uuid4()) for _ in range(5)]
+    for request_id in ids:
+        assert writer.put(make_record(request_id))
+
+    assert writer.flush() == 5
+    assert models.ApiRequest.objects.filter(id__in=ids).count() == 5
+    assert models.ApiResponse.objects.filter(request_id__in=ids).count() == 5
+
+
+@pytest.mark.django_db
+def test_flush_ignores_already_persisted_rows():
+    writer = ApmWriter(max_size=10, batch_size=10, flush_interval=1)
+    request_id = str(uuid.uuid4())
+    writer.put(make_record(request_id))
+    writer.put(make_record(request_id))
+
+    writer.flush()
+    assert models.ApiResponse.objects.filter(request_id=request_id).count() == 1
+
+
+def test_put_drops_records_when_the_queue_is_full():
+    writer = ApmWriter(max_size=2, batch_size=10, flush_interval=1)
+    results = [writer.put(make_record(str(uuid.uuid4()))) for _ in range(5)]
+
+    assert results == [True, True, False, False, False]
+    assert writer.dropped == 3
+
+
+def test_the_thread_runs_the_flushers():
+    writer = ApmWriter(max_size=10, batch_size=10, flush_interval=0.01)
+    flushed = threading.Event()
+    writer.add_flusher(flushed.set)
+    writer.add_flusher(flushed.set)
+
+    writer.start()
+    try:
+        assert flushed.wait(timeout=2)
+    finally:
+        writer.stop()
+    assert writer._flushers == [flushed.set]